@@ -0,0 +1 @@
+"""Benchmarks for rinse SOAP library."""
@@ -0,0 +1,43 @@
+"""Run the benchmark suite.
+
+Usage: python -m benchmarks [-k PATTERN] [-o results.json]
+                            [--compare baseline.json [--threshold 0.1]]
+
+Results are written as JSON with -o, and compared with saved results with
+--compare, exiting with status 1 if any benchmark regressed by more than
+the threshold (a fraction, 0.1 = 10% slower).
+"""
+from __future__ import print_function
+import argparse
+import sys
+
+from . import bench_core, bench_wsdl  # noqa: F401 (register benchmarks)
+from .runner import compare, dump, load, run
+
+
+def main(argv=None):
+    """Run benchmarks, returning exit status."""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('-k', dest='pattern', help='regex to select by name')
+    parser.add_argument('-o', '--output', help='write JSON results to file')
+    parser.add_argument('--compare', help='JSON results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = run(args.pattern, args.repeat, args.min_time)
+    if args.output:
+        dump(results, args.output)
+    if args.compare:
+        regressions = compare(load(args.compare), results, args.threshold)
+        for name, before, after, ratio in regressions:
+            print('REGRESSION {}: {:.3f} us -> {:.3f} us ({:.0%} slower)'
+                  .format(name, before * 1e6, after * 1e6, ratio - 1))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Benchmarks of building, serializing, sending and parsing messages."""
+import os.path
+
+import lxml.builder
+import requests
+from lxml import etree
+
+from rinse import RINSE_DIR
+from rinse.client import SoapClient
+from rinse.compression import compress
+from rinse.message import SoapMessage
+from rinse.response import Response
+from rinse.util import ElementMaker
+from rinse.wsa import WsaHeaders, append_wsa_headers
+from rinse.wsdl import WSDL
+from rinse.wsse import WsseHeaders, append_wsse_headers
+
+from .runner import benchmark
+
+NS_BENCH = 'http://example.com/bench'
+SIZES = (10, 100, 1000)
+STOCKQUOTE_WSDL = os.path.join(RINSE_DIR, 'tests', 'res', 'stockquote.wsdl')
+
+
+def make_message(size):
+    """Return a SoapMessage with `size` items in the body."""
+    msg = SoapMessage()
+    bench = msg.elementmaker('b', NS_BENCH)
+    msg.body = bench.items(*[
+        bench.item(bench.id(str(index)), bench.name('item'), version='1')
+        for index in range(size)
+    ])
+    return msg
+
+
+def make_response(size):
+    """Return a requests.Response with content echoing a message body."""
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = make_message(size).tostring(encoding='utf-8')
+    return resp
+
+
+def register_sizes(name, setup):
+    """Register a benchmark for each of SIZES."""
+    for size in SIZES:
+        benchmark('{} ({} items)'.format(name, size))(
+            lambda size=size: setup(size),
+        )
+
+
+register_sizes('SoapMessage.etree', lambda size: make_message(size).etree)
+register_sizes(
+    'SoapMessage.tostring', lambda size: make_message(size).tostring,
+)
+register_sizes(
+    'Response.body (parse)',
+    lambda size: lambda resp=make_response(size): Response(resp).body,
+)
+
+
+def compress_setup(size, encoding, level):
+    """Compress a serialized message, reporting bytes on the wire."""
+    data = make_message(size).tostring(encoding='utf-8')
+
+    def func():
+        """Compress message."""
+        return compress(data, encoding, level)
+    func.info = {
+        'bytes': len(data), 'wire_bytes': len(func()),
+    }
+    return func
+
+
+for encoding, level in [('gzip', 1), ('gzip', 6), ('deflate', 6)]:
+    register_sizes(
+        'compress {} level {}'.format(encoding, level),
+        lambda size, encoding=encoding, level=level: compress_setup(
+            size, encoding, level,
+        ),
+    )
+
+
+@benchmark('ElementMaker element')
+def element_maker():
+    """Make an element with children, converting ints to text."""
+    bench = ElementMaker(namespace=NS_BENCH, nsmap={'b': NS_BENCH})
+    return lambda: bench.item(bench.id(42), bench.name('item'), version='1')
+
+
+def build_body(bench, count=10000):
+    """Build a body of `count` elements."""
+    return bench.items(*[
+        bench.item(bench.id(index), bench.price(index * 0.5), version='1')
+        for index in range(count // 3)
+    ])
+
+
+@benchmark('lxml ElementMaker body (10000 elements)')
+def lxml_element_maker_body():
+    """Build a large body converting values to text by hand (baseline)."""
+    bench = lxml.builder.ElementMaker(
+        namespace=NS_BENCH, nsmap={'b': NS_BENCH},
+    )
+    return lambda: bench.items(*[
+        bench.item(bench.id(str(index)), bench.price(repr(index * 0.5)),
+                   version='1')
+        for index in range(10000 // 3)
+    ])
+
+
+@benchmark('ElementMaker body (10000 elements)')
+def element_maker_body():
+    """Build a large body, with values converted by ElementMaker."""
+    bench = ElementMaker(namespace=NS_BENCH, nsmap={'b': NS_BENCH})
+    return lambda: build_body(bench)
+
+
+@benchmark('append_wsa_headers')
+def wsa_headers():
+    """Add WS-Addressing headers to a new message."""
+    def func():
+        """Add headers."""
+        append_wsa_headers(
+            SoapMessage(), 'http://example.com/to', 'urn:action',
+            message_id='uuid:aaaabbbb-cccc-dddd-eeee-ffffffffffff',
+            reply_to='http://example.com/reply',
+        )
+    return func
+
+
+@benchmark('append_wsse_headers')
+def wsse_headers():
+    """Add WS-Security headers to a new message."""
+    return lambda: append_wsse_headers(SoapMessage(), 'alice', 'secret')
+
+
+@benchmark('WsaHeaders.headers')
+def wsa_header_provider():
+    """Copy WS-Addressing headers from a template with a new MessageID."""
+    provider = WsaHeaders(reply_to='http://example.com/reply')
+    return lambda: provider.headers('http://example.com/to', 'urn:action')
+
+
+@benchmark('WsseHeaders.headers (digest)')
+def wsse_header_provider():
+    """Copy a cached WS-Security digest token."""
+    provider = WsseHeaders('alice', 'secret', digest=True)
+    return lambda: provider.headers('http://example.com/to', 'urn:action')
+
+
+@benchmark('WSDL load (stockquote)')
+def wsdl_load():
+    """Parse a WSDL and index its operations."""
+    return lambda: WSDL.from_file(STOCKQUOTE_WSDL).operations
+
+
+@benchmark('WSDL.is_valid (stockquote)')
+def wsdl_validate():
+    """Validate a message body against a (compiled) WSDL schema."""
+    wsdl = WSDL.from_file(STOCKQUOTE_WSDL)
+    msg = wsdl.operations['GetLastTradePrice'].message(
+        etree.Element('{http://example.com/stockquote.xsd}tickerSymbol'),
+    )
+    wsdl.is_valid(msg)  # compile schema before timing
+    return lambda: wsdl.is_valid(msg)
+
+
+def client_setup(**kwargs):
+    """Post a message to a local server and parse the response."""
+    from rinse.tests import utils  # requires test requirements
+
+    reply = utils.gzip_echo_reply if kwargs else utils.echo_reply
+    context = utils.stub_server(reply, keep_alive=True)
+    server = context.__enter__()
+    client = SoapClient(server.url, **kwargs)
+    msg = make_message(100)
+
+    def func():
+        """Call and parse response body."""
+        return client(msg).body
+    func.close = lambda: context.__exit__(None, None, None)
+    return func
+
+
+benchmark('SoapClient call (100 items, local server)')(client_setup)
+benchmark('SoapClient call gzip (100 items, local server)')(
+    lambda: client_setup(compress='gzip'),
+)
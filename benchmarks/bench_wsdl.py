@@ -0,0 +1,144 @@
+"""Benchmark extracting WSDL schemas for XSD validation.
+
+Compares the serialize and re-parse approach previously used by
+rinse.util.element_as_tree (applied twice, by WSDL.schema and XSDValidator)
+with direct tree extraction, on a generated multi-MB WSDL.  Also compares
+compiling the whole schema with compiling a schema for a single element.
+
+Usage: python -m benchmarks.bench_wsdl [number of types]
+
+The extraction and compilation are also registered with the benchmark suite
+(see benchmarks.runner) for a WSDL of 1000 types.
+"""
+from __future__ import print_function
+import sys
+import timeit
+
+from lxml import etree
+from rinse.util import element_as_tree, safe_parse_string
+from rinse.wsdl import WSDL, NS_MAP
+from rinse.xsd import XSDValidator
+
+from .runner import benchmark
+
+SUITE_TYPES = 1000
+
+WSDL_HEAD = '''<?xml version="1.0"?>
+<wsdl:definitions xmlns:wsdl="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+    xmlns:tns="http://example.com/bench"
+    targetNamespace="http://example.com/bench">
+  <wsdl:types>
+    <xsd:schema targetNamespace="http://example.com/bench"
+        elementFormDefault="qualified">
+'''
+WSDL_TYPE = '''
+      <xsd:complexType name="Type{0}">
+        <xsd:sequence>
+          <xsd:element name="id" type="xsd:int"/>
+          <xsd:element name="name" type="xsd:string"/>
+          <xsd:element name="amount" type="xsd:decimal" minOccurs="0"/>
+          <xsd:element name="created" type="xsd:dateTime" minOccurs="0"/>
+          <xsd:element name="children" type="tns:Type{1}" minOccurs="0"
+              maxOccurs="unbounded"/>
+        </xsd:sequence>
+        <xsd:attribute name="version" type="xsd:int"/>
+      </xsd:complexType>
+      <xsd:element name="Element{0}" type="tns:Type{0}"/>
+'''
+WSDL_TAIL = '''
+    </xsd:schema>
+  </wsdl:types>
+</wsdl:definitions>
+'''
+
+
+def make_wsdl(types):
+    """Generate WSDL (bytes) defining `types` complex types.
+
+    Each type refers to the next, in chains of 10 types.
+    """
+    return (
+        WSDL_HEAD +
+        ''.join(WSDL_TYPE.format(num, num + 1 if num % 10 != 9 else num)
+                for num in range(types)) +
+        WSDL_TAIL
+    ).encode('utf-8')
+
+
+def reparse_as_tree(element):
+    """Previous implementation of rinse.util.element_as_tree."""
+    return safe_parse_string(etree.tostring(etree.ElementTree(element)))
+
+
+def extract_reparse(root):
+    """Extract schema by serializing and parsing twice."""
+    schema_el = root.xpath(
+        '/wsdl:definitions/wsdl:types/xsd:schema', namespaces=NS_MAP,
+    )[0]
+    return reparse_as_tree(reparse_as_tree(schema_el))
+
+
+def extract_direct(root):
+    """Extract schema as WSDL.schema and XSDValidator do."""
+    return element_as_tree(WSDL(root).schema)
+
+
+def main(types=5000, number=5):
+    """Run benchmark, printing results."""
+    raw = make_wsdl(types)
+    root = safe_parse_string(raw)
+    print('WSDL size: {:.1f} MB, {} types'.format(len(raw) / 1e6, types))
+    results = {}
+    for name, func in [
+            ('serialize+parse x2', extract_reparse),
+            ('direct extraction', extract_direct),
+    ]:
+        seconds = min(timeit.repeat(
+            lambda: func(root), number=number, repeat=3,
+        )) / number
+        results[name] = seconds
+        print('{:<20} {:8.2f} ms'.format(name, seconds * 1000))
+    # sanity check - both approaches compile to an equivalent schema
+    etree.XMLSchema(extract_direct(root))
+    print('speedup: {:.1f}x'.format(
+        results['serialize+parse x2'] / results['direct extraction'],
+    ))
+
+    wsdl = WSDL(root)
+    validator = XSDValidator(wsdl.schema, wsdl.schemas)
+    for label, func in [
+            ('compile whole schema', lambda: etree.XMLSchema(wsdl.schema)),
+            # the first element compiled also indexes schema components
+            ('compile 1st element', lambda: validator.element_schema(
+                '{http://example.com/bench}Element0',
+            )),
+            ('compile 2nd element', lambda: validator.element_schema(
+                '{http://example.com/bench}Element10',
+            )),
+    ]:
+        seconds = timeit.timeit(func, number=1)
+        results[label] = seconds
+        print('{:<20} {:8.2f} ms'.format(label, seconds * 1000))
+    return results
+
+
+@benchmark('WSDL schema extraction ({} types)'.format(SUITE_TYPES))
+def suite_extract():
+    """Extract schema from a large WSDL."""
+    root = safe_parse_string(make_wsdl(SUITE_TYPES))
+    return lambda: extract_direct(root)
+
+
+@benchmark('XSD compile element schema ({} types)'.format(SUITE_TYPES))
+def suite_compile_element():
+    """Compile schema for one element of a large WSDL."""
+    wsdl = WSDL(safe_parse_string(make_wsdl(SUITE_TYPES)))
+    schema, schemas = wsdl.schema, wsdl.schemas
+    return lambda: XSDValidator(schema, schemas).element_schema(
+        '{http://example.com/bench}Element0',
+    )
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
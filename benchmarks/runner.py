@@ -0,0 +1,109 @@
+"""Benchmark runner producing machine-readable results.
+
+Benchmarks are registered with `benchmark(name)`, decorating a setup
+function that returns the callable to be timed (so setup isn't timed).
+Each benchmark is run `repeat` times for enough iterations to take at least
+`min_time` seconds, and the fastest run is reported per iteration.  If the
+callable has an `info` dict (e.g. bytes sent), it is added to the results.
+"""
+from __future__ import print_function
+import collections
+import json
+import platform
+import re
+import timeit
+
+import lxml.etree
+import requests
+
+import rinse
+
+BENCHMARKS = collections.OrderedDict()
+
+
+def benchmark(name):
+    """Register a benchmark setup function under `name`."""
+    def register(setup):
+        """Register setup."""
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def environment():
+    """Return versions of Python and libraries benchmarked."""
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'lxml': lxml.etree.__version__,
+        'requests': requests.__version__,
+        'rinse': rinse.__version__,
+    }
+
+
+def measure(func, repeat=5, min_time=0.2):
+    """Return (seconds per call, number of calls per run) for func."""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        seconds = timer.timeit(number)
+        if seconds >= min_time or number >= 10 ** 6:
+            break
+        number *= 10 if seconds < min_time / 10 else 2
+    runs = [seconds] + timer.repeat(repeat - 1, number)
+    return min(runs) / number, number
+
+
+def run(pattern=None, repeat=5, min_time=0.2, verbose=True):
+    """Run benchmarks matching regex `pattern`, returning results dict."""
+    results = collections.OrderedDict()
+    for name, setup in BENCHMARKS.items():
+        if pattern and not re.search(pattern, name):
+            continue
+        func = setup()
+        try:
+            seconds, number = measure(func, repeat, min_time)
+        finally:
+            close = getattr(func, 'close', None)
+            if close is not None:
+                close()
+        results[name] = {'seconds': seconds, 'number': number}
+        info = getattr(func, 'info', {})
+        results[name].update(info)
+        if verbose:
+            print('{:<45} {:12.3f} us {}'.format(name, seconds * 1e6, ' '.join(
+                '{}={}'.format(key, value)
+                for key, value in sorted(info.items())
+            )).rstrip())
+    return {'environment': environment(), 'results': results}
+
+
+def compare(baseline, current, threshold=0.1):
+    """Return list of (name, baseline, current, ratio) regressions.
+
+    A benchmark regressed if it is more than `threshold` (a fraction)
+    slower than in `baseline`.  Benchmarks missing from either are ignored.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        try:
+            before = baseline['results'][name]['seconds']
+        except KeyError:
+            continue
+        ratio = result['seconds'] / before
+        if ratio > 1 + threshold:
+            regressions.append((name, before, result['seconds'], ratio))
+    return regressions
+
+
+def load(path):
+    """Load results from a JSON file."""
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def dump(results, path):
+    """Save results to a JSON file."""
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
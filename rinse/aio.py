@@ -0,0 +1,162 @@
+"""asyncio SOAP client (Python 3 only, requires aiohttp)."""
+import asyncio
+import sys
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from rinse import ENVELOPE_XSD, NS_MAP
+from rinse.capture import WireCapture
+from rinse.response import RinseResponse
+from rinse.util import SCHEMA
+
+# asyncio.get_running_loop() is new in Python 3.7, before which
+# get_event_loop() also returns the running loop within coroutines
+get_running_loop = getattr(
+    asyncio, 'get_running_loop', asyncio.get_event_loop,
+)
+
+
+def client_timeout(timeout):
+    """Map a requests style timeout onto an aiohttp.ClientTimeout.
+
+    As with requests, `timeout` may be None (wait forever), a number of
+    seconds applied to both connecting and reading, or a (connect, read)
+    tuple.
+    """
+    if timeout is None:
+        return aiohttp.ClientTimeout(total=None)
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+    else:
+        connect = read = timeout
+    return aiohttp.ClientTimeout(
+        total=None, sock_connect=connect, sock_read=read,
+    )
+
+
+def requests_response(request, resp, content):
+    """Build a requests.Response from an aiohttp response and its content.
+
+    This allows the same `build_response` callables to be used with both
+    SoapClient and AsyncSoapClient.  The content has already been
+    decompressed by aiohttp, so Content-Encoding (and the Content-Length of
+    the compressed body) are dropped from the headers.
+    """
+    response = requests.Response()
+    response.status_code = resp.status
+    response.reason = resp.reason
+    response.headers = CaseInsensitiveDict(resp.headers)
+    if response.headers.pop('Content-Encoding', None) is not None:
+        response.headers.pop('Content-Length', None)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = str(resp.url)
+    response.request = request
+    response._content = content
+    return response
+
+
+class AsyncSoapClient(object):
+
+    """Rinse SOAP client for use with asyncio.
+
+    Connections are kept alive in a bounded pool (`limit` connections in
+    total, `limit_per_host` per host) shared by all calls made through the
+    client.  Responses are handed to `build_response` in `executor` (the
+    default executor of the event loop if None) so that parsing does not
+    block the event loop.
+    """
+
+    def __init__(self, url, debug=False, limit=100, limit_per_host=10,
+                 keepalive_timeout=15, executor=None, **kwargs):
+        """Set base attributes."""
+        if aiohttp is None:
+            raise ImportError(
+                'AsyncSoapClient requires aiohttp (pip install rinse[async]).',
+            )
+        self.url = url
+        self.debug = debug
+        self.timeout = kwargs.pop('timeout', None)
+        self.namespaces = dict(NS_MAP, **kwargs.pop('namespaces', {}))
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.executor = executor
+        self.kwargs = kwargs
+        self.operations = {}
+        self.soap_schema = SCHEMA[ENVELOPE_XSD]
+        self._session = None
+
+    @property
+    def session(self):
+        """Instance of aiohttp.ClientSession, created on first use."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    keepalive_timeout=self.keepalive_timeout,
+                ),
+            )
+        return self._session
+
+    async def close(self):
+        """Close all pooled connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        """Use client as an async context manager."""
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """Close client on exit from context."""
+        await self.close()
+
+    def build_response(self, resp):
+        """Default build_response, using the client namespace map."""
+        return RinseResponse(resp, self.namespaces)
+
+    async def __call__(self, msg, action="", build_response=None,
+                       debug=False, **kwargs):
+        """Post 'msg' to remote service."""
+        if build_response is None:
+            build_response = self.build_response
+        # generate HTTP request from msg
+        request = msg.request(self.url, action).prepare()
+        capture = exchange = None
+        if debug or self.debug:
+            # write the exchange to stderr, as SoapClient does
+            capture = WireCapture(size=1, echo=sys.stderr)
+            exchange = capture.start(request, action)
+
+        # perform HTTP(s) POST
+        try:
+            async with self.session.request(
+                request.method,
+                request.url,
+                data=request.body,
+                headers=request.headers,
+                timeout=client_timeout(kwargs.get('timeout', self.timeout)),
+            ) as resp:
+                content = await resp.read()
+        except Exception as err:
+            if exchange is not None:
+                capture.failed(exchange, err)
+            raise
+        response = requests_response(request, resp, content)
+        if exchange is not None:
+            capture.response(exchange, response, False)
+
+        # parse response outside of the event loop
+        loop = get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, build_response, response,
+        )
@@ -0,0 +1,408 @@
+"""Rinse SOAP library: bulk calls from JSONL or CSV records.
+
+Usage: python -m rinse.batch INPUT (--template XML | --wsdl WSDL --operation
+                             NAME) [--url URL] [--action ACTION]
+                             [--processes N] [--concurrency N]
+                             [-o results.jsonl] [-e errors.jsonl]
+                             [--checkpoint FILE]
+
+Each record of INPUT (JSON lines or CSV, read as a stream) is made into a
+message using either an XML template with ${name} placeholders (see
+template_message) or the input of a WSDL operation (see
+rinse.codec.Encoder).  Records are sent in chunks to a pool of worker
+processes, which build messages and parse responses on all cores while each
+posts up to `concurrency` messages at once (see SoapClient.map).
+
+Results and errors are written as JSON lines as chunks complete, so they are
+not in input order.  With --checkpoint, records with results are recorded as
+chunks complete so an interrupted run skips them when restarted, while
+records that failed are tried again (results of a chunk may be written twice
+if the run is interrupted before it is recorded).
+"""
+from __future__ import print_function
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os.path
+import re
+import sys
+
+from lxml import etree
+from rinse import NS_SOAPENV
+from rinse.client import SoapClient
+from rinse.codec import Encoder
+from rinse.message import PreparedMessage, SoapMessage
+from rinse.util import safe_parse_path
+from rinse.wsdl import WSDL
+
+FORMATS = ('jsonl', 'csv')
+PLACEHOLDER_RE = re.compile(r'\$\{(\w+)\}')
+
+# Job of the current worker process (see init_worker)
+_JOB = None
+
+
+def read_records(source, format_):
+    """Yield records (dicts) from a text file of JSON lines or CSV."""
+    if format_ == 'csv':
+        for record in csv.DictReader(source):
+            yield record
+        return
+    for line in source:
+        if line.strip():
+            yield json.loads(line)
+
+
+def template_message(path):
+    """Return a PreparedMessage from an XML template file.
+
+    The template is a soapenv:Envelope, or a single element for the body.
+    Each ${name} in text or attribute values is a slot for field `name` of
+    a record.
+    """
+    root = safe_parse_path(path).getroot()
+    msg = SoapMessage()
+
+    def slots(value):
+        """Replace placeholders in value with slot markers."""
+        if value is None:
+            return None
+        return PLACEHOLDER_RE.sub(
+            lambda match: msg.slot(match.group(1)), value,
+        )
+
+    for element in root.iter():
+        element.text = slots(element.text)
+        element.tail = slots(element.tail)
+        for name, value in element.attrib.items():
+            element.set(name, slots(value))
+    if root.tag == '{%s}Envelope' % NS_SOAPENV:
+        header = root.find('{%s}Header' % NS_SOAPENV)
+        if header is not None:
+            msg.headers = list(header)
+        msg.body = list(root.find('{%s}Body' % NS_SOAPENV))
+    else:
+        msg.body = root
+    return PreparedMessage(msg)
+
+
+def body_text(response):
+    """Return children of the response soapenv:Body as XML text."""
+    return u''.join(
+        etree.tostring(child, encoding='unicode') for child in response.body
+    )
+
+
+class Job(object):
+
+    """How to call a service for each record (picklable, for workers).
+
+    Messages are made from the `template` file path, or the input of
+    `operation` (a name) in the `wsdl` (a file path or URL).  The `url` and
+    `action` default to those of the operation, and fields of records that
+    are empty strings (such as empty CSV fields) are omitted.
+    """
+
+    def __init__(self, url=None, template=None, wsdl=None, operation=None,
+                 action=None, timeout=None, concurrency=10):
+        """Job init."""
+        if (template is None) == (operation is None):
+            raise ValueError('Job requires either a template or operation.')
+        if operation is not None and wsdl is None:
+            raise ValueError('Job operation requires a WSDL.')
+        self.url = url
+        self.template = template
+        self.wsdl = wsdl
+        self.operation = operation
+        self.action = action
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self._client = None
+        self._message = None
+
+    def __getstate__(self):
+        """Pickle settings only."""
+        return dict(self.__dict__, _client=None, _message=None)
+
+    def setup(self):
+        """Make the client and message factory (once per worker)."""
+        if self.template is not None:
+            prepared = template_message(self.template)
+            self._message = lambda record: prepared.bind(**record)
+            self._client = SoapClient(self.url, timeout=self.timeout)
+            return
+        if re.match(r'https?://', self.wsdl):
+            wsdl = WSDL.from_url(self.wsdl)
+        else:
+            wsdl = WSDL.from_file(self.wsdl)
+        operation = wsdl.operations[self.operation]
+        encoder = Encoder.from_wsdl(wsdl)
+        self._message = lambda record: encoder.message(operation, {
+            name: value for name, value in record.items()
+            if value != ''  # empty CSV field
+        })
+        if self.action is None:
+            self.action = operation.soap_action
+        self._client = SoapClient(
+            self.url or operation.endpoint, timeout=self.timeout,
+        )
+
+    def __call__(self, chunk):
+        """Call for each (index, record) of chunk.
+
+        Returns a list of (index, result, error) tuples, where either result
+        or error is a dict to write as a JSON line.
+        """
+        if self._client is None:
+            self.setup()
+        outcomes = []
+        messages = []
+        for index, record in chunk:
+            try:
+                messages.append((index, record, self._message(record)))
+            except Exception as err:  # pylint: disable=broad-except
+                outcomes.append((index, None, self.error(index, record, err)))
+        responses = self._client.map(
+            (msg for _, _, msg in messages), self.action or '',
+            concurrency=self.concurrency,
+        )
+        for (index, record, _), response in zip(messages, responses):
+            try:
+                if isinstance(response, Exception):
+                    raise response
+                outcomes.append(self.outcome(index, record, response))
+            except Exception as err:  # pylint: disable=broad-except
+                outcomes.append((index, None, self.error(index, record, err)))
+        return outcomes
+
+    @staticmethod
+    def outcome(index, record, response):
+        """Return (index, result, error) for a response."""
+        body = body_text(response)
+        if response.fault is None and response.status_code < 400:
+            return index, {
+                'index': index, 'status_code': response.status_code,
+                'body': body,
+            }, None
+        return index, None, {
+            'index': index, 'record': record,
+            'status_code': response.status_code,
+            'error': response.fault.findtext('faultstring')
+            if response.fault is not None else 'HTTP error',
+            'body': body,
+        }
+
+    @staticmethod
+    def error(index, record, err):
+        """Return error dict for an exception."""
+        return {
+            'index': index, 'record': record,
+            'error': '{}: {}'.format(type(err).__name__, err),
+        }
+
+
+def init_worker(job):
+    """Set job of the worker process."""
+    global _JOB  # pylint: disable=global-statement
+    _JOB = job
+    job.setup()
+
+
+def run_chunk(chunk):
+    """Run a chunk of records in the worker process."""
+    return _JOB(chunk)
+
+
+def index_runs(indexes):
+    """Yield (start, stop) ranges of consecutive indexes.
+
+    >>> from rinse.batch import index_runs
+    >>> list(index_runs([0, 1, 2, 5, 6, 9]))
+    [(0, 3), (5, 7), (9, 10)]
+    """
+    for _, run in itertools.groupby(
+            enumerate(sorted(indexes)), lambda pair: pair[1] - pair[0],
+    ):
+        run = list(run)
+        yield run[0][1], run[-1][1] + 1
+
+
+class Checkpoint(object):
+
+    """Index ranges of records with results, appended to a file as completed.
+
+    Membership tests (`index in checkpoint`) are against the ranges read
+    when the checkpoint was opened, i.e. those of previous runs.
+    """
+
+    def __init__(self, path):
+        """Load ranges completed by previous runs."""
+        ranges = []
+        if os.path.exists(path):
+            with io.open(path) as previous:
+                for line in previous:
+                    if line.strip():
+                        start, stop = line.split()
+                        ranges.append((int(start), int(stop)))
+        ranges.sort()
+        self._starts = [start for start, _ in ranges]
+        self._stops = [stop for _, stop in ranges]
+        self._file = io.open(path, 'a')
+
+    def __len__(self):
+        """Return number of records completed by previous runs."""
+        return sum(
+            stop - start for start, stop in zip(self._starts, self._stops)
+        )
+
+    def __contains__(self, index):
+        """Return True if record `index` was completed by a previous run."""
+        position = bisect.bisect_right(self._starts, index) - 1
+        return position >= 0 and index < self._stops[position]
+
+    def add(self, indexes):
+        """Record indexes as completed."""
+        for start, stop in index_runs(indexes):
+            self._file.write(u'{} {}\n'.format(start, stop))
+        self._file.flush()
+
+    def close(self):
+        """Close checkpoint file."""
+        self._file.close()
+
+
+def chunked(records, size, checkpoint=None):
+    """Yield lists of up to `size` (index, record) tuples not checkpointed."""
+    records = (
+        (index, record) for index, record in enumerate(records)
+        if checkpoint is None or index not in checkpoint
+    )
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_line(output, value):
+    """Write value as a JSON line."""
+    output.write(json.dumps(value, default=str, sort_keys=True) + u'\n')
+
+
+def run(job, records, results, errors, processes=None, chunk_size=100,
+        checkpoint=None):
+    """Run job for each record, writing JSON lines to results and errors.
+
+    Chunks of `chunk_size` records are run by a pool of `processes` worker
+    processes (default: one per CPU), or in this process if `processes` is
+    0.  Returns a Counter of `results`, `errors` and `skipped` records.
+    Only records with results are added to `checkpoint`, so errors are
+    retried by the next run.
+    """
+    stats = collections.Counter()
+    if checkpoint is not None:
+        stats['skipped'] = len(checkpoint)
+    if processes == 0:
+        executor = concurrent.futures.ThreadPoolExecutor(
+            1, initializer=init_worker, initargs=(job,),
+        )
+        processes = 1
+    else:
+        processes = processes or multiprocessing.cpu_count()
+        executor = concurrent.futures.ProcessPoolExecutor(
+            processes, initializer=init_worker, initargs=(job,),
+        )
+    chunks = chunked(records, chunk_size, checkpoint)
+    with executor:
+        pending = set(
+            executor.submit(run_chunk, chunk)
+            for chunk in itertools.islice(chunks, processes * 2)
+        )
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                outcomes = future.result()
+                for _, result, error in outcomes:
+                    if error is None:
+                        write_line(results, result)
+                        stats['results'] += 1
+                    else:
+                        write_line(errors, error)
+                        stats['errors'] += 1
+                results.flush()
+                errors.flush()
+                if checkpoint is not None:
+                    checkpoint.add(
+                        index for index, _, error in outcomes
+                        if error is None
+                    )
+            for chunk in itertools.islice(chunks, len(done)):
+                pending.add(executor.submit(run_chunk, chunk))
+    return stats
+
+
+def main(argv=None):
+    """Run batch from command line arguments, returning exit status."""
+    parser = argparse.ArgumentParser(prog='python -m rinse.batch')
+    parser.add_argument('input', help="JSONL or CSV records ('-' for stdin)")
+    parser.add_argument('--format', choices=FORMATS,
+                        help='input format (default: from file extension)')
+    parser.add_argument('--template', help='XML template of messages')
+    parser.add_argument('--wsdl', help='WSDL file or URL')
+    parser.add_argument('--operation', help='WSDL operation name')
+    parser.add_argument('--url', help='service URL')
+    parser.add_argument('--action', help='SOAPAction')
+    parser.add_argument('--timeout', type=float)
+    parser.add_argument('--processes', type=int,
+                        help='worker processes (default: CPU count)')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='calls in flight per worker process')
+    parser.add_argument('--chunk-size', type=int, default=100)
+    parser.add_argument('-o', '--output', default='-',
+                        help='results JSONL file (default: stdout)')
+    parser.add_argument('-e', '--errors', default='-',
+                        help='errors JSONL file (default: stderr)')
+    parser.add_argument('--checkpoint', help='checkpoint file to resume')
+    args = parser.parse_args(argv)
+
+    try:
+        job = Job(
+            args.url, args.template, args.wsdl, args.operation, args.action,
+            args.timeout, args.concurrency,
+        )
+    except ValueError as err:
+        parser.error(str(err))
+    format_ = args.format or (
+        'csv' if args.input.lower().endswith('.csv') else 'jsonl'
+    )
+    checkpoint = None
+    if args.checkpoint:
+        checkpoint = Checkpoint(args.checkpoint)
+    mode = 'w' if checkpoint is None else 'a'
+    source = sys.stdin if args.input == '-' else io.open(
+        args.input, newline='' if format_ == 'csv' else None,
+    )
+    results = sys.stdout if args.output == '-' else io.open(args.output, mode)
+    errors = sys.stderr if args.errors == '-' else io.open(args.errors, mode)
+    try:
+        stats = run(
+            job, read_records(source, format_), results, errors,
+            args.processes, args.chunk_size, checkpoint,
+        )
+    finally:
+        for stream in (source, results, errors, checkpoint):
+            if stream not in (None, sys.stdin, sys.stdout, sys.stderr):
+                stream.close()
+    print('{results} results, {errors} errors, {skipped} skipped'.format(
+        results=stats['results'], errors=stats['errors'],
+        skipped=stats['skipped'],
+    ), file=sys.stderr)
+    return 1 if stats['errors'] else 0
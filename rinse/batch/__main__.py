@@ -0,0 +1,7 @@
+"""Run SOAP calls for JSONL or CSV records (see rinse.batch)."""
+import sys
+
+from rinse.batch import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,520 @@
+"""Rinse SOAP library: caches of WSDL documents and SOAP responses."""
+import collections
+import hashlib
+import io
+import json
+import os
+import os.path
+import tempfile
+import threading
+import time
+
+import requests
+from lxml import etree
+
+from rinse.response import SOAPENV_HEADER
+from rinse.util import (
+    cached_property, element_as_tree, safe_parse_path, safe_parse_string,
+)
+from rinse.wsa import NS_WSA
+from rinse.wsdl import WSDL, Operation
+from rinse.wsse import NS_WSSE, NS_WSU
+
+# os.replace() is atomic on all platforms, but only exists on Python 3.3+
+replace = getattr(os, 'replace', os.rename)
+
+# header elements that differ between otherwise identical requests
+VOLATILE_HEADERS = (
+    '{%s}MessageID' % NS_WSA,
+    '{%s}Timestamp' % NS_WSU,
+    '{%s}Created' % NS_WSU,
+    '{%s}Nonce' % NS_WSSE,
+)
+WSSE_PASSWORD = '{%s}Password' % NS_WSSE
+PASSWORD_DIGEST = '#PasswordDigest'
+# response headers not cached, as cached content is decoded
+UNCACHED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+def default_cache_dir():
+    """Return the default cache directory (honours $XDG_CACHE_HOME)."""
+    return os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or
+        os.path.join(os.path.expanduser('~'), '.cache'),
+        'rinse',
+    )
+
+
+def is_url(source):
+    """Return True if source is a URL rather than a file path."""
+    return '://' in source
+
+
+def normalize_source(source):
+    """Return the key of source: the absolute path of files, or the URL."""
+    if is_url(source):
+        return source
+    return os.path.abspath(source)
+
+
+class CachedWSDL(WSDL):
+
+    """WSDL loaded from a DiskCache entry.
+
+    Schemas and operations are loaded from data extracted when the entry was
+    stored, and the WSDL document itself is only parsed if needed.
+    """
+
+    def __init__(self, source, data_path, extracted):
+        """CachedWSDL init."""
+        self.source = source
+        self.data_path = data_path
+        self.__dict__['schemas'] = [
+            safe_parse_string(schema.encode('utf-8'))
+            for schema in extracted['schemas']
+        ]
+        self.__dict__['operations'] = {
+            fields[0]: Operation(*fields)
+            for fields in extracted['operations']
+        }
+
+    @cached_property
+    def root(self):
+        """WSDL document element tree."""
+        return safe_parse_path(self.data_path, base_url=self.source)
+
+
+class DiskCache(object):
+
+    """On-disk cache of WSDL and XSD documents shared between processes.
+
+    Entries are keyed by source (the absolute path of files, or the URL)
+    and hold the content, its SHA-256 digest, validators used to check the
+    source is unchanged (mtime and size for files, ETag and Last-Modified
+    for URLs) and data extracted from the content such as WSDL schema
+    documents and operations.
+
+    The content is stored in a file named after its digest, written before
+    the metadata referring to it, so processes updating an entry at the
+    same time never pair metadata with the wrong content.  Content files of
+    earlier versions are left in place for readers still using them.
+
+    Sources are revalidated on each use unless they were checked less than
+    `max_age` seconds ago, and URLs are fetched with `timeout` (as for
+    requests).  The `stats` counter records cache `hits` (entry reused),
+    `misses` (source changed or not cached) and `revalidations`.
+    """
+
+    def __init__(self, directory=None, max_age=0, session=None, timeout=30):
+        """DiskCache init."""
+        self.directory = directory or default_cache_dir()
+        self.max_age = max_age
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.stats = collections.Counter()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _path(self, source, suffix):
+        """Return path of cache file for source."""
+        key = hashlib.sha256(source.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + suffix)
+
+    def _data_path(self, meta):
+        """Return path of the content file of an entry."""
+        return self._path(meta['source'], '.{}.data'.format(meta['sha256']))
+
+    def _read_meta(self, source):
+        """Return metadata for source, or None if not cached."""
+        try:
+            with open(self._path(source, '.json')) as meta_file:
+                meta = json.load(meta_file)
+        except (IOError, OSError, ValueError):
+            return None
+        if meta.get('source') != source or not meta.get('sha256'):
+            return None
+        if not os.path.exists(self._data_path(meta)):
+            return None
+        return meta
+
+    def _write(self, path, data):
+        """Atomically write data (bytes) to path."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def _write_meta(self, meta):
+        """Store metadata for source."""
+        self._write(
+            self._path(meta['source'], '.json'),
+            json.dumps(meta, sort_keys=True).encode('utf-8'),
+        )
+
+    def _revalidate(self, source, meta):
+        """Return (content, validators) if source changed since cached.
+
+        Returns (None, validators) if the source is unchanged.
+        """
+        if not is_url(source):
+            stat = os.stat(source)
+            validators = {'mtime': stat.st_mtime, 'size': stat.st_size}
+            if meta and all(
+                    meta.get(name) == val for name, val in validators.items()
+            ):
+                return None, validators
+            with open(source, 'rb') as source_file:
+                return source_file.read(), validators
+        headers = {}
+        if meta and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        resp = self.session.get(source, headers=headers, timeout=self.timeout)
+        if resp.status_code == 304 and meta:
+            return None, {
+                'etag': meta.get('etag'),
+                'last_modified': meta.get('last_modified'),
+            }
+        resp.raise_for_status()
+        return resp.content, {
+            'etag': resp.headers.get('ETag'),
+            'last_modified': resp.headers.get('Last-Modified'),
+        }
+
+    def entry(self, source):
+        """Return up to date metadata for source, fetching if required."""
+        source = normalize_source(source)
+        meta = self._read_meta(source)
+        if meta and time.time() - meta['checked'] < self.max_age:
+            self.stats['hits'] += 1
+            return meta
+        content, validators = self._revalidate(source, meta)
+        if meta:
+            self.stats['revalidations'] += 1
+        digest = None
+        if content is not None:
+            digest = hashlib.sha256(content).hexdigest()
+        if meta and (content is None or digest == meta['sha256']):
+            self.stats['hits'] += 1
+        else:
+            self.stats['misses'] += 1
+            meta = {'source': source, 'sha256': digest, 'extracted': {}}
+            self._write(self._data_path(meta), content)
+        meta.update(validators, checked=time.time())
+        self._write_meta(meta)
+        return meta
+
+    def fetch(self, source):
+        """Return content (bytes) of source, using cache where possible."""
+        with open(self._data_path(self.entry(source)), 'rb') as data_file:
+            return data_file.read()
+
+    def wsdl(self, source):
+        """Return a WSDL instance for source, using cache where possible."""
+        meta = self.entry(source)
+        data_path = self._data_path(meta)
+        if 'operations' not in meta['extracted']:
+            wsdl = WSDL(safe_parse_path(data_path, base_url=source))
+            meta['extracted']['schemas'] = [
+                etree.tostring(element_as_tree(schema), encoding='unicode')
+                for schema in wsdl.schemas
+            ]
+            meta['extracted']['operations'] = [
+                list(operation)
+                for _, operation in sorted(wsdl.operations.items())
+            ]
+            self._write_meta(meta)
+            return wsdl
+        return CachedWSDL(source, data_path, meta['extracted'])
+
+
+def canonical_digest(envelope, volatile=VOLATILE_HEADERS):
+    """Return SHA-256 digest of an envelope (bytes) without volatile headers.
+
+    The envelope is canonicalized (C14N) so the digest doesn't depend on
+    attribute order or formatting within tags.  Password digests (which
+    depend on the nonce) are also ignored.
+
+    >>> from rinse.cache import canonical_digest
+    >>> canonical_digest(b'<a y="2" x="1"/>') == canonical_digest(
+    ...     b'<a  x="1" y="2"></a>',
+    ... )
+    True
+    """
+    doc = safe_parse_string(envelope)
+    header = doc.find(SOAPENV_HEADER)
+    if header is not None:
+        for element in [
+                element for element in header.iter()
+                if element.tag in volatile or (
+                    element.tag == WSSE_PASSWORD and
+                    element.get('Type', '').endswith(PASSWORD_DIGEST)
+                )
+        ]:
+            element.getparent().remove(element)
+    return hashlib.sha256(etree.tostring(doc, method='c14n')).hexdigest()
+
+
+def dump_response(resp):
+    """Return a requests.Response as bytes (JSON metadata, then content)."""
+    headers = {
+        name: value for name, value in resp.headers.items()
+        if name.lower() not in UNCACHED_HEADERS
+    }
+    meta = {'status_code': resp.status_code, 'headers': headers,
+            'url': resp.url, 'encoding': resp.encoding}
+    return json.dumps(meta).encode('utf-8') + b'\n' + resp.content
+
+
+def load_response(data):
+    """Return a requests.Response from bytes made by dump_response()."""
+    meta, content = data.split(b'\n', 1)
+    meta = json.loads(meta.decode('utf-8'))
+    resp = requests.Response()
+    resp.status_code = meta['status_code']
+    resp.headers.update(meta['headers'])
+    resp.url = meta['url']
+    resp.encoding = meta['encoding']
+    resp._content = content  # pylint: disable=protected-access
+    resp.raw = io.BytesIO(content)  # for streaming build_response
+    return resp
+
+
+class MemoryBackend(object):
+
+    """In-memory LRU store of cached responses up to `max_bytes` in total."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        """MemoryBackend init."""
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stats = collections.Counter()
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return number of entries."""
+        return len(self._entries)
+
+    def get(self, key):
+        """Return data (bytes) stored under key, or None if not fresh."""
+        with self._lock:
+            try:
+                expires, data = self._entries[key]
+            except KeyError:
+                return None
+            if expires <= time.time():
+                self._remove(key)
+                self.stats['expired'] += 1
+                return None
+            self._entries[key] = self._entries.pop(key)  # most recently used
+            return data
+
+    def set(self, key, data, expires):
+        """Store data (bytes) under key until `expires` (a timestamp)."""
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires, data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    def _remove(self, key):
+        """Remove entry (lock must be held)."""
+        self.size -= len(self._entries.pop(key)[1])
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class DiskBackend(object):
+
+    """On-disk LRU store of cached responses up to `max_bytes` in total.
+
+    Each entry is a file whose mtime is its last use, so entries can be
+    shared between processes.  The total size is counted per process (from
+    the files present when created), so processes sharing a directory may
+    each let it grow to `max_bytes` before evicting.
+    """
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024):
+        """DiskBackend init."""
+        self.directory = directory or os.path.join(
+            default_cache_dir(), 'responses',
+        )
+        self.max_bytes = max_bytes
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.size = sum(size for _, size, _ in self._files())
+
+    def __len__(self):
+        """Return number of entries."""
+        return len(self._files())
+
+    def _path(self, key):
+        """Return path of entry file for key."""
+        return os.path.join(self.directory, key + '.response')
+
+    def _files(self):
+        """Return list of (mtime, size, path) of entry files."""
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.response'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # removed by another process
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def get(self, key):
+        """Return data (bytes) stored under key, or None if not fresh."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as entry_file:
+                expires = float(entry_file.readline())
+                data = entry_file.read()
+        except (IOError, OSError, ValueError):
+            return None
+        if expires <= time.time():
+            self._remove(path)
+            self.stats['expired'] += 1
+            return None
+        try:
+            os.utime(path, None)  # most recently used
+        except OSError:
+            pass
+        return data
+
+    def set(self, key, data, expires):
+        """Store data (bytes) under key until `expires` (a timestamp)."""
+        entry = '{!r}\n'.format(expires).encode('ascii') + data
+        if len(entry) > self.max_bytes:
+            return
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(entry)
+            self._remove(path)
+            replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self.size += len(entry)
+            if self.size <= self.max_bytes:
+                return
+            files = sorted(self._files())
+            self.size = sum(size for _, size, _ in files)
+            for _, _, old_path in files:
+                if self.size <= self.max_bytes:
+                    break
+                removed = self._unlink(old_path)
+                if removed:
+                    self.size -= removed
+                    self.stats['evictions'] += 1
+
+    @staticmethod
+    def _unlink(path):
+        """Remove an entry file, returning its size (0 if missing)."""
+        try:
+            size = os.stat(path).st_size
+            os.unlink(path)
+        except OSError:
+            return 0
+        return size
+
+    def _remove(self, path):
+        """Remove an entry file, counting its size."""
+        removed = self._unlink(path)
+        with self._lock:
+            self.size -= removed
+
+    def clear(self):
+        """Remove all entries."""
+        for _, _, path in self._files():
+            self._remove(path)
+
+
+class ResponseCache(object):
+
+    """Cache of responses to SOAP calls, for opt-in actions only.
+
+    Only calls to actions in `ttls` (a dict mapping SOAPAction to seconds)
+    are cached.  Entries are keyed by URL, action and the canonical digest
+    of the envelope without volatile headers such as wsa:MessageID (see
+    canonical_digest), and are stored by `backend` (a MemoryBackend by
+    default, or a DiskBackend).  Only successful (2xx) responses with an
+    envelope in bytes (not streamed or MTOM) are cached.
+
+    The `stats` counter records `hits` and `misses` (see hit_rate).
+
+    >>> from rinse.cache import ResponseCache
+    >>> cache = ResponseCache({'urn:lookup': 300})
+    >>> cache.key('http://x/', 'urn:delete', b'<a/>') is None
+    True
+    """
+
+    def __init__(self, ttls, backend=None, volatile=VOLATILE_HEADERS):
+        """ResponseCache init."""
+        self.ttls = dict(ttls)
+        self.backend = MemoryBackend() if backend is None else backend
+        self.volatile = volatile
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+
+    def key(self, url, action, body):
+        """Return cache key for a request, or None if not cacheable."""
+        if action not in self.ttls or not isinstance(body, bytes):
+            return None
+        return hashlib.sha256(u'{}\n{}\n{}'.format(
+            url, action, canonical_digest(body, self.volatile),
+        ).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return cached requests.Response for key, or None."""
+        data = self.backend.get(key)
+        with self._lock:
+            self.stats['misses' if data is None else 'hits'] += 1
+        if data is None:
+            return None
+        return load_response(data)
+
+    def put(self, key, action, resp):
+        """Cache a requests.Response for the action TTL if successful.
+
+        Returns True if the response was cached (reading its body).
+        """
+        if not 200 <= resp.status_code < 300:
+            return False
+        self.backend.set(
+            key, dump_response(resp), time.time() + self.ttls[action],
+        )
+        return True
+
+    def hit_rate(self):
+        """Return fraction of lookups that were hits (0 if none)."""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return self.stats['hits'] / float(lookups) if lookups else 0.0
+
+    def clear(self):
+        """Remove all entries."""
+        self.backend.clear()
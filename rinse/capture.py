@@ -0,0 +1,192 @@
+"""Rinse SOAP library: capture of recent HTTP exchanges for debugging."""
+from __future__ import print_function
+import collections
+import datetime
+import random
+import sys
+import threading
+
+from rinse.util import timer
+
+
+class Exchange(object):
+
+    """A captured HTTP request and its response (or error).
+
+    Bodies are raw bytes, or None if they were streamed and not (yet) read.
+    The body of a streamed response is available once it has been parsed
+    (see rinse.response.Response).  `elapsed` is the time from sending the
+    request until the response was received (or the error raised).
+    """
+
+    __slots__ = (
+        'started', 'action', 'method', 'url', 'request_headers',
+        'request_body', 'status_code', 'response_headers', '_response_body',
+        'elapsed', 'error', '_start', '_streamed',
+    )
+
+    fields = (
+        'started', 'action', 'method', 'url', 'request_headers',
+        'request_body', 'status_code', 'response_headers', 'response_body',
+        'elapsed', 'error',
+    )
+
+    def __init__(self, request, action):
+        """Capture request."""
+        self.started = datetime.datetime.now()
+        self.action = action
+        self.method = request.method
+        self.url = request.url
+        self.request_headers = dict(request.headers)
+        self.request_body = request.body \
+            if isinstance(request.body, bytes) else None
+        self.status_code = None
+        self.response_headers = None
+        self._response_body = None
+        self.elapsed = None
+        self.error = None
+        self._start = timer()
+        self._streamed = None
+
+    def response(self, resp, stream):
+        """Capture response."""
+        self.elapsed = timer() - self._start
+        self.status_code = resp.status_code
+        self.response_headers = dict(resp.headers)
+        if stream:
+            self._streamed = resp  # body is read later, if at all
+        else:
+            self._response_body = resp.content
+
+    @property
+    def response_body(self):
+        """Response body (bytes), or None if streamed and not read."""
+        if self._response_body is None and self._streamed is not None:
+            # pylint: disable=protected-access
+            if self._streamed._content not in (False, None):
+                self._response_body = self._streamed._content
+                self._streamed = None
+        return self._response_body
+
+    def failed(self, error):
+        """Capture error raised sending request or building response."""
+        if self.elapsed is None:
+            self.elapsed = timer() - self._start
+        self.error = error
+
+    def as_dict(self):
+        """Return exchange as a dict."""
+        return {name: getattr(self, name) for name in self.fields}
+
+    def format(self):
+        """Return exchange as text, in the style of HTTP messages."""
+        lines = ['{} {} {} ({})'.format(
+            self.started.isoformat(), self.method, self.url, self.action,
+        )]
+        lines.extend(
+            '{}: {}'.format(name, val)
+            for name, val in sorted(self.request_headers.items())
+        )
+        lines.extend(['', body_text(self.request_body), ''])
+        if self.status_code is not None:
+            lines.append('{} ({:.3f} ms)'.format(
+                self.status_code, self.elapsed * 1000,
+            ))
+            lines.extend(
+                '{}: {}'.format(name, val)
+                for name, val in sorted(self.response_headers.items())
+            )
+            lines.extend(['', body_text(self.response_body), ''])
+        if self.error is not None:
+            lines.append('Error: {!r}'.format(self.error))
+        return '\n'.join(lines)
+
+
+def write_exchange(exchange, output):
+    """Write exchange as text to output, followed by a blank line."""
+    print(exchange.format(), file=output)
+    print('', file=output)
+
+
+def body_text(body):
+    """Return body (bytes) as text."""
+    if body is None:
+        return '<streamed body>'
+    return body.decode('utf-8', 'replace')
+
+
+class WireCapture(object):
+
+    """Ring buffer of the last `size` HTTP exchanges of a SoapClient.
+
+    Set `sample` (a fraction) to capture only some exchanges.  If `on_error`
+    is a file-like object, the buffer is dumped to it whenever a call fails
+    or the response status is `error_status` or above.  If `echo` is a
+    file-like object, each exchange is written to it as it completes (see
+    the `debug` argument of SoapClient).
+
+    >>> from rinse.client import SoapClient
+    >>> from rinse.capture import WireCapture
+    >>> client = SoapClient('http://example.com', capture=WireCapture(10))
+    >>> len(client.capture)
+    0
+    """
+
+    def __init__(self, size=100, sample=1.0, on_error=None, error_status=500,
+                 echo=None):
+        """WireCapture init."""
+        self.exchanges = collections.deque(maxlen=size)
+        self.sample = sample
+        self.on_error = on_error
+        self.error_status = error_status
+        self.echo = echo
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return number of exchanges captured."""
+        return len(self.exchanges)
+
+    def __iter__(self):
+        """Iterate over a snapshot of exchanges, oldest first."""
+        with self._lock:
+            return iter(list(self.exchanges))
+
+    def start(self, request, action):
+        """Return an Exchange capturing request, or None if not sampled."""
+        if self.sample < 1 and random.random() >= self.sample:
+            return None
+        exchange = Exchange(request, action)
+        with self._lock:
+            self.exchanges.append(exchange)
+        return exchange
+
+    def response(self, exchange, resp, stream):
+        """Capture response of exchange."""
+        exchange.response(resp, stream)
+        if self.echo is not None:
+            write_exchange(exchange, self.echo)
+        if resp.status_code >= self.error_status:
+            self.error()
+
+    def failed(self, exchange, error):
+        """Capture error of exchange."""
+        exchange.failed(error)
+        if self.echo is not None:
+            write_exchange(exchange, self.echo)
+        self.error()
+
+    def error(self):
+        """Dump exchanges to `on_error` (if set)."""
+        if self.on_error is not None:
+            self.dump(self.on_error)
+
+    def dump(self, output=None):
+        """Write exchanges (oldest first) to output (default sys.stderr)."""
+        output = output or sys.stderr
+        for exchange in self:
+            write_exchange(exchange, output)
+
+    def clear(self):
+        """Forget captured exchanges."""
+        with self._lock:
+            self.exchanges.clear()
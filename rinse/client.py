@@ -1,45 +1,550 @@
 """SOAP client."""
-from __future__ import print_function
+import collections
+import concurrent.futures
+import copy
+import inspect
+import io
+import itertools
+import math
+import sys
+import threading
+
 import requests
-from rinse import ENVELOPE_XSD
-from rinse.util import SCHEMA, cached_property
+from rinse import ENVELOPE_XSD, NS_MAP
+from rinse.capture import WireCapture
+from rinse.compression import ACCEPT_ENCODING, WBITS, compress_request
+from rinse.metrics import PhaseTimer
+from rinse.pool import PoolAdapter
+from rinse.util import SCHEMA, cached_property, timer
 from rinse.response import RinseResponse
 
 
+# whether request() of each message type takes `phases` (see accepts_phases)
+_ACCEPTS_PHASES = {}
+
+
+def accepts_phases(msg):
+    """Return True if msg.request() takes a `phases` argument.
+
+    >>> from rinse.client import accepts_phases
+    >>> from rinse.message import SoapMessage
+    >>> accepts_phases(SoapMessage()), accepts_phases(object())
+    (True, False)
+    """
+    cls = type(msg)
+    try:
+        return _ACCEPTS_PHASES[cls]
+    except KeyError:
+        pass
+    try:
+        params = inspect.signature(msg.request).parameters
+    except (AttributeError, TypeError, ValueError):
+        accepts = False
+    else:
+        accepts = 'phases' in params or any(
+            param.kind == param.VAR_KEYWORD for param in params.values()
+        )
+    _ACCEPTS_PHASES[cls] = accepts
+    return accepts
+
+
+class LatencyStats(object):
+
+    """Latencies of recent calls by action, for percentiles.
+
+    Only the last `window` latencies (in seconds) of each action are kept.
+
+    >>> from rinse.client import LatencyStats
+    >>> latency = LatencyStats()
+    >>> for ms in range(1, 101):
+    ...     latency.record('action', ms / 1000.0)
+    >>> latency.percentile('action', 50), latency.percentile('action', 99)
+    (0.05, 0.099)
+    >>> latency.percentile('other', 50) is None
+    True
+    """
+
+    def __init__(self, window=1000):
+        """LatencyStats init."""
+        self.window = window
+        self._latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=window),
+        )
+        self._lock = threading.Lock()
+
+    def record(self, action, seconds):
+        """Record latency of a call."""
+        with self._lock:
+            self._latencies[action].append(seconds)
+
+    def count(self, action):
+        """Return number of latencies recorded (up to window) for action."""
+        return len(self._latencies.get(action, ()))
+
+    def percentile(self, action, percent, min_samples=1):
+        """Return latency percentile (nearest rank), or None if too few."""
+        with self._lock:
+            latencies = sorted(self._latencies.get(action, ()))
+        if len(latencies) < max(min_samples, 1):
+            return None
+        rank = int(math.ceil(percent / 100.0 * len(latencies)))
+        return latencies[max(rank, 1) - 1]
+
+
+class Hedge(object):
+
+    """Hedging policy for an idempotent action (see SoapClient `hedges`).
+
+    A duplicate request is sent if there is no response after `delay`
+    seconds, or once the call takes longer than the `percentile` of recent
+    latencies for the action when there are at least `min_samples` of them.
+    """
+
+    def __init__(self, delay=None, percentile=None, min_samples=20):
+        """Hedge init."""
+        if delay is None and percentile is None:
+            raise ValueError('Hedge requires a delay or a percentile.')
+        self.delay = delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+
+    def delay_for(self, latency, action):
+        """Return seconds to wait before hedging, or None to never hedge."""
+        if self.percentile is not None:
+            seconds = latency.percentile(
+                action, self.percentile, self.min_samples,
+            )
+            if seconds is not None:
+                return seconds
+        return self.delay
+
+
+def start_thread(func):
+    """Call func on a new daemon thread, returning a Future of its result."""
+    future = concurrent.futures.Future()
+
+    def run():
+        """Set result of future."""
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = func()
+        except BaseException as err:  # pylint: disable=broad-except
+            future.set_exception(err)
+        else:
+            future.set_result(result)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return future
+
+
+def close_response(future):
+    """Close response of a future that lost a hedged call."""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class BoundOperation(object):
+
+    """WSDL operation bound to a SoapClient.
+
+    Calling a bound operation makes a message for the operation (see
+    rinse.wsdl.Operation.message) and posts it with the operation SOAPAction
+    to the operation endpoint, unless the client was given a `url`.  A
+    SoapMessage may be given instead of body children.
+    """
+
+    def __init__(self, client, operation):
+        """Set base attributes."""
+        self.client = client
+        self.operation = operation
+
+    def __call__(self, *children, **kwargs):
+        """Post message for operation to remote service."""
+        if len(children) == 1 and hasattr(children[0], 'request'):
+            msg = children[0]
+        else:
+            msg = self.operation.message(*children)
+        if not self.client.url_override:
+            kwargs.setdefault('url', self.operation.endpoint)
+        return self.client(msg, self.operation.soap_action, **kwargs)
+
+
 class SoapClient(object):
 
-    """Rinse SOAP client."""
+    """Rinse SOAP client.
+
+    If a WSDL is given, `operations` maps operation names to BoundOperation
+    instances posting to the endpoint of each operation, and `url` defaults
+    to the endpoint of the first operation (by name).  A `url` given with a
+    WSDL overrides the endpoints of all operations.
+
+    The `namespaces` map (prefix to URI, in addition to rinse.NS_MAP) is used
+    for queries on responses (see rinse.response.Response).
+
+    Calls to actions in `hedges` (a dict mapping idempotent actions to Hedge
+    policies) send a duplicate request if the first is slow, using whichever
+    response comes first and closing the other.  First attempts are sent by
+    a pool of `hedge_workers` threads (32 by default) and duplicates by their
+    own thread.  Latencies of hedged actions are recorded in `latency` (a
+    LatencyStats), and `stats` counts `hedges` sent and `hedges_won` (calls
+    answered by the duplicate request).
+
+    Connections are pooled per host, keeping up to `pool_maxsize` connections
+    for each of `pool_connections` hosts.  If `pool_block` is True calls wait
+    for a free connection rather than making extra connections.  Set
+    `keep_alive` to False to close connections after each call.  Activity of
+    the pools is counted in `pool_stats` (see rinse.pool.PoolStats).
+
+    If `validate` is True, messages are validated against the WSDL schema
+    before they are sent.
 
-    def __init__(self, url, debug=False, **kwargs):
+    Each of `observers` (a list of callables, see rinse.metrics.Histogram) is
+    passed a rinse.metrics.Timing for each phase of each call: `validate`,
+    `build` and `serialize` (the envelope), `prepare` (the HTTP request),
+    `send` (until the response, or its headers for a streamed response) and
+    `parse` (by `build_response`, or on first access to the envelope of a
+    default Response).  Calls aren't timed when there are no observers.
+
+    If `compress` is 'gzip' or 'deflate', request bodies of at least
+    `compress_threshold` bytes are compressed (see rinse.compression) and
+    compressed responses are accepted.  Responses are then streamed, so the
+    default Response decompresses the body as it is parsed.
+
+    If `response_cache` is a rinse.cache.ResponseCache, calls to the actions
+    it caches are answered from the cache when an identical request (apart
+    from volatile headers) was answered recently.
+
+    Each of `header_providers` (such as rinse.wsa.WsaHeaders or
+    rinse.wsse.WsseHeaders) adds SOAP headers to each message, built from
+    templates so only fields that change (MessageID, Timestamp, Nonce and so
+    on) are made for each call.  The message passed in isn't modified.
+    Headers are spliced into the XML of bound PreparedMessages.
+
+    If `capture` is a rinse.capture.WireCapture, recent HTTP exchanges are
+    kept for debugging.  Setting `debug` (here or for a single call) writes
+    each exchange to stderr as it completes, using a WireCapture which
+    replaces `capture` unless it already has an `echo` output.
+    """
+
+    def __init__(self, url=None, debug=False, **kwargs):
         """Set base attributes."""
+        self.wsdl = kwargs.pop('wsdl', None)
+        self.operations = {}
+        self.url_override = url is not None
+        if self.wsdl is not None:
+            self.operations = {
+                name: BoundOperation(self, operation)
+                for name, operation
+                in self.wsdl.operations.items()
+            }
+            if url is None and self.operations:
+                url = self.wsdl.operations[min(self.operations)].endpoint
         self.url = url
         self.debug = debug
         self.timeout = kwargs.pop('timeout', None)
+        self.namespaces = dict(NS_MAP, **kwargs.pop('namespaces', {}))
+        self.hedges = kwargs.pop('hedges', {})
+        self.hedge_workers = kwargs.pop('hedge_workers', 32)
+        self.latency = LatencyStats()
+        self.stats = collections.Counter()
+        self._stats_lock = threading.Lock()
+        self.pool_connections = kwargs.pop('pool_connections', 10)
+        self.pool_maxsize = kwargs.pop('pool_maxsize', 10)
+        self.pool_block = kwargs.pop('pool_block', False)
+        self.keep_alive = kwargs.pop('keep_alive', True)
+        self.validate = kwargs.pop('validate', False)
+        if self.validate and self.wsdl is None:
+            raise ValueError('validate requires a WSDL.')
+        self.observers = list(kwargs.pop('observers', []))
+        self.capture = kwargs.pop('capture', None)
+        self.compress = kwargs.pop('compress', None)
+        if self.compress is not None and self.compress not in WBITS:
+            raise ValueError(
+                'Unsupported compress {!r}.'.format(self.compress),
+            )
+        self.compress_threshold = kwargs.pop('compress_threshold', 1024)
+        self.response_cache = kwargs.pop('response_cache', None)
+        self.header_providers = list(kwargs.pop('header_providers', []))
         self.kwargs = kwargs
-        self.operations = {}
         self.soap_schema = SCHEMA[ENVELOPE_XSD]
 
     @cached_property
     def _session(self):
         """Cached instance of requests.Session."""
-        return requests.Session()
+        session = requests.Session()
+        adapter = PoolAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def pool_stats(self):
+        """Connection pool statistics (a rinse.pool.PoolStats)."""
+        return self._session.get_adapter('http://').stats
+
+    @cached_property
+    def _local(self):
+        """Thread local storage for per-thread sessions."""
+        return threading.local()
+
+    def _thread_session(self):
+        """Return a requests.Session for use by the current thread.
+
+        A requests.Session isn't thread-safe, so each thread gets a shallow
+        copy of the client session sharing its configuration and transport
+        adapters (and hence connection pools).
+        """
+        try:
+            return self._local.session
+        except AttributeError:
+            session = self._local.session = copy.copy(self._session)
+            return session
+
+    @cached_property
+    def _hedge_executor(self):
+        """Thread pool sending first attempts of hedged calls."""
+        return concurrent.futures.ThreadPoolExecutor(self.hedge_workers)
 
-    def __call__(self, msg, action="", build_response=RinseResponse,
+    def close(self):
+        """Close pooled connections and stop the hedging thread pool."""
+        if '_hedge_executor' in self.__dict__:
+            self._hedge_executor.shutdown()
+            del self._hedge_executor
+        if '_session' in self.__dict__:
+            self._session.close()
+
+    def build_response(self, resp, phases=None):
+        """Default build_response, using the client namespace map."""
+        return RinseResponse(resp, self.namespaces, phases)
+
+    def __call__(self, msg, action="", build_response=None,
                  debug=False, **kwargs):
-        """Post 'msg' to remote service."""
+        """Post 'msg' to remote service (at `url` if given, else self.url)."""
+        return self._call(
+            self._session, msg, action, build_response, debug, **kwargs
+        )
+
+    def add_headers(self, msg, action, url=None):
+        """Return a copy of msg with headers from the header providers."""
+        if not hasattr(msg, 'headers'):
+            raise ValueError(
+                'Header providers require SOAP headers, not {}.'.format(
+                    type(msg).__name__,
+                ),
+            )
+        msg = copy.copy(msg)
+        msg.headers = list(msg.headers)
+        for provider in self.header_providers:
+            msg.headers.extend(provider.headers(url or self.url, action))
+        return msg
+
+    def _call(self, session, msg, action, build_response, debug, **kwargs):
+        """Post 'msg' to remote service using 'session'."""
+        url = kwargs.pop('url', None) or self.url
+        phases = None
+        if self.observers:
+            phases = PhaseTimer(self.observers, action, url)
+        if self.header_providers:
+            msg = self.add_headers(msg, action, url)
+        if self.validate:
+            if phases is None:
+                self.wsdl.validate(msg)
+            else:
+                with phases('validate'):
+                    self.wsdl.validate(msg)
+
         # generate HTTP request from msg
-        request = msg.request(self.url, action).prepare()
-        if debug or self.debug:
-            print('{} {}'.format(request.method, self.url))
-            print(
-                ''.join(
-                    '{}: {}\n'.format(name, val)
-                    for name, val
-                    in sorted(request.headers.items())
-                )
+        if phases is None:
+            request = msg.request(url, action).prepare()
+        else:
+            if accepts_phases(msg):
+                request = msg.request(url, action, phases=phases)
+            else:
+                with phases('build'):
+                    request = msg.request(url, action)
+            with phases('prepare'):
+                request = request.prepare()
+        if not self.keep_alive:
+            request.headers['Connection'] = 'close'
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self.response_cache.key(url, action, request.body)
+        if cache_key is not None:
+            resp = self.response_cache.get(cache_key)
+            if resp is not None:
+                if build_response is not None:
+                    return build_response(resp)
+                return self.build_response(resp, phases)
+        if self.compress is not None:
+            compress_request(request, self.compress, self.compress_threshold)
+            request.headers['Accept-Encoding'] = ACCEPT_ENCODING
+
+        capture = self.capture
+        if (debug or self.debug) and getattr(capture, 'echo', None) is None:
+            capture = WireCapture(size=1, echo=sys.stderr)
+        if capture is None:
+            return self._exchange(
+                session, request, action, build_response, phases,
+                cache_key=cache_key, **kwargs
             )
-            print(request.body.decode('utf-8'))
+        exchange = capture.start(request, action)
+        try:
+            return self._exchange(
+                session, request, action, build_response, phases, capture,
+                exchange, cache_key, **kwargs
+            )
+        except Exception as err:
+            if exchange is not None:
+                capture.failed(exchange, err)
+            raise
 
+    def _exchange(self, session, request, action, build_response, phases,
+                  capture=None, exchange=None, cache_key=None, **kwargs):
+        """Send prepared request, caching and building the response."""
         # perform HTTP(s) POST
-        resp = self._session.send(request, timeout=kwargs.get('timeout', self.timeout))
-        return build_response(resp)
+        stream = getattr(build_response, 'stream', False)
+        if build_response is None and self.compress is not None:
+            stream = True  # decompress straight into the parser
+        timeout = kwargs.get('timeout', self.timeout)
+        hedge = self.hedges.get(action)
+        start = timer()
+        if hedge is not None and isinstance(request.body, bytes):
+            # streamed bodies (generators) can't be sent twice
+            resp = self._hedged_send(request, action, timeout, hedge)
+            if not stream:
+                resp.content  # pylint: disable=pointless-statement
+        else:
+            resp = self._send(session, request, action, timeout, stream)
+        if exchange is not None:
+            capture.response(exchange, resp, stream)
+        if cache_key is not None:
+            if self.response_cache.put(cache_key, action, resp) and stream:
+                resp.raw = io.BytesIO(resp.content)  # body read to be cached
+        if phases is None:
+            return (build_response or self.build_response)(resp)
+        phases.record('send', start)
+        if build_response is None:
+            return self.build_response(resp, phases)  # times lazy parsing
+        with phases('parse'):
+            return build_response(resp)
+
+    def _count(self, name):
+        """Increment stats[name] (from any thread)."""
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _send(self, session, request, action, timeout, stream):
+        """Send request, recording latency of hedged actions."""
+        if action not in self.hedges:
+            return session.send(request, timeout=timeout, stream=stream)
+        start = timer()
+        resp = session.send(request, timeout=timeout, stream=stream)
+        self.latency.record(action, timer() - start)
+        return resp
+
+    def _hedged_send(self, request, action, timeout, hedge):
+        """Send request, and a duplicate if there's no response in time.
+
+        Responses are streamed so the one that loses can be closed without
+        reading its body.  Requests still waiting for a response can't be
+        interrupted, their responses are closed as they arrive.
+
+        The first attempt is sent from the hedging thread pool, and the hedge
+        delay starts once it is sent so time spent queued behind other calls
+        (such as those of map()) doesn't count.  Only the duplicate gets a
+        thread of its own.
+        """
+        started = threading.Event()
+
+        def attempt():
+            """Send a copy of request from a worker thread."""
+            started.set()
+            return self._send(
+                self._thread_session(), request.copy(), action, timeout,
+                True,
+            )
+
+        futures = [self._hedge_executor.submit(attempt)]
+        started.wait()
+        done, _ = concurrent.futures.wait(
+            futures, timeout=hedge.delay_for(self.latency, action),
+        )
+        if not done:
+            self._count('hedges')
+            futures.append(start_thread(attempt))
+        winner = None
+        pending = futures
+        while pending and winner is None:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                if winner is None and future.exception() is None:
+                    winner = future
+        for future in futures:
+            if future is not winner:
+                future.cancel()
+                future.add_done_callback(close_response)
+        if winner is None:
+            return futures[0].result()  # raises exception of first attempt
+        if winner is not futures[0]:
+            self._count('hedges_won')
+        return winner.result()
+
+    def map(self, messages, action="", concurrency=10, ordered=True,
+            build_response=None, debug=False, **kwargs):
+        """Post each of 'messages' to remote service using a thread pool.
+
+        At most `concurrency` requests are in flight at once, all sharing the
+        connection pools of the client session.  The `messages` iterable is
+        consumed lazily, so it may be a generator of any length.
+
+        Results are yielded in the same order as `messages`, or if `ordered`
+        is False as (index, result) tuples as each request completes.  Any
+        exception raised for a message is yielded in place of its result
+        rather than aborting the batch.
+        """
+        def call(msg):
+            """Post msg from worker thread, returning exceptions as values."""
+            try:
+                return self._call(
+                    self._thread_session(), msg, action, build_response,
+                    debug, **kwargs
+                )
+            except Exception as err:  # pylint: disable=broad-except
+                return err
+
+        messages = iter(messages)
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+            if ordered:
+                # keep the workers busy while waiting on the oldest request
+                pending = collections.deque(
+                    executor.submit(call, msg)
+                    for msg in itertools.islice(messages, concurrency * 2)
+                )
+                while pending:
+                    result = pending.popleft().result()
+                    for msg in itertools.islice(messages, 1):
+                        pending.append(executor.submit(call, msg))
+                    yield result
+            else:
+                pending = {}
+                for index, msg in enumerate(messages):
+                    pending[executor.submit(call, msg)] = index
+                    if len(pending) < concurrency:
+                        continue
+                    done, _ = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                    for future in done:
+                        yield pending.pop(future), future.result()
+                for future in concurrent.futures.as_completed(pending):
+                    yield pending[future], future.result()
@@ -0,0 +1,994 @@
+"""Rinse SOAP library: conversion between XML and Python using XSD types."""
+import base64
+import binascii
+import collections
+import copy
+import datetime
+import decimal
+import keyword
+import re
+import threading
+
+from lxml import etree
+from rinse.message import SoapMessage
+from rinse.util import (
+    lexical, parse_boolean, parse_float, resolve_qname,
+)
+from rinse.xsd import NS_XSD, SchemaComponents
+
+NS_XSI = 'http://www.w3.org/2001/XMLSchema-instance'
+XSI_NIL = '{%s}nil' % NS_XSI
+XSI_TYPE = '{%s}type' % NS_XSI
+
+text_type = type(u'')
+
+DATETIME_RE = re.compile(
+    r'^(-?\d{4,})-(\d\d)-(\d\d)(?:T(\d\d):(\d\d):(\d\d)(?:\.(\d+))?)?'
+    r'(Z|[+-]\d\d:\d\d)?$'
+)
+TIME_RE = re.compile(
+    r'^(\d\d):(\d\d):(\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)?$'
+)
+
+
+class FixedOffset(datetime.tzinfo):
+
+    """Fixed offset timezone (datetime.timezone is Python 3 only)."""
+
+    def __init__(self, minutes):
+        """FixedOffset init."""
+        self.offset = datetime.timedelta(minutes=minutes)
+
+    def utcoffset(self, dt):
+        """Offset from UTC."""
+        return self.offset
+
+    def dst(self, dt):
+        """No daylight saving time."""
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        """Name of timezone."""
+        return None
+
+    def __repr__(self):
+        """Represent as a call to constructor."""
+        return 'FixedOffset({})'.format(
+            int(self.offset.total_seconds()) // 60,
+        )
+
+
+def parse_tz(text):
+    """Parse timezone suffix of XSD date/time values."""
+    if not text:
+        return None
+    minutes = 0 if text == 'Z' else \
+        int(text[1:3]) * 60 + int(text[4:6])
+    if text[0] == '-':
+        minutes = -minutes
+    timezone = getattr(datetime, 'timezone', None)
+    if timezone is None:
+        return FixedOffset(minutes)
+    return timezone(datetime.timedelta(minutes=minutes))
+
+
+def parse_micro(text):
+    """Parse fractional seconds as microseconds."""
+    return int((text or '0')[:6].ljust(6, '0'))
+
+
+def parse_datetime(text):
+    """Parse xsd:dateTime."""
+    match = DATETIME_RE.match(text.strip())
+    if match is None or match.group(4) is None:
+        raise ValueError('Invalid xsd:dateTime {!r}.'.format(text))
+    year, month, day, hour, minute, second, micro, tz = match.groups()
+    return datetime.datetime(
+        int(year), int(month), int(day), int(hour), int(minute), int(second),
+        parse_micro(micro), parse_tz(tz),
+    )
+
+
+def parse_date(text):
+    """Parse xsd:date (any timezone is ignored)."""
+    match = DATETIME_RE.match(text.strip())
+    if match is None or match.group(4) is not None:
+        raise ValueError('Invalid xsd:date {!r}.'.format(text))
+    year, month, day = match.groups()[:3]
+    return datetime.date(int(year), int(month), int(day))
+
+
+def parse_time(text):
+    """Parse xsd:time."""
+    match = TIME_RE.match(text.strip())
+    if match is None:
+        raise ValueError('Invalid xsd:time {!r}.'.format(text))
+    hour, minute, second, micro, tz = match.groups()
+    return datetime.time(
+        int(hour), int(minute), int(second), parse_micro(micro), parse_tz(tz),
+    )
+
+
+def parse_base64(text):
+    """Parse xsd:base64Binary."""
+    return base64.b64decode(text.encode('ascii'))
+
+
+def parse_hex(text):
+    """Parse xsd:hexBinary."""
+    return binascii.unhexlify(text.strip().encode('ascii'))
+
+
+def parse_text(text):
+    """Parse xsd:string and other types with text values."""
+    return text
+
+
+BUILTIN_PARSERS = {
+    'boolean': parse_boolean,
+    'decimal': lambda text: decimal.Decimal(text.strip()),
+    'float': parse_float,
+    'double': parse_float,
+    'dateTime': parse_datetime,
+    'date': parse_date,
+    'time': parse_time,
+    'base64Binary': parse_base64,
+    'hexBinary': parse_hex,
+}
+BUILTIN_PARSERS.update(
+    (name, int)
+    for name in [
+        'integer', 'long', 'int', 'short', 'byte',
+        'nonNegativeInteger', 'positiveInteger',
+        'nonPositiveInteger', 'negativeInteger',
+        'unsignedLong', 'unsignedInt', 'unsignedShort', 'unsignedByte',
+    ]
+)
+
+
+def python_name(name, taken=()):
+    """Return a valid (and unused) Python identifier for an XML name."""
+    name = re.sub(r'\W', '_', name)
+    if keyword.iskeyword(name) or name[:1].isdigit():
+        name += '_'
+    while name in taken:
+        name += '_'
+    return name
+
+
+class Record(object):
+
+    """Base class for records of XML Schema complex types.
+
+    Subclasses are generated for each complex type, with a slot for each
+    element or attribute.  Fields of repeated elements default to an empty
+    list, others to None.
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _repeated = frozenset()
+
+    def __init__(self, **kwargs):
+        """Set fields from keyword arguments, or to their defaults."""
+        for name in self._fields:
+            setattr(self, name, [] if name in self._repeated else None)
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    def _asdict(self):
+        """Return an OrderedDict of field values."""
+        return collections.OrderedDict(
+            (name, getattr(self, name)) for name in self._fields
+        )
+
+    def __eq__(self, other):
+        """Records are equal if they are the same type with equal fields."""
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name)
+            for name in self._fields
+        )
+
+    def __ne__(self, other):
+        """Inverse of __eq__."""
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        """Represent record as a call to its constructor."""
+        return '{}({})'.format(
+            type(self).__name__,
+            ', '.join(
+                '{}={!r}'.format(name, getattr(self, name))
+                for name in self._fields
+            ),
+        )
+
+
+class SimpleType(object):
+
+    """Compiled XML Schema simple type."""
+
+    __slots__ = ('name', 'parse', 'builtin', 'item_type')
+
+    def __init__(self, name, parse, builtin, item_type=None):
+        """Set base attributes."""
+        self.name = name
+        self.parse = parse
+        # local name of the built-in type this type is derived from
+        self.builtin = builtin
+        # SimpleType of list items (for list types)
+        self.item_type = item_type
+
+
+class Field(object):
+
+    """Element or attribute of a compiled complex type."""
+
+    __slots__ = (
+        'name', 'qname', 'type', 'attribute', 'repeated', 'optional',
+        'nillable',
+    )
+
+    def __init__(self, name, qname, type_, attribute=False, repeated=False,
+                 optional=False, nillable=False):
+        """Set base attributes."""
+        self.name = name
+        self.qname = qname
+        self.type = type_
+        self.attribute = attribute
+        self.repeated = repeated
+        self.optional = optional
+        self.nillable = nillable
+
+
+class ComplexType(object):
+
+    """Compiled XML Schema complex type.
+
+    Elements are in `fields` in the order required by the content model,
+    attributes in `attributes`.  The `content` is the SimpleType of the
+    text content for complex types with simple content.
+    """
+
+    __slots__ = (
+        'name', 'record', 'fields', 'attributes', 'content', 'children',
+        'attributes_by_qname',
+    )
+
+    def __init__(self, name):
+        """Set base attributes."""
+        self.name = name
+        self.record = None
+        self.fields = []
+        self.attributes = []
+        self.content = None
+        self.children = {}
+        self.attributes_by_qname = {}
+
+    def finish(self):
+        """Generate record class and indexes once fields are complete."""
+        names = []
+        for field in self.fields + self.attributes:
+            field.name = python_name(field.name, names)
+            names.append(field.name)
+        if self.content is not None:
+            names.append(python_name('value', names))
+        self.record = type(
+            str(python_name(self.name)),
+            (Record,),
+            {
+                '__slots__': tuple(names),
+                '_fields': tuple(names),
+                '_repeated': frozenset(
+                    field.name for field in self.fields if field.repeated
+                ),
+            },
+        )
+        self.children = {field.qname: field for field in self.fields}
+        self.attributes_by_qname = {
+            field.qname: field for field in self.attributes
+        }
+
+
+ANY_TYPE = SimpleType('anyType', parse_text, 'anyType')
+
+
+class CompileCache(object):
+
+    """Cache of compiled components, read without locking.
+
+    Components are compiled under a lock and only published to `compiled`
+    once the outermost compilation finishes, as recursive types are
+    incomplete until then.  Meanwhile the compiling thread finds them in
+    `pending`, where compile functions add components before compiling
+    their parts.
+
+    >>> from rinse.codec import CompileCache
+    >>> cache = CompileCache()
+    >>> def compile_(key):
+    ...     cache.pending[key] = component = [key]
+    ...     if key == 'a':
+    ...         component.append(cache.get('b', compile_))
+    ...         component.append('b' in cache.compiled)
+    ...     return component
+    >>> cache.get('a', compile_)
+    ['a', ['b'], False]
+    >>> sorted(cache.compiled), cache.pending
+    (['a', 'b'], {})
+    """
+
+    def __init__(self):
+        """CompileCache init."""
+        self.compiled = {}
+        self.pending = {}
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    def get(self, key, compile_):
+        """Return component for key, compiled by `compile_(key)` if need be."""
+        try:
+            return self.compiled[key]
+        except KeyError:
+            pass
+        with self._lock:
+            try:
+                return self.compiled[key]  # compiled by another thread
+            except KeyError:
+                pass
+            try:
+                return self.pending[key]  # recursive reference
+            except KeyError:
+                pass
+            self._depth += 1
+            try:
+                component = self.pending[key] = compile_(key)
+            finally:
+                self._depth -= 1
+                if not self._depth:
+                    pending, self.pending = self.pending, {}
+            if not self._depth:
+                self.compiled.update(pending)
+            return component
+
+
+class SchemaTypes(object):
+
+    """XML Schema types compiled from xsd:schema elements.
+
+    Types are compiled on demand and cached, so each type is compiled only
+    once however often it is used.
+    """
+
+    def __init__(self, schemas):
+        """Index global components of schemas by namespace."""
+        self.components = {}
+        for schema in schemas:
+            self.components.setdefault(
+                schema.get('targetNamespace'), SchemaComponents(schema),
+            )
+        # compiled types and elements keyed by ('type' or 'element', qname)
+        self._cache = CompileCache()
+
+    @classmethod
+    def from_wsdl(cls, wsdl):
+        """Make a SchemaTypes instance for the schemas of a WSDL."""
+        return cls(wsdl.schemas)
+
+    def lookup(self, space, qname):
+        """Return (SchemaComponents, element) for a global component."""
+        qname = etree.QName(qname)
+        try:
+            components = self.components[qname.namespace]
+            return components, components.components[space, qname][1]
+        except KeyError:
+            raise KeyError('No {} {!r} in schema.'.format(space, qname.text))
+
+    def element(self, qname):
+        """Return Field for global element `qname`."""
+        return self._cache.get(
+            ('element', etree.QName(qname).text), self._compile_global,
+        )
+
+    def type(self, qname):
+        """Return SimpleType or ComplexType for global type `qname`."""
+        return self._cache.get(
+            ('type', etree.QName(qname).text), self._compile_global,
+        )
+
+    def _compile_global(self, key):
+        """Compile global element or type (see CompileCache.get)."""
+        space, qname = key
+        if space == 'element':
+            components, decl = self.lookup('element', qname)
+            return self._element_field(decl, components, qname=qname)
+        qname = etree.QName(qname)
+        if qname.namespace == NS_XSD:
+            if qname.localname == 'anyType':
+                return ANY_TYPE
+            return SimpleType(
+                qname.localname,
+                BUILTIN_PARSERS.get(qname.localname, parse_text),
+                qname.localname,
+            )
+        components, decl = self.lookup('type', qname)
+        return self._compile_type(decl, components, qname)
+
+    def _compile_type(self, decl, components, qname=None, name=None):
+        """Compile a type declaration."""
+        if etree.QName(decl).localname == 'simpleType':
+            return self._compile_simple(decl, name or qname.localname)
+        ctype = ComplexType(name or qname.localname)
+        if qname is not None:
+            # register before compiling fields, as types may be recursive
+            self._cache.pending['type', qname.text] = ctype
+        self._compile_complex(decl, components, ctype)
+        ctype.finish()
+        return ctype
+
+    def _compile_simple(self, decl, name):
+        """Compile xsd:simpleType declaration."""
+        for child in decl.iterchildren(etree.Element):
+            localname = etree.QName(child).localname
+            if localname == 'restriction':
+                base = self._type_of(child, 'base', None)
+                return SimpleType(
+                    name, base.parse, base.builtin, base.item_type,
+                )
+            if localname == 'list':
+                item_type = self._type_of(child, 'itemType', None)
+
+                def parse_list(text, parse=item_type.parse):
+                    """Parse xsd:list value."""
+                    return [parse(item) for item in text.split()]
+                return SimpleType(name, parse_list, 'list', item_type)
+        # union (or something unexpected)
+        return SimpleType(name, parse_text, 'string')
+
+    def _type_of(self, decl, attr, components, name=None):
+        """Return type named by attr of decl, or its anonymous type."""
+        value = decl.get(attr)
+        if value is not None:
+            return self.type(resolve_qname(decl, value))
+        for child in decl.iterchildren(etree.Element):
+            if etree.QName(child).localname in ('simpleType', 'complexType'):
+                return self._compile_type(
+                    child, components, name=name or decl.get('name'),
+                )
+        return ANY_TYPE
+
+    def _element_field(self, decl, components, qname=None, repeated=False,
+                       optional=False):
+        """Return Field for an xsd:element declaration."""
+        if decl.get('ref') is not None:
+            field = self.element(resolve_qname(decl, decl.get('ref')))
+            return Field(
+                field.name, field.qname, field.type,
+                repeated=repeated, optional=optional, nillable=field.nillable,
+            )
+        name = decl.get('name')
+        if qname is None:
+            form = decl.get('form') or \
+                components.schema.get('elementFormDefault', 'unqualified')
+            qname = etree.QName(
+                components.namespace if form == 'qualified' else None, name,
+            ).text
+        return Field(
+            name, qname, self._type_of(decl, 'type', components),
+            repeated=repeated, optional=optional,
+            nillable=decl.get('nillable') in ('true', '1'),
+        )
+
+    def _attribute_field(self, decl, components):
+        """Return Field for an xsd:attribute declaration."""
+        if decl.get('ref') is not None:
+            qname = resolve_qname(decl, decl.get('ref'))
+            ref_components, ref_decl = self.lookup('attribute', qname)
+            field = self._attribute_field(ref_decl, ref_components)
+            field.qname = qname.text
+            field.optional = decl.get('use') != 'required'
+            return field
+        name = decl.get('name')
+        form = decl.get('form') or \
+            components.schema.get('attributeFormDefault', 'unqualified')
+        return Field(
+            name,
+            etree.QName(
+                components.namespace if form == 'qualified' else None, name,
+            ).text,
+            self._type_of(decl, 'type', components),
+            attribute=True,
+            optional=decl.get('use') != 'required',
+        )
+
+    def _compile_particles(self, particles, components, ctype, repeated,
+                           optional):
+        """Add fields for particles (elements and model groups) to ctype."""
+        for child in particles:
+            localname = etree.QName(child).localname
+            child_repeated = repeated or \
+                child.get('maxOccurs', '1') not in ('0', '1')
+            child_optional = optional or child.get('minOccurs') == '0' or \
+                localname == 'choice'
+            if localname == 'element':
+                ctype.fields.append(self._element_field(
+                    child, components,
+                    repeated=child_repeated, optional=child_optional,
+                ))
+            elif localname in ('sequence', 'choice', 'all'):
+                self._compile_particles(
+                    child.iterchildren(etree.Element), components, ctype,
+                    child_repeated, child_optional,
+                )
+            elif localname == 'group':
+                group_components, group = self.lookup(
+                    'group', resolve_qname(child, child.get('ref')),
+                )
+                self._compile_particles(
+                    group.iterchildren(etree.Element), group_components,
+                    ctype, child_repeated, child_optional,
+                )
+
+    def _compile_attributes(self, decl, components, ctype):
+        """Add attributes declared by decl to ctype.
+
+        Attributes restated by a restriction replace those inherited from
+        the base type (or remove them if prohibited).
+        """
+        for child in decl.iterchildren(etree.Element):
+            localname = etree.QName(child).localname
+            if localname == 'attribute':
+                field = self._attribute_field(child, components)
+                ctype.attributes = [
+                    other for other in ctype.attributes
+                    if other.qname != field.qname
+                ]
+                if child.get('use') != 'prohibited':
+                    ctype.attributes.append(field)
+            elif localname == 'attributeGroup':
+                group_components, group = self.lookup(
+                    'attributeGroup', resolve_qname(child, child.get('ref')),
+                )
+                self._compile_attributes(group, group_components, ctype)
+
+    def _compile_complex(self, decl, components, ctype):
+        """Compile xsd:complexType declaration into ctype."""
+        for child in decl.iterchildren(etree.Element):
+            localname = etree.QName(child).localname
+            if localname in ('sequence', 'choice', 'all', 'group'):
+                self._compile_particles(
+                    [child], components, ctype, False, False,
+                )
+            elif localname in ('complexContent', 'simpleContent'):
+                for derivation in child.iterchildren(etree.Element):
+                    if etree.QName(derivation).localname not in (
+                            'extension', 'restriction',
+                    ):
+                        continue
+                    base = self.type(
+                        resolve_qname(derivation, derivation.get('base')),
+                    )
+                    if isinstance(base, ComplexType):
+                        if etree.QName(derivation).localname == 'extension':
+                            ctype.fields.extend(
+                                copy.copy(field) for field in base.fields
+                            )
+                        ctype.attributes.extend(
+                            copy.copy(field) for field in base.attributes
+                        )
+                        ctype.content = base.content
+                    elif localname == 'simpleContent':
+                        ctype.content = base
+                    self._compile_complex(derivation, components, ctype)
+        self._compile_attributes(decl, components, ctype)
+
+
+class Decoder(object):
+
+    """Decode XML elements to Python values using XML Schema types.
+
+    Simple types decode to Python types (int, Decimal, float, bool,
+    datetime, date, time, bytes, lists for xsd:list and text otherwise) and
+    complex types to Record instances, with lists for repeated elements.
+    Elements with an xsi:type attribute naming a type in the schemas (such
+    as a type derived from the declared one) are decoded as that type.
+
+    >>> import os.path
+    >>> from lxml import etree
+    >>> from rinse import RINSE_DIR
+    >>> from rinse.codec import Decoder
+    >>> from rinse.wsdl import WSDL
+    >>> wsdl = WSDL.from_file(
+    ...     os.path.join(RINSE_DIR, 'tests', 'res', 'stockquote.wsdl'),
+    ... )
+    >>> decoder = Decoder.from_wsdl(wsdl)
+    >>> decoder.decode(etree.fromstring(
+    ...     '<TradePrice xmlns="http://example.com/stockquote.xsd">'
+    ...     '<price>12.50</price><volume>100</volume>'
+    ...     '</TradePrice>'
+    ... ))
+    TradePrice(price=Decimal('12.50'), volume=100)
+    """
+
+    def __init__(self, types):
+        """Decoder init (`types` is a SchemaTypes instance)."""
+        self.types = types
+        self._decoders = CompileCache()
+
+    @classmethod
+    def from_wsdl(cls, wsdl):
+        """Make a Decoder for the schemas of a WSDL."""
+        return cls(SchemaTypes.from_wsdl(wsdl))
+
+    def decode(self, element):
+        """Decode element, which must be declared as a global element."""
+        decode = self.decoder(self.types.element(element.tag).type)
+        if element.get(XSI_TYPE) is not None:
+            decode = self._xsi_decoder(element, decode)
+        return decode(element)
+
+    def decoder(self, type_):
+        """Return function decoding elements of compiled type `type_`."""
+        return self._decoders.get(type_, self._compile_decoder)
+
+    def _xsi_decoder(self, element, default):
+        """Return decoder for the xsi:type of element, or `default`.
+
+        Types not found in the schemas are decoded as the declared type.
+        """
+        try:
+            type_ = self.types.type(
+                resolve_qname(element, element.get(XSI_TYPE)),
+            )
+        except KeyError:
+            return default
+        return self.decoder(type_)
+
+    def _compile_decoder(self, type_):
+        """Compile decoder (see CompileCache.get)."""
+        if isinstance(type_, SimpleType):
+            return self._simple_decoder(type_)
+        return self._complex_decoder(type_)
+
+    @staticmethod
+    def _simple_decoder(simple):
+        """Return function decoding elements of a simple type."""
+        parse = simple.parse
+
+        def decode_simple(element):
+            """Decode element with simple content."""
+            if element.get(XSI_NIL) in ('true', '1'):
+                return None
+            return parse(element.text or '')
+
+        if simple is ANY_TYPE:
+            def decode_any(element):
+                """Decode element of unknown type."""
+                if len(element):
+                    return element
+                return decode_simple(element)
+            return decode_any
+        return decode_simple
+
+    def _complex_decoder(self, ctype):
+        """Return function decoding elements of a complex type."""
+        record = ctype.record
+        children = {}
+        attributes = dict(
+            (field.qname, (field.name, field.type.parse))
+            for field in ctype.attributes
+        )
+        content = ctype.content and ctype.content.parse
+        content_name = content and record._fields[-1]
+        xsi_decoder = self._xsi_decoder
+
+        def decode_complex(element):
+            """Decode element with complex content."""
+            if element.get(XSI_NIL) in ('true', '1'):
+                return None
+            obj = record()
+            for child in element.iterchildren(etree.Element):
+                try:
+                    name, repeated, decode = children[child.tag]
+                except KeyError:
+                    continue  # unexpected element
+                if child.get(XSI_TYPE) is not None:
+                    decode = xsi_decoder(child, decode)
+                if repeated:
+                    getattr(obj, name).append(decode(child))
+                else:
+                    setattr(obj, name, decode(child))
+            for qname, value in element.items():
+                try:
+                    name, parse = attributes[qname]
+                except KeyError:
+                    continue  # unexpected attribute
+                setattr(obj, name, parse(value))
+            if content is not None:
+                setattr(obj, content_name, content(element.text or ''))
+            return obj
+
+        # register before compiling children, as types may be recursive
+        self._decoders.pending[ctype] = decode_complex
+        for field in ctype.fields:
+            children[field.qname] = (
+                field.name, field.repeated, self.decoder(field.type),
+            )
+        return decode_complex
+
+
+def format_datetime(value):
+    """Format xsd:dateTime, taking dates to be at midnight.
+
+    >>> import datetime
+    >>> from rinse.codec import format_datetime
+    >>> format_datetime(datetime.date(2015, 1, 2))
+    '2015-01-02T00:00:00'
+    """
+    if not isinstance(value, datetime.date):
+        raise ValueError('Not a date or datetime: {!r}.'.format(value))
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    return value.isoformat()
+
+
+def format_date(value):
+    """Format xsd:date, dropping the time of datetimes."""
+    if not isinstance(value, datetime.date):
+        raise ValueError('Not a date: {!r}.'.format(value))
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return value.isoformat()
+
+
+def format_time(value):
+    """Format xsd:time."""
+    if not isinstance(value, datetime.time):
+        raise ValueError('Not a time: {!r}.'.format(value))
+    return value.isoformat()
+
+
+def format_float(value):
+    """Format xsd:float and xsd:double."""
+    return lexical(float(value))
+
+
+def format_text(value):
+    """Format xsd:string and other types with text values."""
+    if isinstance(value, text_type):
+        return value
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return text_type(lexical(value))
+
+
+def format_integer(value):
+    """Format xsd:integer and its derived types, refusing fractions.
+
+    >>> from rinse.codec import format_integer
+    >>> format_integer(7.0)
+    '7'
+    >>> format_integer(7.9)
+    Traceback (most recent call last):
+    ...
+    ValueError: Not an integer: 7.9.
+    """
+    if value != int(value):
+        raise ValueError('Not an integer: {!r}.'.format(value))
+    return '%d' % value
+
+
+BUILTIN_FORMATTERS = {
+    'boolean': lambda value: 'true' if value else 'false',
+    'decimal': lambda value: '{:f}'.format(decimal.Decimal(value)),
+    'float': format_float,
+    'double': format_float,
+    'dateTime': format_datetime,
+    'date': format_date,
+    'time': format_time,
+    'base64Binary': lambda value: base64.b64encode(value).decode('ascii'),
+    'hexBinary': lambda value: binascii.hexlify(value).decode('ascii'),
+}
+BUILTIN_FORMATTERS.update(
+    (name, format_integer)
+    for name, parse in BUILTIN_PARSERS.items()
+    if parse is int
+)
+
+
+def formatter(simple):
+    """Return function formatting values of a SimpleType as text.
+
+    Text values are taken to be in lexical form already (as read from CSV).
+
+    >>> from rinse.codec import SimpleType, formatter
+    >>> format_boolean = formatter(SimpleType('boolean', bool, 'boolean'))
+    >>> format_boolean(False), format_boolean(u'false')
+    ('false', 'false')
+    """
+    if simple.builtin == 'list':
+        format_item = formatter(simple.item_type)
+
+        def format_list(value):
+            """Format items separated by spaces."""
+            if isinstance(value, text_type):
+                return value
+            return ' '.join(format_item(item) for item in value)
+        return format_list
+    format_value = BUILTIN_FORMATTERS.get(simple.builtin)
+    if format_value is None:
+        return format_text
+
+    def format_lexical(value):
+        """Format value unless it is text."""
+        if isinstance(value, text_type):
+            return value
+        return format_value(value)
+    return format_lexical
+
+
+class Encoder(object):
+
+    """Encode Python values as XML elements using XML Schema types.
+
+    Complex type values may be dicts (keyed by field name, as for Record
+    fields) or objects with those attributes such as Record instances.
+    Elements are built in the order of the content model; repeated elements
+    take iterables of values (or a single text value, as read from CSV).
+    None values are omitted for optional elements and encoded as xsi:nil
+    elements for other nillable elements.
+
+    >>> import datetime
+    >>> import os.path
+    >>> import lxml.usedoctest
+    >>> from rinse import RINSE_DIR
+    >>> from rinse.codec import Encoder
+    >>> from rinse.util import printxml
+    >>> from rinse.wsdl import WSDL
+    >>> wsdl = WSDL.from_file(
+    ...     os.path.join(RINSE_DIR, 'tests', 'res', 'stockquote.wsdl'),
+    ... )
+    >>> encoder = Encoder.from_wsdl(wsdl)
+    >>> printxml(encoder.encode(
+    ...     '{http://example.com/stockquote.xsd}TradeHistoryRequest',
+    ...     {
+    ...         'tickerSymbol': ['ACME', 'INIT'],
+    ...         'since': datetime.datetime(2015, 1, 2, 10, 30),
+    ...         'adjusted': True,
+    ...     },
+    ... ))
+    <tns:TradeHistoryRequest xmlns:tns="http://example.com/stockquote.xsd" adjusted="true">
+      <tns:tickerSymbol>ACME</tns:tickerSymbol>
+      <tns:tickerSymbol>INIT</tns:tickerSymbol>
+      <tns:since>2015-01-02T10:30:00</tns:since>
+    </tns:TradeHistoryRequest>
+    """
+
+    def __init__(self, types):
+        """Encoder init (`types` is a SchemaTypes instance)."""
+        self.types = types
+        self._encoders = CompileCache()
+
+    @classmethod
+    def from_wsdl(cls, wsdl):
+        """Make an Encoder for the schemas of a WSDL."""
+        return cls(SchemaTypes.from_wsdl(wsdl))
+
+    def encode(self, qname, value):
+        """Return element `qname` (a global element) encoding value."""
+        field = self.types.element(qname)
+        namespace = etree.QName(field.qname).namespace
+        root = etree.Element(
+            field.qname, nsmap={'tns': namespace} if namespace else None,
+        )
+        if value is None and field.nillable:
+            root.set(XSI_NIL, 'true')
+        else:
+            self.encoder(field.type)(root, value)
+        return root
+
+    def message(self, operation, value):
+        """Make a SoapMessage with body encoding value for operation input."""
+        return SoapMessage(self.encode(operation.input, value))
+
+    def encoder(self, type_):
+        """Return function encoding values into elements of type `type_`."""
+        return self._encoders.get(type_, self._compile_encoder)
+
+    def _compile_encoder(self, type_):
+        """Compile encoder (see CompileCache.get)."""
+        if isinstance(type_, SimpleType):
+            return self._simple_encoder(type_)
+        return self._complex_encoder(type_)
+
+    @staticmethod
+    def _simple_encoder(simple):
+        """Return function setting text of elements of a simple type."""
+        format_value = formatter(simple)
+
+        def encode_simple(element, value):
+            """Set element text to lexical form of value."""
+            element.text = format_value(value)
+
+        if simple is ANY_TYPE:
+            def encode_any(element, value):
+                """Append elements, otherwise set text."""
+                if etree.iselement(value):
+                    element.append(value)
+                else:
+                    element.text = format_text(value)
+            return encode_any
+        return encode_simple
+
+    def _complex_encoder(self, ctype):
+        """Return function building elements of a complex type."""
+        children = []
+        attributes = [
+            (field.name, field.qname, field.optional, formatter(field.type))
+            for field in ctype.attributes
+        ]
+        content = ctype.content and formatter(ctype.content)
+        content_name = content and ctype.record._fields[-1]
+        names = frozenset(ctype.record._fields)
+        sub_element = etree.SubElement
+
+        def encode_complex(element, value):
+            """Add children and attributes encoding value to element."""
+            if isinstance(value, dict):
+                unknown = set(value).difference(names)
+                if unknown:
+                    raise ValueError('Unknown fields for {}: {}.'.format(
+                        ctype.name, ', '.join(sorted(unknown)),
+                    ))
+                get = value.get
+            else:
+                def get(name):
+                    """Return attribute of value."""
+                    return getattr(value, name, None)
+            for name, qname, optional, format_value in attributes:
+                attr = get(name)
+                if attr is not None:
+                    element.set(qname, format_value(attr))
+                elif not optional:
+                    raise ValueError('Missing value for @{}.'.format(qname))
+            for name, qname, repeated, optional, nillable, encode in children:
+                child = get(name)
+                if repeated:
+                    if isinstance(child, (text_type, bytes)):
+                        child = (child,)  # a single value, not characters
+                    for item in child or ():
+                        if item is not None:
+                            encode(sub_element(element, qname), item)
+                        elif nillable:
+                            sub_element(element, qname, {XSI_NIL: 'true'})
+                        else:
+                            raise ValueError(
+                                'Missing value in {}.'.format(qname),
+                            )
+                    if child or optional:
+                        continue
+                    raise ValueError('Missing values for {}.'.format(qname))
+                if child is not None:
+                    encode(sub_element(element, qname), child)
+                elif optional:
+                    continue
+                elif nillable:
+                    sub_element(element, qname, {XSI_NIL: 'true'})
+                else:
+                    raise ValueError('Missing value for {}.'.format(qname))
+            if content is not None:
+                text = get(content_name)
+                if text is not None:
+                    element.text = content(text)
+
+        # register before compiling children, as types may be recursive
+        self._encoders.pending[ctype] = encode_complex
+        children.extend(
+            (
+                field.name, field.qname, field.repeated, field.optional,
+                field.nillable, self.encoder(field.type),
+            )
+            for field in ctype.fields
+        )
+        return encode_complex
@@ -0,0 +1,65 @@
+"""Rinse SOAP library: HTTP compression of SOAP messages."""
+import zlib
+
+# zlib wbits for each Content-Encoding (gzip adds a gzip header and trailer)
+WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
+def compressor(encoding, level=6):
+    """Return a zlib compression object for Content-Encoding `encoding`."""
+    try:
+        wbits = WBITS[encoding]
+    except KeyError:
+        raise ValueError('Unsupported encoding {!r}.'.format(encoding))
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+def compress(data, encoding='gzip', level=6):
+    """Return data (bytes) compressed using Content-Encoding `encoding`.
+
+    >>> import zlib
+    >>> from rinse.compression import compress
+    >>> data = b'<soapenv:Envelope/>' * 100
+    >>> len(compress(data)) < len(data) // 10
+    True
+    >>> zlib.decompress(compress(data), 16 + zlib.MAX_WBITS) == data
+    True
+    """
+    obj = compressor(encoding, level)
+    return obj.compress(data) + obj.flush()
+
+
+def compress_chunks(chunks, encoding='gzip', level=6):
+    """Yield chunks (bytes) compressed using Content-Encoding `encoding`."""
+    obj = compressor(encoding, level)
+    for chunk in chunks:
+        data = obj.compress(chunk)
+        if data:
+            yield data
+    yield obj.flush()
+
+
+def compress_request(request, encoding='gzip', threshold=1024, level=6):
+    """Compress body of a requests.PreparedRequest in place.
+
+    Bodies of at least `threshold` bytes are compressed, as are streamed
+    bodies (of unknown size).  Sets the Content-Encoding header of
+    compressed requests.
+    """
+    body = request.body
+    if body is None:
+        return request
+    if isinstance(body, bytes):
+        if len(body) < threshold:
+            return request
+        request.body = compress(body, encoding, level)
+        request.headers['Content-Length'] = str(len(request.body))
+    else:
+        request.body = compress_chunks(body, encoding, level)
+        request.headers.pop('Content-Length', None)  # send chunked instead
+    request.headers['Content-Encoding'] = encoding
+    return request
@@ -1,9 +1,54 @@
 """SOAP client."""
 from __future__ import print_function
+import re
+from xml.sax.saxutils import escape
+
 from lxml import etree
 import requests
 from rinse import NS_SOAPENV
-from rinse.util import ElementMaker
+from rinse.mtom import Attachment, MultipartBody
+from rinse.util import (
+    LEXICAL_PARSERS, ElementMaker, lexical, safe_parse_string,
+)
+
+# slot markers use Unicode private use characters to delimit the slot name
+SLOT_MARKER = u'\ue000{}\ue001'
+SLOT_RE = re.compile(SLOT_MARKER.format('(.*?)').encode('utf-8'))
+ESCAPE_ENTITIES = {'"': '&quot;'}
+# serialized soapenv:Header end tags (see insert_headers)
+HEADER_END = b'</soapenv:Header>'
+EMPTY_HEADER = b'<soapenv:Header/>'
+
+
+class ChunkList(list):
+
+    """File-like sink collecting chunks written by lxml.etree.xmlfile."""
+
+    write = list.append
+
+
+def insert_headers(data, headers):
+    """Return serialized SOAP envelope `data` with header elements added.
+
+    >>> from rinse.message import insert_headers
+    >>> from lxml import etree
+    >>> print(insert_headers(
+    ...     b'<soapenv:Envelope xmlns:soapenv="urn:env"><soapenv:Header/>'
+    ...     b'<soapenv:Body/></soapenv:Envelope>',
+    ...     [etree.Element('h')],
+    ... ).decode('utf-8'))
+    <soapenv:Envelope xmlns:soapenv="urn:env"><soapenv:Header><h/></soapenv:Header><soapenv:Body/></soapenv:Envelope>
+    """
+    extra = b''.join(etree.tostring(header) for header in headers)
+    body = data.index(b'<soapenv:Body')
+    end = data.rfind(EMPTY_HEADER, 0, body)
+    if end != -1:
+        return b''.join([
+            data[:end], b'<soapenv:Header>', extra, HEADER_END,
+            data[end + len(EMPTY_HEADER):],
+        ])
+    end = data.rindex(HEADER_END, 0, body)
+    return data[:end] + extra + data[end:]
 
 
 class SoapMessage(object):
@@ -26,16 +71,23 @@ class SoapMessage(object):
 
     elementmaker_cls = ElementMaker
 
+    # send body with chunked transfer encoding (see iterxml)
+    stream = False
+
     def __init__(self, body=None):
         """Set base attributes."""
         # XML namespace map
         self._nsmap = {}
         # cache of lxml.etree.ElementMaker instances by namespace prefix
         self._elementmaker_cache = {}
+        # slot types by name (see PreparedMessage)
+        self.slots = {}
         # SOAP headers
         self.headers = []
         # SOAP body
         self.body = body
+        # MTOM attachments (see attach)
+        self.attachments = []
         # HTTP headers
         self.http_headers = {
             'Content-Type': 'text/xml;charset=UTF-8',
@@ -71,27 +123,151 @@ class SoapMessage(object):
             )
         return self._elementmaker_cache[prefix]
 
+    def slot(self, name, type_=None):
+        """Register and return placeholder text for a PreparedMessage slot.
+
+        The placeholder may be used as element text or an attribute value,
+        and is replaced by the value passed as keyword argument `name` to
+        PreparedMessage.bind() after conversion to `type_` (if given), which
+        parses text in its XML Schema lexical form for bool and float.
+        """
+        self.slots[name] = type_
+        return SLOT_MARKER.format(name)
+
+    def attach(self, data, content_type='application/octet-stream',
+               content_id=None):
+        """Attach binary data, returning an xop:Include element for the body.
+
+        The message is sent as a multipart/related MTOM message with `data`
+        (bytes-like, such as an mmap, or a binary file) streamed as a MIME
+        part, see rinse.mtom.Attachment.  Place the returned element where
+        the base64 content would otherwise be.
+
+        >>> from rinse.message import SoapMessage
+        >>> msg = SoapMessage()
+        >>> doc = msg.elementmaker('d', 'http://example.com/doc')
+        >>> msg.body = doc.upload(
+        ...     doc.content(msg.attach(b'%PDF-1.4', 'application/pdf')),
+        ... )
+        >>> msg.request('http://example.com/').headers['Content-Type']
+        ... # doctest: +ELLIPSIS
+        'multipart/related; type="application/xop+xml"; start="<root...'
+        """
+        attachment = Attachment(data, content_type, content_id)
+        self.attachments.append(attachment)
+        return attachment.include()
+
+    def body_elements(self):
+        """Return an iterable of elements within the SOAP Body.
+
+        The body may be a single element or an iterable of elements such as
+        a generator.
+        """
+        if self.body is None:
+            return ()
+        if etree.iselement(self.body):
+            return (self.body,)
+        return self.body
+
     def etree(self):
         """Generate a SOAP Envelope message with header and body elements."""
         soapenv = self.elementmaker('soapenv', NS_SOAPENV)
         return soapenv.Envelope(
             soapenv.Header(*self.headers),
-            soapenv.Body(self.body),
+            soapenv.Body(*self.body_elements()),
         )
 
     def tostring(self, **kwargs):
         """Generate XML representation of self."""
         return etree.tostring(self.etree(), **kwargs)
 
-    def request(self, url=None, action=None):
-        """Generate a requests.Request instance."""
+    def _xmlfile(self, output):
+        """Write XML to output incrementally, yielding after each element."""
+        self.elementmaker('soapenv', NS_SOAPENV)
+        with etree.xmlfile(output, encoding='utf-8') as xmlfile:
+            with xmlfile.element(
+                    etree.QName(NS_SOAPENV, 'Envelope'), nsmap=self._nsmap,
+            ):
+                with xmlfile.element(etree.QName(NS_SOAPENV, 'Header')):
+                    for header in self.headers:
+                        xmlfile.write(header)
+                        yield
+                with xmlfile.element(etree.QName(NS_SOAPENV, 'Body')):
+                    for element in self.body_elements():
+                        xmlfile.write(element)
+                        yield
+
+    def write(self, output):
+        """Write XML to file-like output incrementally.
+
+        Each element of the body is serialized in turn, so when the body is
+        a generator the whole message is never held in memory.
+        """
+        for _ in self._xmlfile(output):
+            pass
+
+    def iterxml(self):
+        """Generate XML (bytes) incrementally as chunks.
+
+        >>> from rinse.message import SoapMessage
+        >>> from lxml import etree
+        >>> from rinse.util import printxml, safe_parse_string
+        >>> msg = SoapMessage(etree.Element('row') for _ in range(2))
+        >>> printxml(safe_parse_string(b''.join(msg.iterxml())))
+        <soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+          <soapenv:Header/>
+          <soapenv:Body>
+            <row/>
+            <row/>
+          </soapenv:Body>
+        </soapenv:Envelope>
+        """
+        chunks = ChunkList()
+        for _ in self._xmlfile(chunks):
+            if chunks:
+                yield b''.join(chunks)
+                del chunks[:]
+        if chunks:
+            yield b''.join(chunks)
+
+    def request(self, url=None, action=None, stream=None, phases=None):
+        """Generate a requests.Request instance.
+
+        If `stream` is True (defaults to the `stream` attribute), the body
+        is generated incrementally by iterxml() and sent using chunked
+        transfer encoding.
+
+        Building and serializing the envelope are timed by `phases` (a
+        rinse.metrics.PhaseTimer) if given.
+
+        Messages with attachments are sent as a MultipartBody (see attach).
+        """
         headers = self.http_headers.copy()
         if action is not None:
             headers['SOAPAction'] = action
+        if stream is None:
+            stream = self.stream
+        if stream:
+            data = self.iterxml()
+        elif phases is None:
+            data = self.tostring(pretty_print=True, encoding='utf-8')
+        else:
+            with phases('build'):
+                doc = self.etree()
+            with phases('serialize'):
+                data = etree.tostring(
+                    doc, pretty_print=True, encoding='utf-8',
+                )
+        if self.attachments:
+            data = MultipartBody(
+                data, self.attachments,
+                start_info=headers['Content-Type'].split(';')[0],
+            )
+            headers['Content-Type'] = data.content_type
         return requests.Request(
             'POST',
             url or self.url,
-            data=self.tostring(pretty_print=True, encoding='utf-8'),
+            data=data,
             headers=headers,
         )
 
@@ -102,3 +278,151 @@ class SoapMessage(object):
     def __str__(self):
         """Generate XML (unicode)."""
         return self.tostring(encoding='unicode')
+
+
+def convert_slot(value, type_):
+    """Convert value bound to a slot to its type (see SoapMessage.slot)."""
+    if isinstance(value, type_) and (
+        type_ is bool or not isinstance(value, bool)
+    ):
+        return value
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    if isinstance(value, type(u'')) and type_ in LEXICAL_PARSERS:
+        return LEXICAL_PARSERS[type_](value)
+    return type_(value)
+
+
+class PreparedMessage(object):
+
+    """SOAP message compiled once into static XML fragments and slots.
+
+    Binding values to the slots of a prepared message only needs to escape
+    and join text, avoiding the cost of building and serializing the whole
+    envelope for each request.
+
+    >>> from rinse.message import SoapMessage, PreparedMessage
+    >>> import lxml.usedoctest
+    >>> from rinse.util import printxml
+    >>> msg = SoapMessage()
+    >>> f123 = msg.elementmaker(
+    ...     'f123',
+    ...     'http://www.fabrikam123.example/svc53',
+    ... )
+    >>> msg.body = f123.Delete(
+    ...     f123.maxCount(msg.slot('count', int)),
+    ...     folder=msg.slot('folder'),
+    ... )
+    >>> prepared = PreparedMessage(msg)
+    >>> printxml(prepared.bind(count='42', folder='<Inbox>').etree())
+    <soapenv:Envelope xmlns:f123="http://www.fabrikam123.example/svc53"
+            xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+      <soapenv:Header/>
+      <soapenv:Body>
+        <f123:Delete folder="&lt;Inbox&gt;">
+          <f123:maxCount>42</f123:maxCount>
+        </f123:Delete>
+      </soapenv:Body>
+    </soapenv:Envelope>
+    """
+
+    def __init__(self, msg):
+        """Compile msg into static fragments and slots."""
+        if msg.attachments:
+            raise ValueError('Messages with attachments can not be prepared.')
+        self.http_headers = msg.http_headers.copy()
+        self.slots = msg.slots.copy()
+        parts = SLOT_RE.split(msg.tostring(pretty_print=True, encoding='utf-8'))
+        self.fragments = parts[0::2]
+        self.names = [name.decode('utf-8') for name in parts[1::2]]
+        unknown = set(self.names).difference(self.slots)
+        if unknown:
+            raise ValueError(
+                'Undeclared slots: {}.'.format(', '.join(sorted(unknown))),
+            )
+
+    def tostring(self, **values):
+        """Generate XML (bytes) with slots filled from `values`."""
+        converted = {}
+        for name, type_ in self.slots.items():
+            try:
+                value = values[name]
+            except KeyError:
+                raise ValueError('No value for slot {!r}.'.format(name))
+            if value is None:
+                raise ValueError('Slot {!r} can not be None.'.format(name))
+            if type_ is not None:
+                value = convert_slot(value, type_)
+            converted[name] = escape(
+                u'{}'.format(lexical(value)), ESCAPE_ENTITIES,
+            ).encode('utf-8')
+        parts = [self.fragments[0]]
+        for name, fragment in zip(self.names, self.fragments[1:]):
+            parts.append(converted[name])
+            parts.append(fragment)
+        return b''.join(parts)
+
+    def bind(self, **values):
+        """Return a BoundMessage with slots filled from `values`."""
+        return BoundMessage(self, self.tostring(**values))
+
+
+class BoundMessage(object):
+
+    """PreparedMessage with values bound to its slots.
+
+    Elements in `headers` are added to the SOAP Header of the bound XML as
+    it is sent, which is cheap enough to do for each request.
+    """
+
+    def __init__(self, prepared, data):
+        """Set base attributes."""
+        self.prepared = prepared
+        self.data = data
+        # extra SOAP headers (see insert_headers)
+        self.headers = []
+        # HTTP headers
+        self.http_headers = prepared.http_headers.copy()
+
+    def __getitem__(self, key):
+        """Dict style access to http_headers."""
+        return self.http_headers[key]
+
+    def __setitem__(self, key, val):
+        """Dict style access to http_headers."""
+        self.http_headers[key] = val
+
+    def __delitem__(self, key):
+        """Dict style access to http_headers."""
+        del self.http_headers[key]
+
+    def tostring(self):
+        """Generate XML (bytes) with any extra headers."""
+        if not self.headers:
+            return self.data
+        return insert_headers(self.data, self.headers)
+
+    def etree(self):
+        """Parse SOAP Envelope from the bound XML."""
+        return safe_parse_string(self.tostring())
+
+    def request(self, url=None, action=None, phases=None):
+        """Generate a requests.Request instance.
+
+        There is nothing to time (see SoapMessage.request), as the XML was
+        generated when values were bound.
+        """
+        headers = self.http_headers.copy()
+        if action is not None:
+            headers['SOAPAction'] = action
+        return requests.Request(
+            'POST', url, data=self.tostring(), headers=headers,
+        )
+
+    def __bytes__(self):
+        """Generate XML (bytes)."""
+        return self.tostring()
+
+    def __str__(self):
+        """Generate XML (unicode)."""
+        return self.tostring().decode('utf-8')
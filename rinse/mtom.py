@@ -0,0 +1,338 @@
+"""Rinse SOAP library: MTOM/XOP binary attachments.
+
+Binary content is sent as MIME parts of a multipart/related message, each
+referenced from the envelope by an xop:Include element (see
+SoapMessage.attach), rather than as base64 text in the envelope.
+"""
+import email.message
+import functools
+import io
+import tempfile
+import uuid
+
+from lxml import etree
+from requests.compat import quote, unquote
+from requests.structures import CaseInsensitiveDict
+
+NS_XOP = 'http://www.w3.org/2004/08/xop/include'
+XOP_INCLUDE = '{%s}Include' % NS_XOP
+XOP_CONTENT_TYPE = 'application/xop+xml'
+ROOT_CONTENT_ID = 'root.message@rinse'
+CHUNK_SIZE = 65536
+# received attachments larger than this are spooled to a temporary file
+SPOOL_SIZE = 1024 * 1024
+
+
+def buffer_view(data):
+    """Return a memoryview of bytes-like data, or None for file objects."""
+    try:
+        return memoryview(data).cast('B')
+    except TypeError:
+        return None
+
+
+class Attachment(object):
+
+    """Binary part of an MTOM message.
+
+    The `data` of an attachment is bytes-like (bytes, bytearray, mmap or
+    memoryview) or a file-like object opened in binary mode.  Data is sent
+    from its current file position, reading `CHUNK_SIZE` bytes at a time, or
+    in memoryview slices of bytes-like data so it's never copied.
+
+    Received attachments have memoryview data (slices of the HTTP body) or
+    are spooled to a tempfile.SpooledTemporaryFile if the body was streamed.
+    """
+
+    __slots__ = ('data', 'content_type', 'content_id', 'headers')
+
+    def __init__(self, data, content_type='application/octet-stream',
+                 content_id=None, headers=None):
+        """Attachment init."""
+        self.data = data
+        self.content_type = content_type
+        if content_id is None:
+            content_id = '{}@rinse'.format(uuid.uuid4().hex)
+        self.content_id = content_id
+        self.headers = headers or {}
+
+    @property
+    def href(self):
+        """URI of attachment (for xop:Include)."""
+        return 'cid:{}'.format(quote(self.content_id, safe='@'))
+
+    def include(self):
+        """Return a new xop:Include element referencing the attachment."""
+        return etree.Element(
+            XOP_INCLUDE, href=self.href, nsmap={'xop': NS_XOP},
+        )
+
+    def length(self):
+        """Return size of the data (bytes), or None if unknown."""
+        view = buffer_view(self.data)
+        if view is not None:
+            return len(view)
+        try:
+            position = self.data.tell()
+            size = self.data.seek(0, io.SEEK_END)
+            self.data.seek(position)
+            return size - position
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return None
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        """Yield data in chunks of up to `chunk_size` bytes."""
+        view = buffer_view(self.data)
+        if view is None:
+            for chunk in iter(functools.partial(self.data.read, chunk_size),
+                              b''):
+                yield chunk
+            return
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+
+    def tobytes(self):
+        """Return data as bytes (read from the start of files)."""
+        view = buffer_view(self.data)
+        if view is None:
+            self.data.seek(0)
+            return self.data.read()
+        return view.tobytes()
+
+    def __repr__(self):
+        """Attachment representation."""
+        return '<Attachment {} {}>'.format(self.content_id, self.content_type)
+
+
+def format_headers(headers):
+    """Return MIME part headers (bytes) for a dict of headers."""
+    return b''.join(
+        '{}: {}\r\n'.format(name, value).encode('utf-8')
+        for name, value in headers.items()
+    ) + b'\r\n'
+
+
+def parse_headers(lines):
+    """Return a case insensitive dict of MIME part headers (list of bytes)."""
+    headers = CaseInsensitiveDict()
+    for line in lines:
+        if line:
+            name, _, value = line.decode('utf-8').partition(':')
+            headers[name.strip()] = value.strip()
+    return headers
+
+
+def content_type_params(content_type):
+    """Return (media type, params dict) of a Content-Type header value.
+
+    >>> from rinse.mtom import content_type_params
+    >>> content_type_params('multipart/related; boundary="a b"; type=x')
+    ('multipart/related', {'boundary': 'a b', 'type': 'x'})
+    """
+    message = email.message.Message()
+    message['Content-Type'] = content_type
+    return message.get_content_type(), dict(
+        (name.lower(), value) for name, value in message.get_params()[1:]
+    )
+
+
+def strip_angle_brackets(content_id):
+    """Return Content-ID header value without angle brackets."""
+    if content_id.startswith('<') and content_id.endswith('>'):
+        return content_id[1:-1]
+    return content_id
+
+
+def include_id(element):
+    """Return Content-ID referenced by an xop:Include element (or parent)."""
+    if element.tag != XOP_INCLUDE:
+        element = element.find(XOP_INCLUDE)
+        if element is None:
+            raise ValueError('Element has no {}.'.format(XOP_INCLUDE))
+    href = element.get('href', '')
+    if not href.startswith('cid:'):
+        raise ValueError('Unsupported xop:Include href {!r}.'.format(href))
+    return unquote(href[4:])
+
+
+class MultipartBody(object):
+
+    """Iterable body of a multipart/related MTOM request.
+
+    The root part is the envelope (bytes, or an iterable of bytes chunks),
+    followed by each of `attachments`.  If the size of each part is known,
+    `len` is the body size so that requests sends a Content-Length header
+    instead of using chunked transfer encoding.
+    """
+
+    def __init__(self, root, attachments, start_info='text/xml',
+                 boundary=None):
+        """MultipartBody init."""
+        self.root = root
+        self.attachments = list(attachments)
+        self.start_info = start_info
+        self.boundary = boundary or 'uuid:{}'.format(uuid.uuid4())
+        self.len = self.length()
+
+    @property
+    def content_type(self):
+        """Content-Type header value for the body."""
+        return (
+            'multipart/related; type="{}"; start="<{}>"; start-info="{}"; '
+            'boundary="{}"'
+        ).format(
+            XOP_CONTENT_TYPE, ROOT_CONTENT_ID, self.start_info, self.boundary,
+        )
+
+    def part_headers(self):
+        """Return (headers, part) for each part, the root part first."""
+        headers = [(format_headers({
+            'Content-Type': '{}; charset=UTF-8; type="{}"'.format(
+                XOP_CONTENT_TYPE, self.start_info,
+            ),
+            'Content-Transfer-Encoding': 'binary',
+            'Content-ID': '<{}>'.format(ROOT_CONTENT_ID),
+        }), None)]
+        for attachment in self.attachments:
+            headers.append((format_headers({
+                'Content-Type': attachment.content_type,
+                'Content-Transfer-Encoding': 'binary',
+                'Content-ID': '<{}>'.format(attachment.content_id),
+            }), attachment))
+        return headers
+
+    def delimiter(self, close=False):
+        """Return boundary delimiter line (bytes)."""
+        return '--{}{}\r\n'.format(
+            self.boundary, '--' if close else '',
+        ).encode('utf-8')
+
+    def length(self):
+        """Return size of the body (bytes), or None if unknown."""
+        if not isinstance(self.root, bytes):
+            return None
+        total = len(self.root) + len(self.delimiter(close=True))
+        for headers, attachment in self.part_headers():
+            total += len(self.delimiter()) + len(headers) + 2
+            if attachment is not None:
+                size = attachment.length()
+                if size is None:
+                    return None
+                total += size
+        return total
+
+    def __iter__(self):
+        """Yield body as chunks of bytes."""
+        for headers, attachment in self.part_headers():
+            yield self.delimiter() + headers
+            if attachment is None:
+                if isinstance(self.root, bytes):
+                    yield self.root
+                else:
+                    for chunk in self.root:
+                        yield chunk
+            else:
+                for chunk in attachment.iter_chunks():
+                    yield chunk
+            yield b'\r\n'
+        yield self.delimiter(close=True)
+
+
+def part_attachment(headers, data):
+    """Return Attachment for a received MIME part."""
+    return Attachment(
+        data,
+        content_type=headers.get('Content-Type', 'application/octet-stream'),
+        content_id=strip_angle_brackets(headers.get('Content-ID', '')),
+        headers=headers,
+    )
+
+
+def split_parts(content, boundary):
+    """Return list of Attachment for each part of a multipart body (bytes).
+
+    Part data are memoryview slices of `content`, which is never copied.
+
+    >>> from rinse.mtom import split_parts
+    >>> content = b'--b\\r\\nContent-ID: <x>\\r\\n\\r\\n<xml/>\\r\\n--b--'
+    >>> parts = split_parts(content, 'b')
+    >>> parts[0].content_id, parts[0].data.tobytes()
+    ('x', b'<xml/>')
+    """
+    delimiter = b'\r\n--' + boundary.encode('utf-8')
+    view = memoryview(content)
+    start = content.find(delimiter[2:])
+    if start < 0:
+        raise ValueError('Multipart body has no boundary.')
+    start += len(delimiter) - 2
+    parts = []
+    while not content.startswith(b'--', start):
+        head_end = content.find(b'\r\n\r\n', start)
+        if head_end < 0:
+            raise ValueError('Unterminated MIME part headers.')
+        headers = parse_headers(content[start:head_end].split(b'\r\n')[1:])
+        end = content.find(delimiter, head_end + 4)
+        if end < 0:
+            raise ValueError('Unterminated MIME part.')
+        parts.append(part_attachment(headers, view[head_end + 4:end]))
+        start = end + len(delimiter)
+    return parts
+
+
+def read_parts(source, boundary, spool_size=SPOOL_SIZE,
+               chunk_size=CHUNK_SIZE):
+    """Yield Attachment for each part of a multipart body read from source.
+
+    The body is read from the file-like `source` in chunks, and each part is
+    written to a tempfile.SpooledTemporaryFile that stays in memory up to
+    `spool_size` bytes.
+    """
+    delimiter = b'\r\n--' + boundary.encode('utf-8')
+    keep = len(delimiter) - 1  # bytes that may start a split delimiter
+
+    def more(buf):
+        """Return buf with the next chunk of source appended."""
+        chunk = source.read(chunk_size)
+        if not chunk:
+            raise ValueError('Unterminated multipart body.')
+        return buf + chunk
+
+    buf = b'\r\n'  # so the first delimiter matches like the others
+    while delimiter not in buf:
+        buf = more(buf[-keep:])
+    buf = buf[buf.index(delimiter) + len(delimiter):]
+    while True:
+        while len(buf) < 2:
+            buf = more(buf)
+        if buf.startswith(b'--'):
+            return
+        while b'\r\n\r\n' not in buf:
+            buf = more(buf)
+        head, buf = buf.split(b'\r\n\r\n', 1)
+        headers = parse_headers(head.split(b'\r\n')[1:])
+        spool = tempfile.SpooledTemporaryFile(spool_size)
+        try:
+            while delimiter not in buf:
+                if len(buf) > keep:
+                    spool.write(buf[:-keep])
+                    buf = buf[-keep:]
+                buf = more(buf)
+        except Exception:
+            spool.close()
+            raise
+        index = buf.index(delimiter)
+        spool.write(buf[:index])
+        buf = buf[index + len(delimiter):]
+        spool.seek(0)
+        yield part_attachment(headers, spool)
+
+
+def root_part(parts, content_type):
+    """Return (root part, {content ID: Attachment}) of received parts."""
+    start = content_type_params(content_type)[1].get('start')
+    start = strip_angle_brackets(start) if start else parts[0].content_id
+    attachments = {part.content_id: part for part in parts}
+    try:
+        return attachments.pop(start), attachments
+    except KeyError:
+        raise ValueError('Multipart body has no part {!r}.'.format(start))
@@ -0,0 +1,102 @@
+"""Rinse SOAP library: HTTP connection pools with statistics."""
+import collections
+import threading
+
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from rinse.util import timer
+
+
+class PoolStats(object):
+
+    """Thread-safe counters of connection pool activity.
+
+    Counts `connections_created`, `connections_reused`, `pool_exhausted`
+    (connections requested while none were free) and `wait_time` (seconds
+    spent getting a connection from the pool).
+    """
+
+    def __init__(self):
+        """PoolStats init."""
+        self.counter = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        """Add counts."""
+        with self._lock:
+            self.counter.update(counts)
+
+    def __getitem__(self, key):
+        """Return count for key."""
+        return self.counter[key]
+
+    def as_dict(self):
+        """Return a snapshot of all counts."""
+        with self._lock:
+            return dict(self.counter)
+
+
+class CountingPoolMixin(object):
+
+    """Connection pool mixin recording activity in `stats`."""
+
+    stats = None
+
+    def _get_conn(self, timeout=None):
+        """Get a pooled connection, or a new one."""
+        exhausted = self.pool is not None and self.pool.empty()
+        start = timer()
+        conn = super(CountingPoolMixin, self)._get_conn(timeout)
+        # new (and dropped) connections are (re)connected when used
+        connected = conn.sock is not None
+        self.stats.add(
+            pool_exhausted=int(exhausted),
+            wait_time=timer() - start,
+            connections_created=int(not connected),
+            connections_reused=int(connected),
+        )
+        return conn
+
+
+class CountingHTTPConnectionPool(CountingPoolMixin, HTTPConnectionPool):
+
+    """HTTPConnectionPool recording activity in `stats`."""
+
+
+class CountingHTTPSConnectionPool(CountingPoolMixin, HTTPSConnectionPool):
+
+    """HTTPSConnectionPool recording activity in `stats`."""
+
+
+class PoolAdapter(HTTPAdapter):
+
+    """Transport adapter with configurable pools recording statistics.
+
+    As for requests.adapters.HTTPAdapter, `pool_connections` is the number
+    of hosts to keep pools for and `pool_maxsize` the number of connections
+    kept per host.  If `pool_block` is True at most `pool_maxsize`
+    connections are made to each host, otherwise extra connections are made
+    when the pool is exhausted but not kept.  Activity of all pools is
+    counted in `stats` (a PoolStats instance).
+    """
+
+    def __init__(self, *args, **kwargs):
+        """PoolAdapter init."""
+        self.stats = PoolStats()
+        super(PoolAdapter, self).__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        """Make a pool manager using counting connection pools."""
+        super(PoolAdapter, self).init_poolmanager(*args, **kwargs)
+        attrs = {'stats': self.stats}
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': type(
+                'CountingHTTPConnectionPool',
+                (CountingHTTPConnectionPool,), attrs,
+            ),
+            'https': type(
+                'CountingHTTPSConnectionPool',
+                (CountingHTTPSConnectionPool,), attrs,
+            ),
+        }
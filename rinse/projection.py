@@ -0,0 +1,191 @@
+"""Rinse SOAP library: projection of response fields into columns."""
+import array
+import collections
+import datetime
+import decimal
+
+from lxml import etree
+from rinse import NS_MAP
+from rinse.codec import (
+    BUILTIN_PARSERS, parse_base64, parse_boolean, parse_date, parse_datetime,
+    parse_float, parse_text, parse_time,
+)
+from rinse.response import compile_xpath
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+# parsers for column types given as Python types
+TYPE_PARSERS = {
+    bool: parse_boolean,
+    int: int,
+    float: parse_float,
+    decimal.Decimal: decimal.Decimal,
+    datetime.datetime: parse_datetime,
+    datetime.date: parse_date,
+    datetime.time: parse_time,
+    bytes: parse_base64,
+    type(u''): parse_text,
+}
+
+# array.array typecodes and numpy dtypes for column types
+TYPECODES = {bool: 'b', int: 'q', float: 'd'}
+DTYPES = {bool: 'bool', int: 'int64', float: 'float64'}
+
+CONTAINERS = ('list', 'array', 'numpy')
+
+
+def column_type(type_):
+    """Return (parse, python type) for a column type.
+
+    The type may be a Python type, the name of an XSD built-in type such as
+    'dateTime' or any callable taking the text of a value.
+    """
+    if type_ is None:
+        return parse_text, None
+    if type_ in TYPE_PARSERS:
+        return TYPE_PARSERS[type_], type_
+    if type_ in BUILTIN_PARSERS:
+        parse = BUILTIN_PARSERS[type_]
+        for python_type, type_parse in TYPE_PARSERS.items():
+            if type_parse is parse:
+                return parse, python_type
+        return parse, None
+    return type_, None
+
+
+def convert_number(value, parse, python_type):
+    """Return a float or bool XPath result (eg: count()) as a column value.
+
+    Untyped, numeric and boolean columns take the value as is (rejecting
+    fractions in int columns), other columns parse its XPath string value.
+    """
+    if parse is parse_text:
+        return value
+    if python_type in (bool, float):
+        return python_type(value)
+    if python_type is int:
+        if value != int(value):
+            raise ValueError('Not an integer: {!r}.'.format(value))
+        return int(value)
+    if isinstance(value, bool):
+        return parse(u'true' if value else u'false')
+    if value == int(value):
+        return parse(u'{}'.format(int(value)))
+    return parse(u'{!r}'.format(value))
+
+
+class Projection(object):
+
+    """Projection of response fields into columns.
+
+    Columns map a name to a (path, type) pair, or just a path for text.
+    Paths are XPath expressions compiled once (see compile_xpath) using
+    `namespaces`, and evaluated relative to each row: each element matching
+    the `rows` path (relative to soapenv:Body), or soapenv:Body itself so
+    there is one row per response.  Missing values are None.
+
+    Calling a projection with a Response (or an element) or an iterable of
+    them returns an OrderedDict of columns, each a list, an array.array or a
+    numpy array depending on `container`.  Only bool, int and float columns
+    are packed into arrays, other columns stay as lists in 'array' and use
+    the object dtype in 'numpy' containers.
+
+    >>> from lxml import etree
+    >>> from rinse.projection import Projection
+    >>> projection = Projection(
+    ...     {'symbol': 'x:tickerSymbol', 'volume': ('x:volume', int)},
+    ...     rows='x:trade',
+    ...     namespaces={'x': 'urn:x'},
+    ... )
+    >>> columns = projection(etree.fromstring(
+    ...     '<history xmlns="urn:x">'
+    ...     '<trade><tickerSymbol>A</tickerSymbol><volume>1</volume></trade>'
+    ...     '<trade><tickerSymbol>B</tickerSymbol><volume>2</volume></trade>'
+    ...     '</history>'
+    ... ))
+    >>> columns['symbol'], columns['volume']
+    (['A', 'B'], [1, 2])
+    """
+
+    def __init__(self, columns, rows=None, namespaces=None, container='list'):
+        """Compile paths of columns (and rows)."""
+        if container not in CONTAINERS:
+            raise ValueError(
+                'container must be one of {}.'.format(', '.join(CONTAINERS)),
+            )
+        if container == 'numpy' and numpy is None:
+            raise ImportError('numpy containers require numpy.')
+        namespaces = dict(NS_MAP, **(namespaces or {}))
+        self.container = container
+        self.rows = rows and compile_xpath(rows, namespaces)
+        self.columns = collections.OrderedDict()
+        for name, spec in columns.items():
+            path, type_ = spec if isinstance(spec, tuple) else (spec, None)
+            parse, python_type = column_type(type_)
+            self.columns[name] = (
+                compile_xpath(path, namespaces), parse, python_type,
+            )
+
+    def iter_rows(self, responses):
+        """Yield row elements of responses (or elements)."""
+        if hasattr(responses, 'body') or etree.iselement(responses):
+            responses = [responses]
+        for response in responses:
+            context = getattr(response, 'body', response)
+            if self.rows is None:
+                yield context
+            else:
+                for row in self.rows(context):
+                    yield row
+
+    def __call__(self, responses):
+        """Return OrderedDict of columns for response(s)."""
+        names = list(self.columns)
+        columns = [[] for _ in names]
+        compiled = [
+            (xpath, parse, python_type, column.append)
+            for (xpath, parse, python_type), column in zip(
+                self.columns.values(), columns,
+            )
+        ]
+        for row in self.iter_rows(responses):
+            for xpath, parse, python_type, append in compiled:
+                result = xpath(row)
+                if isinstance(result, list):
+                    result = result[0] if result else None
+                if etree.iselement(result):
+                    result = result.text or ''
+                if result is None:
+                    append(None)
+                elif isinstance(result, (bool, float)):
+                    append(convert_number(result, parse, python_type))
+                else:
+                    append(parse(result))
+        return collections.OrderedDict(
+            (name, self.pack(name, values))
+            for name, values in zip(names, columns)
+        )
+
+    def pack(self, name, values):
+        """Return column values in the container type of the projection."""
+        if self.container == 'list':
+            return values
+        python_type = self.columns[name][2]
+        if python_type not in TYPECODES:
+            if self.container == 'array':
+                return values
+            return numpy.array(values, dtype=object)
+        if None in values:
+            if python_type is not float:
+                raise ValueError(
+                    'Column {} has missing values.'.format(name),
+                )
+            values = [
+                float('nan') if value is None else value for value in values
+            ]
+        if self.container == 'array':
+            return array.array(TYPECODES[python_type], values)
+        return numpy.array(values, dtype=DTYPES[python_type])
@@ -1,25 +1,311 @@
 """SOAP client."""
-import collections
-from rinse import NS_MAP
-from rinse.util import safe_parse_string
+import threading
+
+from lxml import etree
+from rinse import NS_MAP, NS_SOAPENV
+from rinse.mtom import (
+    content_type_params, include_id, read_parts, root_part, split_parts,
+)
+from rinse.util import (
+    TeeReader, cached_property, safe_iterparse, safe_parse_file,
+    safe_parse_string,
+)
+
+SOAPENV_HEADER = '{%s}Header' % NS_SOAPENV
+SOAPENV_BODY = '{%s}Body' % NS_SOAPENV
+SOAPENV_FAULT = '{%s}Fault' % NS_SOAPENV
+
+# compiled XPath expressions shared by all responses (see compile_xpath)
+XPATH_CACHE = {}
+XPATH_CACHE_SIZE = 1024
+_XPATH_LOCK = threading.Lock()
+
+
+def compile_xpath(path, namespaces=None):
+    """Return compiled etree.XPath for path, from a process-wide cache.
+
+    >>> from rinse.response import compile_xpath
+    >>> compile_xpath('soapenv:Fault') is compile_xpath('soapenv:Fault')
+    True
+    """
+    if namespaces is None:
+        namespaces = NS_MAP
+    key = (path, frozenset(namespaces.items()))
+    try:
+        return XPATH_CACHE[key]
+    except KeyError:
+        pass
+    xpath = etree.XPath(path, namespaces=namespaces)
+    with _XPATH_LOCK:
+        if len(XPATH_CACHE) >= XPATH_CACHE_SIZE:
+            XPATH_CACHE.clear()  # unbounded paths are a caller bug
+        return XPATH_CACHE.setdefault(key, xpath)
 
 
 class Response(object):
 
-    """Rinse Response object."""
+    """Rinse Response object.
 
-    def __init__(self, response):
+    The HTTP body is only parsed on first access to the SOAP envelope (via
+    `doc`, `header`, `body`, `fault` or the query methods), so checking
+    `status_code` or `headers` costs nothing more than the HTTP response.
+
+    Paths given to `find`, `findall` and `xpath` are relative to soapenv:Body
+    unless another `context` element is given, and may use prefixes from
+    `namespaces` (the namespace map of the client).  Parsing is timed by
+    `phases` (a rinse.metrics.PhaseTimer) if given.
+
+    If the HTTP body hasn't been read (the request was sent with
+    stream=True) it is parsed straight from `response.raw`, decompressing
+    any Content-Encoding as it is read, and the connection is released.
+    `content` is then the (decoded) body bytes read by the parser, except
+    for MTOM responses where it is the serialized envelope, as attachments
+    are spooled rather than kept in memory.
+    If the envelope is never parsed, the connection is released by close()
+    (called when the response is garbage collected).
+
+    MTOM (multipart/related) responses are split into the envelope and
+    `attachments` (see rinse.mtom.Attachment), which hold memoryview slices
+    of the HTTP body, or spooled files if the body was streamed.
+    """
+
+    def __init__(self, response, namespaces=None, phases=None):
         """Response init."""
         self._response = response
-        # parse response
-        self._doc = safe_parse_string(response.content)
-        self._body = self._doc.xpath(
-            '/soapenv:Envelope/soapenv:Body', namespaces=NS_MAP,
-        )[0]
+        self.namespaces = NS_MAP if namespaces is None else namespaces
+        self._phases = phases
+
+    @property
+    def response(self):
+        """The requests.Response."""
+        return self._response
+
+    @property
+    def status_code(self):
+        """HTTP status code."""
+        return self._response.status_code
+
+    @property
+    def headers(self):
+        """HTTP headers (case insensitive dict)."""
+        return self._response.headers
+
+    @property
+    def content(self):
+        """HTTP body content (bytes)."""
+        if '_envelope' in self.__dict__ and self._streamed:
+            return etree.tostring(self.doc, encoding='utf-8')
+        return self._response.content
+
+    @property
+    def _streamed(self):
+        """True if the HTTP body is (or was) parsed from response.raw."""
+        # pylint: disable=protected-access
+        return self._response._content is False
+
+    def _parse(self):
+        """Return (envelope, attachments) parsed from the HTTP body."""
+        content_type = self.headers.get('Content-Type', '')
+        media_type, params = content_type_params(content_type)
+        multipart = media_type == 'multipart/related'
+        if not self._streamed:
+            if not multipart:
+                return safe_parse_string(self._response.content), {}
+            parts = split_parts(self._response.content, params['boundary'])
+            root, attachments = root_part(parts, content_type)
+            return safe_parse_string(root.data), attachments
+        raw = self._response.raw
+        raw.decode_content = True
+        try:
+            if multipart:
+                doc, attachments = self._parse_parts(
+                    read_parts(raw, params['boundary']), content_type,
+                )
+            else:
+                reader = TeeReader(raw)
+                doc, attachments = safe_parse_file(reader), {}
+        except Exception:
+            self._response.close()
+            raise
+        raw.release_conn()
+        if not multipart:
+            # keep the body read by the parser as the response content
+            # pylint: disable=protected-access
+            self._response._content = reader.getvalue()
+        return doc, attachments
+
+    @staticmethod
+    def _parse_parts(parts, content_type):
+        """Return (envelope, attachments) from spooled parts.
+
+        The spool of the root part is closed once parsed, and all spools
+        are closed if parsing fails.
+        """
+        spooled = []
+        try:
+            spooled.extend(parts)
+            root, attachments = root_part(spooled, content_type)
+            try:
+                return safe_parse_file(root.data), attachments
+            finally:
+                root.data.close()
+        except Exception:
+            for part in spooled:
+                part.data.close()
+            raise
+
+    def close(self):
+        """Release the connection of a streamed response that wasn't parsed.
+
+        The unread body is discarded, closing the connection.
+        """
+        response = self.__dict__.get('_response')
+        if response is not None and '_envelope' not in self.__dict__ \
+                and self._streamed:
+            response.close()
+
+    def __del__(self):
+        """Release the connection if the body was never parsed."""
+        self.close()
+
+    @cached_property
+    def _envelope(self):
+        """Tuple of parsed soapenv:Envelope element and attachments."""
+        if self._phases is None:
+            return self._parse()
+        with self._phases('parse'):
+            return self._parse()
+
+    @property
+    def doc(self):
+        """Parsed soapenv:Envelope element."""
+        return self._envelope[0]
+
+    @property
+    def attachments(self):
+        """Dict mapping Content-ID to rinse.mtom.Attachment (MTOM only)."""
+        return self._envelope[1]
+
+    def attachment(self, element):
+        """Return Attachment referenced by an xop:Include (or its parent)."""
+        content_id = include_id(element)
+        try:
+            return self.attachments[content_id]
+        except KeyError:
+            raise ValueError('No attachment {!r}.'.format(content_id))
+
+    @cached_property
+    def header(self):
+        """The soapenv:Header element, or None."""
+        return self.doc.find(SOAPENV_HEADER)
+
+    @cached_property
+    def body(self):
+        """The soapenv:Body element."""
+        body = self.doc.find(SOAPENV_BODY)
+        if body is None:
+            raise ValueError('Response has no {}.'.format(SOAPENV_BODY))
+        return body
+
+    @cached_property
+    def fault(self):
+        """The soapenv:Fault element, or None."""
+        return self.body.find(SOAPENV_FAULT)
+
+    def xpath(self, path, context=None, **variables):
+        """Evaluate XPath expression using a cached compiled expression."""
+        return compile_xpath(path, self.namespaces)(
+            self.body if context is None else context, **variables
+        )
+
+    def find(self, path, context=None, **variables):
+        """Return first result of XPath expression, or None.
+
+        Results that aren't node-sets (strings, numbers and booleans) are
+        returned as they are.
+        """
+        result = self.xpath(path, context, **variables)
+        if not isinstance(result, list):
+            return result
+        return result[0] if result else None
+
+    def findall(self, path, context=None, **variables):
+        """Return list of results of XPath expression."""
+        return self.xpath(path, context, **variables)
 
     def __str__(self):
         """String representation of Response is the HTTP body content."""
-        return self._response.content.decode('utf-8')
+        return self.content.decode('utf-8')
+
+
+class StreamingResponse(object):
+
+    """Rinse Response object that parses the HTTP body as it is read.
+
+    SoapClient checks the `stream` attribute of `build_response` and defers
+    reading the HTTP body so that elements can be parsed straight from
+    `response.raw`, keeping memory use flat no matter the response size.
+    """
+
+    stream = True
+
+    def __init__(self, response):
+        """Response init."""
+        self._response = response
+
+    def __iter__(self):
+        """Iterate over children of soapenv:Body."""
+        return self.iter_body()
+
+    def iter_body(self, tag=None):
+        """Yield each child of soapenv:Body, or each element matching `tag`.
+
+        Each element is cleared (along with any preceding siblings) when the
+        caller asks for the next one, so elements must not be kept beyond
+        that point - copy any data needed first.
+        """
+        raw = self._response.raw
+        raw.decode_content = True
+        depth = 0
+        body_depth = None
+        try:
+            for event, element in safe_iterparse(raw, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if depth == 2 and element.tag == SOAPENV_BODY:
+                        body_depth = depth
+                    continue
+                depth -= 1
+                if body_depth is None:
+                    continue
+                if depth < body_depth:
+                    body_depth = None  # end of soapenv:Body
+                    continue
+                if tag is None:
+                    if depth != body_depth:
+                        continue  # not a direct child of soapenv:Body
+                elif element.tag != tag:
+                    continue
+                yield element
+                # free memory used by element and any preceding siblings
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+        finally:
+            self.close()
+
+    def close(self):
+        """Release the connection back to the pool."""
+        self._response.close()
+
+    def __enter__(self):
+        """Use response as a context manager."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close response on exit from context."""
+        self.close()
 
 
-RinseResponse = collections.namedtuple('RinseResponse', ['response', 'doc'])
+# backwards compatible name
+RinseResponse = Response
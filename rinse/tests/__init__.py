@@ -1,8 +1,16 @@
 """Unit tests for rinse package."""
 import doctest
 import rinse
+import rinse.batch
+import rinse.cache
+import rinse.capture
 import rinse.client
+import rinse.codec
+import rinse.compression
 import rinse.message
+import rinse.metrics
+import rinse.mtom
+import rinse.projection
 import rinse.response
 import rinse.util
 import rinse.wsa
@@ -15,8 +23,16 @@ def load_tests(loader, tests, ignore):
     """Load rinse.wsse test suite."""
     tests.addTests([
         doctest.DocTestSuite(rinse),
+        doctest.DocTestSuite(rinse.batch),
+        doctest.DocTestSuite(rinse.cache),
+        doctest.DocTestSuite(rinse.capture),
         doctest.DocTestSuite(rinse.client),
+        doctest.DocTestSuite(rinse.codec),
+        doctest.DocTestSuite(rinse.compression),
         doctest.DocTestSuite(rinse.message),
+        doctest.DocTestSuite(rinse.metrics),
+        doctest.DocTestSuite(rinse.mtom),
+        doctest.DocTestSuite(rinse.projection),
         doctest.DocTestSuite(rinse.response),
         doctest.DocTestSuite(rinse.util),
         doctest.DocTestSuite(rinse.wsa),
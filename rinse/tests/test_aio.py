@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Unit tests for rinse.aio module."""
+
+import asyncio
+import gzip
+import sys
+import threading
+import unittest
+
+from lxml import etree
+from rinse.message import SoapMessage
+
+from .utils import captured_stderr
+
+try:
+    import aiohttp
+    from aiohttp import web
+    from rinse.aio import AsyncSoapClient
+except ImportError:
+    aiohttp = None
+
+RESPONSE = (
+    b'<soapenv:Envelope'
+    b' xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">'
+    b'<soapenv:Body><pong/></soapenv:Body>'
+    b'</soapenv:Envelope>'
+)
+
+
+@unittest.skipIf(
+    aiohttp is None or sys.version_info < (3, 8),
+    'AsyncSoapClient requires aiohttp and Python 3.8+ for these tests.',
+)
+class TestAsyncSoapClient(getattr(unittest, 'IsolatedAsyncioTestCase',
+                                  unittest.TestCase)):
+    async def asyncSetUp(self):
+        self.requests = []
+
+        async def handler(request):
+            self.requests.append((dict(request.headers), await request.read()))
+            if 'gzip' in request.headers.get('Accept-Encoding', ''):
+                return web.Response(
+                    body=gzip.compress(RESPONSE), content_type='text/xml',
+                    headers={'Content-Encoding': 'gzip'},
+                )
+            return web.Response(body=RESPONSE, content_type='text/xml')
+
+        app = web.Application()
+        app.router.add_post('/', handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = 'http://127.0.0.1:{}/'.format(port)
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+
+    async def test_call(self):
+        """Test that message is posted with SOAPAction and parsed."""
+        threads = []
+
+        def build_response(resp):
+            threads.append(threading.current_thread())
+            return etree.fromstring(resp.content)
+
+        async with AsyncSoapClient(self.url) as client:
+            doc = await client(
+                SoapMessage(etree.Element('ping')), 'testaction',
+                build_response=build_response,
+            )
+        self.assertEqual(doc[0][0].tag, 'pong')
+        headers, body = self.requests[0]
+        self.assertEqual(headers['SOAPAction'], 'testaction')
+        self.assertIn(b'<ping/>', body)
+        # response parsing happens off the event loop thread
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    async def test_decompressed(self):
+        """Test that decompressed content has no Content-Encoding."""
+        msg = SoapMessage(etree.Element('ping'))
+        msg['Accept-Encoding'] = 'gzip'
+        async with AsyncSoapClient(self.url) as client:
+            resp = await client(msg, build_response=lambda r: r)
+        self.assertEqual(resp.content, RESPONSE)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertNotIn('Content-Length', resp.headers)
+
+    async def test_debug(self):
+        """Test that debug writes each exchange to stderr."""
+        async with AsyncSoapClient(self.url, debug=True) as client:
+            with captured_stderr() as stderr:
+                await client(
+                    SoapMessage(etree.Element('ping')), 'testaction',
+                    build_response=lambda r: r.status_code,
+                )
+        self.assertIn('SOAPAction: testaction', stderr.getvalue())
+        self.assertIn('<pong/>', stderr.getvalue())
+
+    async def test_pool_limits(self):
+        """Test that connection pool is bounded per host."""
+        async with AsyncSoapClient(self.url, limit_per_host=3) as client:
+            responses = await asyncio.gather(*[
+                client(
+                    SoapMessage(etree.Element('ping')),
+                    build_response=lambda r: r.status_code,
+                )
+                for _ in range(10)
+            ])
+            self.assertEqual(client.session.connector.limit_per_host, 3)
+        self.assertEqual(responses, [200] * 10)
+        self.assertEqual(len(self.requests), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Unit tests for rinse.batch module."""
+
+import io
+import json
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from rinse.batch import Checkpoint, Job, main, read_records, run
+
+from .utils import captured_output, stub_server
+
+STOCKQUOTE_WSDL = os.path.join(
+    os.path.dirname(__file__), 'res', 'stockquote.wsdl',
+)
+TEMPLATE = b'''<q:quote xmlns:q="http://example.com/q" symbol="${symbol}">
+  <q:count>${count}</q:count>
+</q:quote>'''
+
+
+def fault_reply(body):
+    """Reply with a SOAP fault for symbol FAIL."""
+    if b'FAIL' not in body:
+        return 200, {'Content-Type': 'text/xml'}, body
+    return 500, {}, (
+        b'<soapenv:Envelope'
+        b' xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">'
+        b'<soapenv:Body><soapenv:Fault><faultcode>soapenv:Client</faultcode>'
+        b'<faultstring>Unknown symbol</faultstring></soapenv:Fault>'
+        b'</soapenv:Body></soapenv:Envelope>'
+    )
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.template = self.path('template.xml')
+        with open(self.template, 'wb') as template:
+            template.write(TEMPLATE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def lines(self, output):
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_records(self):
+        """Test that JSONL and CSV records are read."""
+        jsonl = io.StringIO(u'{"a": 1}\n\n{"a": 2}\n')
+        self.assertEqual(
+            list(read_records(jsonl, 'jsonl')), [{'a': 1}, {'a': 2}],
+        )
+        self.assertEqual(
+            list(read_records(io.StringIO(u'a,b\n1,x\n2,\n'), 'csv')),
+            [{'a': '1', 'b': 'x'}, {'a': '2', 'b': ''}],
+        )
+
+    def test_template(self):
+        """Test that records are posted in chunks using a template."""
+        records = [{'symbol': 'S%d' % index, 'count': index}
+                   for index in range(25)]
+        records[3] = {'count': 3}  # no symbol
+        records[7]['symbol'] = 'FAIL'
+        results, errors = io.StringIO(), io.StringIO()
+        with stub_server(fault_reply) as server:
+            stats = run(
+                Job(server.url, template=self.template, concurrency=3),
+                records, results, errors, processes=0, chunk_size=10,
+            )
+        self.assertEqual(stats['results'], 23)
+        self.assertEqual(stats['errors'], 2)
+        results = self.lines(results)
+        self.assertEqual(
+            sorted(result['index'] for result in results),
+            [index for index in range(25) if index not in (3, 7)],
+        )
+        result = [result for result in results if result['index'] == 5][0]
+        self.assertIn('symbol="S5"', result['body'])
+        self.assertIn('<q:count>5</q:count>', result['body'])
+        errors = sorted(self.lines(errors), key=lambda error: error['index'])
+        self.assertIn("'symbol'", errors[0]['error'])
+        self.assertEqual(errors[1]['error'], 'Unknown symbol')
+        self.assertEqual(errors[1]['status_code'], 500)
+        self.assertEqual(errors[1]['record'], records[7])
+
+    def test_processes(self):
+        """Test that records are posted by worker processes from a WSDL."""
+        csv_path = self.path('input.csv')
+        with io.open(csv_path, 'w') as source:
+            source.write(u'tickerSymbol,date\n')
+            for index in range(20):
+                source.write(u'T{},{}\n'.format(
+                    index, '2015-01-02' if index % 2 else '',
+                ))
+        with stub_server() as server:
+            with captured_output('stderr') as stderr:
+                status = main([
+                    csv_path, '--wsdl', STOCKQUOTE_WSDL,
+                    '--operation', 'GetLastTradePrice', '--url', server.url,
+                    '--processes', '2', '--concurrency', '2',
+                    '--chunk-size', '3', '-o', self.path('results.jsonl'),
+                ])
+        self.assertEqual(status, 0)
+        self.assertIn('20 results, 0 errors', stderr.getvalue())
+        self.assertEqual(
+            {headers['SOAPAction'] for headers, _ in server.requests},
+            {'http://example.com/GetLastTradePrice'},
+        )
+        with io.open(self.path('results.jsonl')) as results:
+            results = [json.loads(line) for line in results]
+        self.assertEqual(len(results), 20)
+        result = [result for result in results if result['index'] == 3][0]
+        self.assertIn('>T3</', result['body'])
+        self.assertIn('>2015-01-02</', result['body'])
+
+    def test_checkpoint(self):
+        """Test that a resumed run skips completed records."""
+        path = self.path('checkpoint')
+        records = [{'symbol': 'S%d' % index, 'count': index}
+                   for index in range(10)]
+        checkpoint = Checkpoint(path)
+        checkpoint.add([0, 1, 2, 5])
+        checkpoint.close()
+        checkpoint = Checkpoint(path)
+        self.assertEqual(len(checkpoint), 4)
+        self.assertEqual(
+            [index for index in range(10) if index in checkpoint],
+            [0, 1, 2, 5],
+        )
+        results = io.StringIO()
+        with stub_server() as server:
+            stats = run(
+                Job(server.url, template=self.template), records, results,
+                io.StringIO(), processes=0, chunk_size=4,
+                checkpoint=checkpoint,
+            )
+        checkpoint.close()
+        self.assertEqual(stats['results'], 6)
+        self.assertEqual(
+            sorted(result['index'] for result in self.lines(results)),
+            [3, 4, 6, 7, 8, 9],
+        )
+        checkpoint = Checkpoint(path)
+        self.assertEqual(len(checkpoint), 10)
+        checkpoint.close()
+
+    def test_checkpoint_retries_errors(self):
+        """Test that records with errors are retried by a resumed run."""
+        path = self.path('checkpoint')
+        records = [{'symbol': symbol, 'count': 1}
+                   for symbol in ['A', 'FAIL', 'B']]
+        with stub_server(fault_reply) as server:
+            checkpoint = Checkpoint(path)
+            stats = run(
+                Job(server.url, template=self.template), records,
+                io.StringIO(), io.StringIO(), processes=0,
+                checkpoint=checkpoint,
+            )
+            checkpoint.close()
+            self.assertEqual((stats['results'], stats['errors']), (2, 1))
+            checkpoint = Checkpoint(path)
+            self.assertEqual(
+                [index for index in range(3) if index in checkpoint], [0, 2],
+            )
+            errors = io.StringIO()
+            stats = run(
+                Job(server.url, template=self.template), records,
+                io.StringIO(), errors, processes=0, checkpoint=checkpoint,
+            )
+            checkpoint.close()
+        self.assertEqual(stats['skipped'], 2)
+        self.assertEqual([error['index'] for error in self.lines(errors)], [1])
+
+    def test_job_requires_source(self):
+        """Test that a job needs a template or a WSDL operation."""
+        self.assertRaises(ValueError, Job, 'http://example.com')
+        self.assertRaises(
+            ValueError, Job, 'http://example.com', operation='Get',
+        )
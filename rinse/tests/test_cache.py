@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Unit tests for rinse.cache module."""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import requests
+from lxml import etree
+from rinse.cache import (
+    CachedWSDL, DiskBackend, DiskCache, MemoryBackend, ResponseCache,
+    canonical_digest,
+)
+from rinse.client import SoapClient
+from rinse.message import SoapMessage
+from rinse.wsa import append_wsa_headers
+from rinse.wsdl import WSDL
+
+from .utils import gzip_echo_reply, stub_server
+
+WSDL_TEMPLATE = b'''<?xml version="1.0"?>
+<wsdl:definitions xmlns:wsdl="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+    xmlns:tns="http://example.com/test"
+    targetNamespace="http://example.com/test">
+  <wsdl:types>
+    <xsd:schema targetNamespace="http://example.com/test"
+        elementFormDefault="qualified">
+      <xsd:element name="%s" type="xsd:int"/>
+    </xsd:schema>
+  </wsdl:types>
+</wsdl:definitions>
+'''
+NS_TEST = 'http://example.com/test'
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        self.wsdl_path = os.path.join(self.directory, 'test.wsdl')
+        self.write_wsdl(b'count')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_wsdl(self, name, mtime=1000000000):
+        with open(self.wsdl_path, 'wb') as wsdl_file:
+            wsdl_file.write(WSDL_TEMPLATE % name)
+        os.utime(self.wsdl_path, (mtime, mtime))
+
+    def assertValidates(self, wsdl, name):
+        body = etree.Element('{%s}%s' % (NS_TEST, name))
+        body.text = '42'
+        self.assertTrue(wsdl.xsd_validator.is_valid(body))
+
+    def test_file(self):
+        """Test that WSDL from file is cached between cache instances."""
+        cache = DiskCache(self.cache_dir)
+        wsdl = WSDL.from_file(self.wsdl_path, cache=cache)
+        self.assertNotIsInstance(wsdl, CachedWSDL)
+        self.assertEqual(cache.stats['misses'], 1)
+
+        # a new instance (as in another process) reuses the extracted schema
+        cache = DiskCache(self.cache_dir)
+        wsdl = WSDL.from_file(self.wsdl_path, cache=cache)
+        self.assertIsInstance(wsdl, CachedWSDL)
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertNotIn('root', wsdl.__dict__)
+        self.assertValidates(wsdl, 'count')
+
+        # same content with new mtime is revalidated by content hash
+        self.write_wsdl(b'count', mtime=1000000001)
+        wsdl = WSDL.from_file(self.wsdl_path, cache=cache)
+        self.assertIsInstance(wsdl, CachedWSDL)
+        self.assertEqual(cache.stats['hits'], 2)
+
+        # changed content is a cache miss
+        self.write_wsdl(b'total', mtime=1000000002)
+        wsdl = WSDL.from_file(self.wsdl_path, cache=cache)
+        self.assertEqual(cache.stats['misses'], 1)
+        self.assertValidates(wsdl, 'total')
+
+    def test_relative_path(self):
+        """Test that files are keyed by absolute path."""
+        cache = DiskCache(self.cache_dir)
+        cache.fetch(self.wsdl_path)
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, cwd)
+        self.assertEqual(cache.fetch('test.wsdl'), WSDL_TEMPLATE % b'count')
+        self.assertEqual(cache.stats['hits'], 1)
+
+    def test_interleaved_writes(self):
+        """Test that metadata always refers to its own content."""
+        cache = DiskCache(self.cache_dir, max_age=60)
+        cache.fetch(self.wsdl_path)
+        meta_path = [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir) if name.endswith('.json')
+        ][0]
+        with open(meta_path, 'rb') as meta_file:
+            old_meta = meta_file.read()
+        self.write_wsdl(b'total', mtime=1000000001)
+        DiskCache(self.cache_dir).fetch(self.wsdl_path)
+        # metadata of the old content is written last by another process
+        with open(meta_path, 'wb') as meta_file:
+            meta_file.write(old_meta)
+        content = cache.fetch(self.wsdl_path)
+        self.assertEqual(content, WSDL_TEMPLATE % b'count')
+        self.assertEqual(
+            hashlib.sha256(content).hexdigest(),
+            json.loads(old_meta.decode('utf-8'))['sha256'],
+        )
+
+    def test_url(self):
+        """Test that WSDL from URL is revalidated using ETag."""
+        def get(headers):
+            if headers.get('If-None-Match') == '"v1"':
+                return 304, {}, b''
+            return 200, {'ETag': '"v1"'}, WSDL_TEMPLATE % b'count'
+
+        with stub_server(get=get) as server:
+            for _ in range(2):
+                cache = DiskCache(self.cache_dir)
+                wsdl = WSDL.from_url(server.url, cache=cache)
+                self.assertValidates(wsdl, 'count')
+            self.assertEqual(cache.stats['hits'], 1)
+            self.assertEqual(server.requests[1][0]['If-None-Match'], '"v1"')
+
+            # no revalidation within max_age
+            cache = DiskCache(self.cache_dir, max_age=60)
+            self.assertEqual(cache.fetch(server.url), WSDL_TEMPLATE % b'count')
+            self.assertEqual(len(server.requests), 2)
+
+    def test_url_timeout(self):
+        """Test that URLs are fetched with the cache timeout."""
+        def get(headers):
+            time.sleep(0.5)
+            return 200, {}, WSDL_TEMPLATE % b'count'
+
+        with stub_server(get=get) as server:
+            cache = DiskCache(self.cache_dir, timeout=0.1)
+            self.assertRaises(
+                requests.exceptions.Timeout, cache.fetch, server.url,
+            )
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def message(self, message_id, symbol='ACME'):
+        msg = SoapMessage(etree.Element('quote', symbol=symbol))
+        append_wsa_headers(
+            msg, 'http://example.com/', 'urn:quote', message_id=message_id,
+        )
+        return msg
+
+    def test_digest(self):
+        """Test that volatile headers don't change the digest."""
+        first, second = (
+            self.message('uuid:{}'.format(index)).tostring()
+            for index in range(2)
+        )
+        self.assertNotEqual(first, second)
+        self.assertEqual(canonical_digest(first), canonical_digest(second))
+        self.assertNotEqual(
+            canonical_digest(first),
+            canonical_digest(self.message('uuid:0', 'INIT').tostring()),
+        )
+
+    def test_memory_lru(self):
+        """Test that the least recently used entries are evicted."""
+        backend = MemoryBackend(max_bytes=25)
+        expires = time.time() + 60
+        for key in 'abc':
+            backend.set(key, b'0123456789', expires)
+        self.assertEqual(len(backend), 2)
+        self.assertIsNone(backend.get('a'))
+        self.assertEqual(backend.get('b'), b'0123456789')
+        backend.set('d', b'0123456789', expires)
+        self.assertIsNone(backend.get('c'))
+        self.assertIsNotNone(backend.get('b'))
+        self.assertEqual(backend.stats['evictions'], 2)
+        backend.set('e', b'x', time.time() - 1)
+        self.assertIsNone(backend.get('e'))
+        self.assertEqual(backend.stats['expired'], 1)
+        self.assertEqual(backend.size, 20)
+
+    def test_disk_lru(self):
+        """Test that disk entries are shared, expire and are evicted."""
+        backend = DiskBackend(self.directory, max_bytes=150)
+        expires = time.time() + 60
+        backend.set('a', b'x' * 40, expires)
+        backend.set('b', b'y' * 40, expires)
+        for mtime, key in enumerate('ab'):
+            path = os.path.join(self.directory, key + '.response')
+            os.utime(path, (mtime, mtime))
+        self.assertEqual(DiskBackend(self.directory).get('a'), b'x' * 40)
+        backend.set('c', b'z' * 40, expires)  # evicts b (a used since)
+        self.assertEqual(backend.stats['evictions'], 1)
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('a'), b'x' * 40)
+        backend.set('d', b'old', time.time() - 1)
+        self.assertIsNone(backend.get('d'))
+        self.assertEqual(len(backend), 2)
+        backend.clear()
+        self.assertEqual((len(backend), backend.size), (0, 0))
+
+    def test_client(self):
+        """Test that opted in actions are answered from the cache."""
+        for backend in (MemoryBackend(), DiskBackend(self.directory)):
+            cache = ResponseCache({'urn:quote': 60}, backend)
+            with stub_server(gzip_echo_reply, keep_alive=True) as server:
+                client = SoapClient(
+                    server.url, response_cache=cache, compress='gzip',
+                )
+                for index in range(3):
+                    response = client(self.message(index), 'urn:quote')
+                    self.assertEqual(response.body[0].get('symbol'), 'ACME')
+                self.assertEqual(len(server.requests), 1)
+                client(self.message(3, 'INIT'), 'urn:quote')
+                client(self.message(4), 'urn:other')
+                client(self.message(5), 'urn:other')
+                self.assertEqual(len(server.requests), 4)
+            self.assertEqual(cache.stats['hits'], 2)
+            self.assertEqual(cache.stats['misses'], 2)
+            self.assertEqual(cache.hit_rate(), 0.5)
+            self.assertEqual(response.headers['Content-Type'], 'text/xml')
+            self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_errors_not_cached(self):
+        """Test that unsuccessful responses are not cached."""
+        cache = ResponseCache({'urn:quote': 60})
+        with stub_server(lambda body: (500, {}, b'<fault/>')) as server:
+            client = SoapClient(server.url, response_cache=cache)
+            for index in range(2):
+                client(self.message(index), 'urn:quote')
+            self.assertEqual(len(server.requests), 2)
+        self.assertEqual(len(cache.backend), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,14 +2,29 @@
 # -*- coding: utf-8 -*-
 """Unit tests for rinse.client module."""
 
+import base64
+import os.path
+import threading
+import time
 import unittest
+import zlib
 
+import requests
+import six
 from lxml import etree
 from mock import MagicMock, patch
-from rinse.client import SoapClient
-from rinse.message import SoapMessage
+from rinse.capture import WireCapture
+from rinse.client import Hedge, SoapClient
+from rinse.message import PreparedMessage, SoapMessage
+from rinse.metrics import Histogram
+from rinse.util import safe_parse_string
+from rinse.wsa import NS_WSA, WsaHeaders
+from rinse.wsdl import WSDL
+from rinse.wsse import NS_WSSE, NS_WSU, WsseHeaders, password_digest
 
-from .utils import captured_stdout
+from .utils import captured_stderr, echo_reply, gzip_echo_reply, stub_server
+
+NS_XSD1 = 'http://example.com/stockquote.xsd'
 
 
 class TestSoapMessage(unittest.TestCase):
@@ -34,6 +49,98 @@ class TestSoapMessage(unittest.TestCase):
         self.assertTrue('SOAPAction' not in req.headers)
 
 
+class TestStreamingMessage(unittest.TestCase):
+    def test_chunked(self):
+        """Test that streamed messages are sent using chunked encoding."""
+        msg = SoapMessage(
+            etree.Element('row', id=str(index)) for index in range(10000)
+        )
+        msg.stream = True
+        with stub_server() as server:
+            client = SoapClient(server.url)
+            client(msg, build_response=lambda r: r)
+        headers, body = server.requests[0]
+        self.assertEqual(headers['Transfer-Encoding'], 'chunked')
+        doc = etree.fromstring(body)
+        self.assertEqual(len(doc[1]), 10000)
+        self.assertEqual(doc[1][-1].get('id'), '9999')
+
+    def test_write(self):
+        """Test that write() matches tostring()."""
+        msg = SoapMessage(etree.Element('test'))
+        output = six.BytesIO()
+        msg.write(output)
+        self.assertEqual(
+            etree.tostring(etree.fromstring(output.getvalue())),
+            msg.tostring(),
+        )
+
+
+class TestPreparedMessage(unittest.TestCase):
+    def message(self, count=None, name=None):
+        msg = SoapMessage()
+        tst = msg.elementmaker('tst', 'http://example.com/test')
+        msg.body = tst.Lookup(
+            tst.count(count or msg.slot('count', int)),
+            name=name or msg.slot('name'),
+        )
+        return msg
+
+    def test_same_as_message(self):
+        """Test that bound message is identical to the regular message."""
+        prepared = PreparedMessage(self.message())
+        self.assertEqual(
+            bytes(prepared.bind(count=3, name='a&b')),
+            self.message('3', 'a&b').tostring(
+                pretty_print=True, encoding='utf-8',
+            ),
+        )
+
+    def test_missing_value(self):
+        """Test that every slot requires a value."""
+        msg = SoapMessage(etree.Element('test', id=SoapMessage().slot('id')))
+        with self.assertRaises(ValueError):
+            PreparedMessage(msg)
+        msg.slot('id')
+        with self.assertRaises(ValueError):
+            PreparedMessage(msg).bind()
+
+    def test_lexical_values(self):
+        """Test that slot values are converted to their lexical forms."""
+        msg = SoapMessage()
+        tst = msg.elementmaker('tst', 'http://example.com/test')
+        msg.body = tst.Values(
+            tst.flag(msg.slot('flag', bool)),
+            tst.num(msg.slot('num', float)),
+            tst.count(msg.slot('count', int)),
+        )
+        prepared = PreparedMessage(msg)
+        body = prepared.bind(flag='false', num='-INF', count=4).etree()[1][0]
+        self.assertEqual(
+            [child.text for child in body], ['false', '-INF', '4'],
+        )
+        body = prepared.bind(flag=True, num=float('nan'), count='5').etree()
+        self.assertEqual(
+            [child.text for child in body[1][0]], ['true', 'NaN', '5'],
+        )
+        self.assertRaises(
+            ValueError, prepared.bind, flag='no', num=1.0, count=1,
+        )
+        self.assertRaises(
+            ValueError, prepared.bind, flag=True, num=1.0, count=None,
+        )
+
+    def test_request(self):
+        """Test that bound messages are posted with SOAPAction."""
+        msg = SoapMessage(etree.Element('test', id='x'))
+        bound = PreparedMessage(msg).bind()
+        req = bound.request('http://example.com', 'testaction')
+        self.assertEqual(req.headers['SOAPAction'], 'testaction')
+        self.assertEqual(req.data, msg.tostring(
+            pretty_print=True, encoding='utf-8',
+        ))
+
+
 class TestRinseClient(unittest.TestCase):
     def test_soap_action(self):
         """Test that SOAP action is passed on to SoapMessage.request()."""
@@ -46,26 +153,23 @@ class TestRinseClient(unittest.TestCase):
                                                 'testaction')
 
     def test_soap_action_debug(self):
+        """Test that debug writes each exchange to stderr."""
         msg = SoapMessage(etree.Element('test'))
-        client = SoapClient('http://example.com', debug=True)
-        client._session = MagicMock()
-        with captured_stdout() as stdout:
-            client(msg, 'testaction', build_response=lambda r: r)
-        self.assertEqual(
-            stdout.getvalue(),
-            'POST http://example.com\n'
-            'Content-Length: 164\n'
-            'Content-Type: text/xml;charset=UTF-8\n'
-            'SOAPAction: testaction\n'
-            '\n'
-            '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">\n'
-            '  <soapenv:Header/>\n'
-            '  <soapenv:Body>\n'
-            '    <test/>\n'
-            '  </soapenv:Body>\n'
-            '</soapenv:Envelope>\n'
-            '\n'
-        )
+        with stub_server() as server:
+            client = SoapClient(server.url, debug=True)
+            with captured_stderr() as stderr:
+                client(msg, 'testaction', build_response=lambda r: r)
+            client.debug = False
+            with captured_stderr() as quiet:
+                client(msg, 'testaction', build_response=lambda r: r)
+                self.assertEqual(quiet.getvalue(), '')
+                client(msg, 'other', build_response=lambda r: r, debug=True)
+        output = stderr.getvalue()
+        self.assertIn(' POST {} (testaction)\n'.format(server.url), output)
+        self.assertIn('SOAPAction: testaction\n', output)
+        self.assertIn('    <test/>\n', output)
+        self.assertIn('\n200 (', output)
+        self.assertIn('(other)', quiet.getvalue())
 
     def test_no_soap_action(self):
         """Test that empty SOAP action is passed to SoapMessage.request()
@@ -96,5 +200,464 @@ class TestRinseClient(unittest.TestCase):
             self.assertEqual(client._session.send.call_args[1]['timeout'], None)
 
 
+class TestSoapClientMap(unittest.TestCase):
+    def messages(self, count):
+        return (
+            SoapMessage(etree.Element('msg{}'.format(index)))
+            for index in range(count)
+        )
+
+    def body_tag(self, resp):
+        doc = etree.fromstring(resp.content)
+        return doc[0][0].tag
+
+    def test_ordered(self):
+        """Test that results are yielded in input order."""
+        with stub_server() as server:
+            client = SoapClient(server.url)
+            results = list(client.map(
+                self.messages(50), 'testaction', concurrency=4,
+                build_response=self.body_tag,
+            ))
+        self.assertEqual(results, ['msg{}'.format(i) for i in range(50)])
+        self.assertEqual(len(server.requests), 50)
+        self.assertEqual(server.requests[0][0]['SOAPAction'], 'testaction')
+
+    def test_unordered(self):
+        """Test that (index, result) pairs are yielded as completed."""
+        with stub_server() as server:
+            client = SoapClient(server.url)
+            results = list(client.map(
+                self.messages(50), concurrency=4, ordered=False,
+                build_response=self.body_tag,
+            ))
+        self.assertEqual(
+            sorted(results),
+            sorted((i, 'msg{}'.format(i)) for i in range(50)),
+        )
+
+    def test_errors_as_values(self):
+        """Test that a failing message doesn't abort the batch."""
+        def build_response(resp):
+            tag = self.body_tag(resp)
+            if tag == 'msg3':
+                raise ValueError(tag)
+            return tag
+
+        with stub_server() as server:
+            client = SoapClient(server.url)
+            results = list(client.map(
+                self.messages(5), concurrency=2,
+                build_response=build_response,
+            ))
+        self.assertIsInstance(results[3], ValueError)
+        self.assertEqual(results[4], 'msg4')
+
+    def test_shared_adapters(self):
+        """Test that thread sessions share client connection pools."""
+        client = SoapClient('http://example.com')
+        session = client._thread_session()
+        self.assertIsNot(session, client._session)
+        self.assertIs(session.adapters, client._session.adapters)
+
+
+class TestConnectionPool(unittest.TestCase):
+    def call(self, client, count=3):
+        for _ in range(count):
+            client(SoapMessage(etree.Element('test')),
+                   build_response=lambda r: r.content)
+
+    def test_reused(self):
+        """Test that connections are kept alive and counted."""
+        with stub_server(keep_alive=True) as server:
+            client = SoapClient(server.url)
+            self.call(client)
+        self.assertEqual(client.pool_stats['connections_created'], 1)
+        self.assertEqual(client.pool_stats['connections_reused'], 2)
+        self.assertEqual(client.pool_stats['pool_exhausted'], 0)
+
+    def test_no_keep_alive(self):
+        """Test that keep_alive=False uses a connection per call."""
+        with stub_server(keep_alive=True) as server:
+            client = SoapClient(server.url, keep_alive=False)
+            self.call(client)
+        self.assertEqual(server.requests[0][0]['Connection'], 'close')
+        self.assertEqual(client.pool_stats['connections_created'], 3)
+        self.assertEqual(client.pool_stats['connections_reused'], 0)
+
+    def test_block(self):
+        """Test that a blocking pool limits connections per host."""
+        with stub_server(keep_alive=True) as server:
+            client = SoapClient(server.url, pool_maxsize=2, pool_block=True)
+            list(client.map(
+                (SoapMessage(etree.Element('test')) for _ in range(20)),
+                concurrency=6, build_response=lambda r: r.content,
+            ))
+        self.assertEqual(client.pool_stats['connections_created'], 2)
+        self.assertGreater(client.pool_stats['pool_exhausted'], 0)
+        self.assertGreater(client.pool_stats['wait_time'], 0)
+
+
+class TestObservers(unittest.TestCase):
+    def test_phases(self):
+        """Test that observers are passed timings of each phase."""
+        timings = []
+        histogram = Histogram()
+        wsdl = WSDL.from_file(
+            os.path.join(os.path.dirname(__file__), 'res', 'stockquote.wsdl'),
+        )
+        with stub_server() as server:
+            client = SoapClient(
+                server.url, wsdl=wsdl, validate=True,
+                observers=[timings.append, histogram],
+            )
+            response = client.operations['GetLastTradePrice'](
+                etree.Element('{%s}tickerSymbol' % NS_XSD1),
+            )
+        self.assertEqual(
+            [timing.phase for timing in timings],
+            ['validate', 'build', 'serialize', 'prepare', 'send'],
+        )
+        self.assertEqual(len(response.body), 1)
+        self.assertEqual(timings[-1].phase, 'parse')
+        self.assertEqual(
+            {timing.action for timing in timings},
+            {'http://example.com/GetLastTradePrice'},
+        )
+        self.assertEqual(timings[0].endpoint, server.url)
+        snapshot = histogram.snapshot()
+        self.assertEqual(len(snapshot), 6)
+        key = ('send', 'http://example.com/GetLastTradePrice', server.url)
+        self.assertEqual(snapshot[key]['count'], 1)
+        self.assertIn('phase="parse"', histogram.exposition())
+
+    def test_duck_typed_message(self):
+        """Test that messages need not accept phases to be timed."""
+        class Message(object):
+            def request(self, url, action):
+                return requests.Request(
+                    'POST', url, data=SoapMessage().tostring(),
+                    headers={'SOAPAction': action},
+                )
+
+        timings = []
+        with stub_server() as server:
+            client = SoapClient(server.url, observers=[timings.append])
+            status = client(
+                Message(), 'urn:test', build_response=lambda r: r.status_code,
+            )
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            [timing.phase for timing in timings],
+            ['build', 'prepare', 'send', 'parse'],
+        )
+
+    def test_validate_requires_wsdl(self):
+        """Test that validation can only be enabled with a WSDL."""
+        self.assertRaises(
+            ValueError, SoapClient, 'http://example.com', validate=True,
+        )
+
+
+class TestCompression(unittest.TestCase):
+    def message(self, count):
+        msg = SoapMessage()
+        msg.body = etree.Element('items')
+        for index in range(count):
+            etree.SubElement(msg.body, 'item').text = str(index)
+        return msg
+
+    def test_compressed(self):
+        """Test that large requests are compressed, and responses parsed."""
+        with stub_server(gzip_echo_reply, keep_alive=True) as server:
+            client = SoapClient(server.url, compress='gzip')
+            response = client(self.message(500))
+            self.assertEqual(response.body[0].tag, 'items')
+            self.assertEqual(len(response.body[0]), 500)
+            response = client(self.message(1))
+            self.assertEqual(len(response.body[0]), 1)
+        (headers, body), (small_headers, small_body) = server.requests
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Accept-Encoding'], 'gzip, deflate')
+        self.assertEqual(int(headers['Content-Length']), len(body))
+        self.assertLess(len(body), len(zlib.decompress(body, 47)) // 4)
+        self.assertNotIn('Content-Encoding', small_headers)
+        self.assertTrue(small_body.startswith(b'<'))
+        self.assertEqual(client.pool_stats['connections_reused'], 1)
+
+    def test_streamed_content(self):
+        """Test that content of a streamed response is the body read."""
+        with stub_server(gzip_echo_reply) as server:
+            client = SoapClient(
+                server.url, compress='deflate', capture=WireCapture(),
+            )
+            response = client(self.message(10))
+            self.assertEqual(len(response.body[0]), 10)
+            self.assertIn(b'<item>9</item>', response.content)
+            unparsed = client(self.message(10))
+            self.assertIn(b'<item>9</item>', unparsed.content)
+            self.assertEqual(len(unparsed.body[0]), 10)
+        (_, body), _ = server.requests
+        self.assertEqual(response.content, echo_reply(body)[2])
+        self.assertEqual(unparsed.content, response.content)
+        exchanges = list(client.capture)
+        self.assertEqual(exchanges[0].response_body, response.content)
+        self.assertEqual(exchanges[1].as_dict()['response_body'],
+                         response.content)
+
+    def test_unparsed_released(self):
+        """Test that connections of unparsed responses are released."""
+        with stub_server(gzip_echo_reply, keep_alive=True) as server:
+            client = SoapClient(
+                server.url, compress='gzip', pool_maxsize=1, pool_block=True,
+                timeout=3,
+            )
+            for _ in range(3):
+                self.assertEqual(client(self.message(10)).status_code, 200)
+            response = client(self.message(10))
+            response.close()
+            self.assertEqual(client(self.message(10)).status_code, 200)
+        self.assertEqual(len(server.requests), 5)
+
+    def test_unsupported(self):
+        """Test that only gzip and deflate are supported."""
+        self.assertRaises(
+            ValueError, SoapClient, 'http://example.com', compress='br',
+        )
+
+
+class TestWireCapture(unittest.TestCase):
+    def call(self, client, tag='test'):
+        return client(
+            SoapMessage(etree.Element(tag)), 'urn:test',
+            build_response=lambda r: r.status_code,
+        )
+
+    def test_ring_buffer(self):
+        """Test that the last exchanges are kept, with raw bodies."""
+        with stub_server() as server:
+            client = SoapClient(server.url, capture=WireCapture(size=2))
+            for tag in ['a', 'b', 'c']:
+                self.call(client, tag)
+        exchanges = list(client.capture)
+        self.assertEqual(len(exchanges), 2)
+        self.assertIn(b'<b/>', exchanges[0].request_body)
+        self.assertIn(b'<c ', exchanges[1].response_body)
+        self.assertEqual(exchanges[1].status_code, 200)
+        self.assertEqual(exchanges[1].action, 'urn:test')
+        self.assertEqual(
+            exchanges[1].request_headers['SOAPAction'], 'urn:test',
+        )
+        self.assertGreater(exchanges[1].elapsed, 0)
+
+    def test_sample(self):
+        """Test that unsampled exchanges aren't captured."""
+        with stub_server() as server:
+            client = SoapClient(server.url, capture=WireCapture(sample=0))
+            self.call(client)
+        self.assertEqual(len(client.capture), 0)
+
+    def test_echo(self):
+        """Test that exchanges are written to echo as they complete."""
+        output = six.StringIO()
+        with stub_server() as server:
+            client = SoapClient(server.url, capture=WireCapture(echo=output))
+            self.call(client, 'a')
+            self.assertIn('<a/>', output.getvalue())
+            self.assertNotIn('<b/>', output.getvalue())
+            client(SoapMessage(etree.Element('b')), debug=True,
+                   build_response=lambda r: r.status_code)
+        self.assertIn('<b/>', output.getvalue())
+        self.assertEqual(len(client.capture), 2)
+
+    def test_dump_on_error(self):
+        """Test that exchanges are dumped on error responses and failures."""
+        output = six.StringIO()
+        capture = WireCapture(on_error=output)
+        with stub_server(lambda body: (500, {}, b'<fault/>')) as server:
+            client = SoapClient(server.url, capture=capture)
+            self.call(client)
+        self.assertIn('500', output.getvalue())
+        self.assertIn('<fault/>', output.getvalue())
+        output.truncate(0)
+
+        def build_response(resp):
+            raise ValueError('bad response')
+
+        with stub_server() as server:
+            client.url = server.url
+            with self.assertRaises(ValueError):
+                client(SoapMessage(etree.Element('test')),
+                       build_response=build_response)
+        self.assertIn("ValueError('bad response')", output.getvalue())
+        self.assertIsInstance(list(capture)[-1].error, ValueError)
+
+
+class TestHeaderProviders(unittest.TestCase):
+    def headers(self, body):
+        header = safe_parse_string(body)[0]
+        return {child.tag: child for child in header}
+
+    def test_wsa(self):
+        """Test that each message gets a new MessageID."""
+        msg = SoapMessage(etree.Element('test'))
+        with stub_server() as server:
+            client = SoapClient(server.url, header_providers=[WsaHeaders()])
+            client(msg, 'urn:test')
+            client(msg, 'urn:test')
+        self.assertEqual(msg.headers, [])
+        first, second = [self.headers(body) for _, body in server.requests]
+        self.assertEqual(first['{%s}To' % NS_WSA].text, server.url)
+        self.assertEqual(first['{%s}Action' % NS_WSA].text, 'urn:test')
+        self.assertNotEqual(
+            first['{%s}MessageID' % NS_WSA].text,
+            second['{%s}MessageID' % NS_WSA].text,
+        )
+
+    def test_wsse_digest(self):
+        """Test that digest tokens are reused until they nearly expire."""
+        now = [1420194600.0]
+        provider = WsseHeaders(
+            'user', 'secret', digest=True, ttl=60, clock=lambda: now[0],
+        )
+        msg = SoapMessage(etree.Element('test'))
+        with stub_server() as server:
+            client = SoapClient(server.url, header_providers=[provider])
+            client(msg)
+            now[0] += 30
+            client(msg)
+            now[0] += 20  # within the margin of 12 seconds before expiry
+            client(msg)
+        tokens = [
+            self.headers(body)['{%s}Security' % NS_WSSE]
+            for _, body in server.requests
+        ]
+        nonces = [token.findtext('.//{%s}Nonce' % NS_WSSE) for token in tokens]
+        self.assertEqual(nonces[0], nonces[1])
+        self.assertNotEqual(nonces[1], nonces[2])
+        created = tokens[2].findtext('.//{%s}Created' % NS_WSU)
+        self.assertEqual(created, '2015-01-02T10:30:50Z')
+        self.assertEqual(
+            tokens[2].findtext('.//{%s}Expires' % NS_WSU),
+            '2015-01-02T10:31:50Z',
+        )
+        self.assertEqual(
+            tokens[2].findtext('.//{%s}Password' % NS_WSSE),
+            password_digest(base64.b64decode(nonces[2]), created, 'secret'),
+        )
+
+    def test_prepared(self):
+        """Test that headers are added to bound messages."""
+        msg = SoapMessage(etree.Element('test', id=SoapMessage().slot('id')))
+        msg.slot('id')
+        msg.headers.append(etree.Element('existing'))
+        bound = PreparedMessage(msg).bind(id='x')
+        with stub_server() as server:
+            client = SoapClient(
+                server.url,
+                header_providers=[WsaHeaders(), WsseHeaders('u', 'p')],
+            )
+            client(bound, 'urn:test')
+            client(PreparedMessage(SoapMessage()).bind(), 'urn:test')
+        self.assertEqual(bound.headers, [])
+        for (_, body), tags in zip(server.requests, [['existing'], []]):
+            tags.extend([
+                '{%s}MessageID' % NS_WSA, '{%s}To' % NS_WSA,
+                '{%s}Action' % NS_WSA, '{%s}Security' % NS_WSSE,
+            ])
+            self.assertEqual(list(self.headers(body)), tags)
+        self.assertRaises(ValueError, client, object())
+
+
+class TestHedging(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.count = 0
+
+    def tearDown(self):
+        self.release.set()
+
+    def slow_first(self, body):
+        """Reply to the first request only when released."""
+        self.count += 1
+        if self.count == 1:
+            self.release.wait(5)
+        return echo_reply(body)
+
+    def call(self, client, action='urn:get'):
+        return client(
+            SoapMessage(etree.Element('get')), action,
+            build_response=lambda r: etree.fromstring(r.content)[0][0].tag,
+        )
+
+    def test_hedge_wins(self):
+        """Test that a slow call is answered by a duplicate request."""
+        with stub_server(self.slow_first) as server:
+            client = SoapClient(
+                server.url, hedges={'urn:get': Hedge(delay=0.05)},
+            )
+            self.assertEqual(self.call(client), 'get')
+            self.assertEqual(len(server.requests), 2)
+        self.assertEqual(client.stats['hedges'], 1)
+        self.assertEqual(client.stats['hedges_won'], 1)
+        self.assertEqual(client.latency.count('urn:get'), 1)
+
+    def test_not_hedged(self):
+        """Test that fast calls and other actions are not hedged."""
+        with stub_server() as server:
+            client = SoapClient(
+                server.url, hedges={'urn:get': Hedge(delay=5)},
+            )
+            self.call(client)
+            self.call(client, 'urn:put')
+            self.assertEqual(len(server.requests), 2)
+        self.assertEqual(client.stats['hedges'], 0)
+        self.assertEqual(client.latency.count('urn:get'), 1)
+        self.assertEqual(client.latency.count('urn:put'), 0)
+
+    def test_streamed_not_hedged(self):
+        """Test that streamed bodies are sent once, as they can't be copied."""
+        with stub_server(self.slow_first) as server:
+            client = SoapClient(
+                server.url, hedges={'urn:get': Hedge(delay=0.05)},
+            )
+            msg = SoapMessage(etree.Element('get'))
+            msg.stream = True
+            self.release.set()
+            client(msg, 'urn:get', build_response=lambda r: r.status_code)
+            self.assertEqual(len(server.requests), 1)
+        self.assertEqual(client.stats['hedges'], 0)
+
+    def test_map_not_queued(self):
+        """Test that calls aren't hedged while queued for a worker."""
+        def reply(body):
+            time.sleep(0.1)
+            return echo_reply(body)
+
+        with stub_server(reply) as server:
+            client = SoapClient(
+                server.url, hedges={'urn:get': Hedge(delay=0.5)},
+                hedge_workers=2,
+            )
+            results = list(client.map(
+                (SoapMessage(etree.Element('get')) for _ in range(12)),
+                'urn:get', concurrency=12,
+                build_response=lambda r: r.status_code,
+            ))
+            client.close()
+        self.assertEqual(results, [200] * 12)
+        self.assertEqual(client.stats['hedges'], 0)
+
+    def test_percentile(self):
+        """Test that the hedge delay follows recent latency percentiles."""
+        hedge = Hedge(percentile=90, min_samples=10, delay=1)
+        client = SoapClient('http://example.com', hedges={'urn:get': hedge})
+        self.assertEqual(hedge.delay_for(client.latency, 'urn:get'), 1)
+        for ms in range(20):
+            client.latency.record('urn:get', ms / 1000.0)
+        self.assertEqual(hedge.delay_for(client.latency, 'urn:get'), 0.017)
+        self.assertRaises(ValueError, Hedge)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Unit tests for rinse.codec module."""
+
+import datetime
+import decimal
+import os.path
+import sys
+import threading
+import unittest
+
+from lxml import etree
+from rinse.codec import (
+    Decoder, Encoder, Record, SchemaTypes, parse_date, parse_datetime,
+    parse_time,
+)
+from rinse.wsdl import WSDL
+
+WSDL_PATH = os.path.join(os.path.dirname(__file__), 'res', 'stockquote.wsdl')
+NS_XSD1 = 'http://example.com/stockquote.xsd'
+
+HISTORY = b'''<TradeHistory
+    xmlns="http://example.com/stockquote.xsd"
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <trade id="1">
+    <tickerSymbol>ACME</tickerSymbol>
+    <time>2015-01-02T10:30:00.25Z</time>
+    <price>12.50</price>
+    <volume>100</volume>
+    <final>true</final>
+    <note xsi:nil="true"/>
+  </trade>
+  <trade id="2">
+    <tickerSymbol>ACME</tickerSymbol>
+    <time>2015-01-02T10:31:00+10:00</time>
+    <price>12.75</price>
+    <volume>20000000000</volume>
+  </trade>
+</TradeHistory>'''
+
+DERIVED_XSD = b'''<xsd:schema
+    xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+    xmlns:z="urn:zoo" targetNamespace="urn:zoo"
+    elementFormDefault="qualified">
+  <xsd:complexType name="Animal">
+    <xsd:sequence>
+      <xsd:element name="name" type="xsd:string"/>
+    </xsd:sequence>
+    <xsd:attribute name="id" type="xsd:string"/>
+    <xsd:attribute name="legs" type="xsd:int"/>
+  </xsd:complexType>
+  <xsd:complexType name="Dog">
+    <xsd:complexContent>
+      <xsd:extension base="z:Animal">
+        <xsd:sequence>
+          <xsd:element name="breed" type="xsd:string"/>
+        </xsd:sequence>
+      </xsd:extension>
+    </xsd:complexContent>
+  </xsd:complexType>
+  <xsd:complexType name="Tagged">
+    <xsd:complexContent>
+      <xsd:restriction base="z:Animal">
+        <xsd:sequence>
+          <xsd:element name="name" type="xsd:string"/>
+        </xsd:sequence>
+        <xsd:attribute name="id" type="xsd:int" use="required"/>
+        <xsd:attribute name="legs" use="prohibited"/>
+      </xsd:restriction>
+    </xsd:complexContent>
+  </xsd:complexType>
+  <xsd:element name="zoo">
+    <xsd:complexType>
+      <xsd:sequence>
+        <xsd:element name="animal" type="z:Animal" maxOccurs="unbounded"/>
+      </xsd:sequence>
+    </xsd:complexType>
+  </xsd:element>
+  <xsd:element name="animal" type="z:Animal"/>
+</xsd:schema>'''
+
+ZOO = b'''<zoo xmlns="urn:zoo" xmlns:z="urn:zoo"
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <animal id="a" legs="4"><name>Generic</name></animal>
+  <animal xsi:type="z:Dog" id="b" legs="4">
+    <name>Rex</name><breed>Kelpie</breed>
+  </animal>
+  <animal xsi:type="z:Tagged" id="3"><name>Tag</name></animal>
+  <animal xsi:type="z:Unknown" id="c"><name>Who</name></animal>
+</zoo>'''
+
+
+class TestParsers(unittest.TestCase):
+    def test_datetime(self):
+        """Test that xsd:dateTime values keep fractions and timezones."""
+        value = parse_datetime('2015-01-02T10:30:00.25-05:30')
+        self.assertEqual(value.microsecond, 250000)
+        self.assertEqual(
+            value.utcoffset(), -datetime.timedelta(hours=5, minutes=30),
+        )
+        self.assertIsNone(parse_datetime('2015-01-02T10:30:00').tzinfo)
+        self.assertRaises(ValueError, parse_datetime, '2015-01-02')
+
+    def test_date_time(self):
+        """Test that xsd:date and xsd:time values are parsed."""
+        self.assertEqual(parse_date('2015-01-02'), datetime.date(2015, 1, 2))
+        self.assertEqual(parse_time('10:30:00'), datetime.time(10, 30))
+
+
+class TestDecoder(unittest.TestCase):
+    def setUp(self):
+        self.decoder = Decoder.from_wsdl(WSDL.from_file(WSDL_PATH))
+
+    def test_decode(self):
+        """Test that complex types are decoded to records of native values."""
+        history = self.decoder.decode(etree.fromstring(HISTORY))
+        self.assertIsInstance(history, Record)
+        self.assertEqual(len(history.trade), 2)
+        first, second = history.trade
+        self.assertEqual(first.id, 1)
+        self.assertEqual(first.tickerSymbol, 'ACME')
+        self.assertEqual(first.price, decimal.Decimal('12.50'))
+        self.assertEqual(first.volume, 100)
+        self.assertIs(first.final, True)
+        self.assertIsNone(first.note)
+        self.assertEqual(first.time.microsecond, 250000)
+        self.assertEqual(first.time.utcoffset(), datetime.timedelta(0))
+        self.assertEqual(second.volume, 20000000000)
+        self.assertIsNone(second.final)
+        self.assertEqual(
+            second.time.utcoffset(), datetime.timedelta(hours=10),
+        )
+        self.assertEqual(
+            list(second._asdict()),
+            ['tickerSymbol', 'time', 'price', 'volume', 'final', 'note', 'id'],
+        )
+
+    def test_records(self):
+        """Test that record classes use slots and default repeated fields."""
+        history = self.decoder.decode(etree.fromstring(
+            b'<TradeHistory xmlns="http://example.com/stockquote.xsd"/>',
+        ))
+        self.assertEqual(history.trade, [])
+        self.assertFalse(hasattr(history, '__dict__'))
+        self.assertRaises(AttributeError, setattr, history, 'other', 1)
+        other = self.decoder.decode(etree.fromstring(
+            b'<TradeHistory xmlns="http://example.com/stockquote.xsd"/>',
+        ))
+        self.assertEqual(history, other)
+        self.assertIs(type(history), type(other))
+
+    def test_types_cached(self):
+        """Test that types are compiled once and shared."""
+        types = self.decoder.types
+        trade = types.type('{http://example.com/stockquote.xsd}Trade')
+        history = types.element(
+            '{http://example.com/stockquote.xsd}TradeHistory',
+        )
+        self.assertIs(history.type.fields[0].type, trade)
+        self.assertRaises(KeyError, types.element, '{urn:missing}Element')
+
+    def test_concurrent_compile(self):
+        """Test that threads never use partly compiled types or decoders."""
+        wsdl = WSDL.from_file(WSDL_PATH)
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # switch threads mid-compilation
+        self.addCleanup(sys.setswitchinterval, interval)
+        for _ in range(50):
+            decoder = Decoder.from_wsdl(wsdl)
+            start = threading.Event()
+            results = []
+
+            def decode():
+                start.wait()
+                results.append(decoder.decode(etree.fromstring(HISTORY)))
+
+            threads = [threading.Thread(target=decode) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            start.set()
+            for thread in threads:
+                thread.join()
+            expected = decoder.decode(etree.fromstring(HISTORY))
+            self.assertEqual(results, [expected] * 8)
+
+
+
+class TestDerivedTypes(unittest.TestCase):
+    def setUp(self):
+        self.decoder = Decoder(SchemaTypes([etree.fromstring(DERIVED_XSD)]))
+
+    def test_xsi_type(self):
+        """Test that elements are decoded as their xsi:type."""
+        generic, dog, tagged, unknown = self.decoder.decode(
+            etree.fromstring(ZOO),
+        ).animal
+        self.assertEqual(type(generic).__name__, 'Animal')
+        self.assertEqual(type(dog).__name__, 'Dog')
+        self.assertEqual((dog.name, dog.breed, dog.legs), ('Rex', 'Kelpie', 4))
+        self.assertEqual(type(tagged).__name__, 'Tagged')
+        self.assertEqual(tagged.id, 3)
+        self.assertEqual(type(unknown).__name__, 'Animal')
+        self.assertEqual(unknown.name, 'Who')
+        dog = self.decoder.decode(etree.fromstring(
+            b'<animal xmlns="urn:zoo" xmlns:z="urn:zoo"'
+            b' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+            b' xsi:type="z:Dog"><name>Rex</name><breed>Kelpie</breed>'
+            b'</animal>',
+        ))
+        self.assertEqual(dog.breed, 'Kelpie')
+
+    def test_restricted_attributes(self):
+        """Test that restated attributes replace inherited attributes."""
+        tagged = self.decoder.types.type('{urn:zoo}Tagged')
+        self.assertEqual([field.name for field in tagged.attributes], ['id'])
+        self.assertFalse(tagged.attributes[0].optional)
+        self.assertEqual(tagged.record._fields, ('name', 'id'))
+
+
+class TestEncoder(unittest.TestCase):
+    def setUp(self):
+        self.wsdl = WSDL.from_file(WSDL_PATH)
+        self.encoder = Encoder.from_wsdl(self.wsdl)
+
+    def test_encode(self):
+        """Test that values are encoded in schema order as lexical forms."""
+        msg = self.encoder.message(
+            self.wsdl.operations['GetTradeHistory'],
+            {
+                'limit': None,
+                'since': parse_datetime('2015-01-02T10:30:00Z'),
+                'tickerSymbol': ('ACME', 'INIT'),
+                'adjusted': False,
+            },
+        )
+        body = msg.body
+        self.assertEqual(body.tag, '{%s}TradeHistoryRequest' % NS_XSD1)
+        self.assertEqual(body.get('adjusted'), 'false')
+        self.assertEqual(
+            [(etree.QName(child).localname, child.text) for child in body],
+            [
+                ('tickerSymbol', 'ACME'),
+                ('tickerSymbol', 'INIT'),
+                ('since', '2015-01-02T10:30:00+00:00'),
+            ],
+        )
+        self.assertTrue(self.wsdl.is_valid(msg))
+
+    def test_single_text(self):
+        """Test that text for a repeated element is a single value."""
+        element = self.encoder.encode(
+            '{%s}TradeHistoryRequest' % NS_XSD1,
+            {'tickerSymbol': 'ACME', 'since': datetime.datetime(2015, 1, 2)},
+        )
+        self.assertEqual(
+            [child.text for child in element.iterchildren(
+                '{%s}tickerSymbol' % NS_XSD1,
+            )],
+            ['ACME'],
+        )
+
+    def test_none_items(self):
+        """Test that None items of repeated elements aren't encoded as text."""
+        qname = '{%s}TradeHistoryRequest' % NS_XSD1
+        value = {
+            'tickerSymbol': ['A', None],
+            'since': datetime.date(2015, 1, 2),
+        }
+        self.assertRaises(ValueError, self.encoder.encode, qname, value)
+        self.encoder.types.element(qname).type.fields[0].nillable = True
+        encoder = Encoder(self.encoder.types)
+        element = encoder.encode(qname, value)
+        self.assertEqual(
+            element[1].get('{http://www.w3.org/2001/XMLSchema-instance}nil'),
+            'true',
+        )
+        self.assertEqual(element[2].text, '2015-01-02T00:00:00')
+        value['since'] = '2015-01-02'  # text is taken to be lexical
+        self.assertEqual(encoder.encode(qname, value)[2].text, '2015-01-02')
+        value['since'] = 20150102
+        self.assertRaises(ValueError, encoder.encode, qname, value)
+
+    def test_fraction(self):
+        """Test that non-integral values of integer types raise ValueError."""
+        qname = '{%s}TradeHistoryRequest' % NS_XSD1
+        value = {
+            'tickerSymbol': ['ACME'],
+            'since': datetime.datetime(2015, 1, 2),
+            'limit': decimal.Decimal('7.9'),
+        }
+        self.assertRaises(ValueError, self.encoder.encode, qname, value)
+        value['limit'] = decimal.Decimal('7.0')
+        element = self.encoder.encode(qname, value)
+        self.assertEqual(element[-1].text, '7')
+
+    def test_round_trip(self):
+        """Test that decoded records encode to equivalent elements."""
+        decoder = Decoder(self.encoder.types)
+        history = decoder.decode(etree.fromstring(HISTORY))
+        element = self.encoder.encode(
+            '{%s}TradeHistory' % NS_XSD1, history,
+        )
+        self.assertEqual(decoder.decode(element), history)
+        price = element.find('{%s}trade/{%s}price' % (NS_XSD1, NS_XSD1))
+        self.assertEqual(price.text, '12.50')
+        self.assertIsNone(element.find('.//{%s}note' % NS_XSD1))
+
+    def test_nillable(self):
+        """Test that None is encoded as xsi:nil for required elements."""
+        self.encoder.types.element('{%s}TradeHistoryRequest' % NS_XSD1) \
+            .type.fields[2].optional = False
+        element = self.encoder.encode(
+            '{%s}TradeHistoryRequest' % NS_XSD1,
+            {'tickerSymbol': ['ACME'], 'since': datetime.datetime(2015, 1, 2)},
+        )
+        limit = element[-1]
+        self.assertEqual(etree.QName(limit).localname, 'limit')
+        self.assertEqual(
+            limit.get('{http://www.w3.org/2001/XMLSchema-instance}nil'),
+            'true',
+        )
+
+    def test_concurrent_compile(self):
+        """Test that threads never use partly compiled encoders."""
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # switch threads mid-compilation
+        self.addCleanup(sys.setswitchinterval, interval)
+        history = Decoder(self.encoder.types).decode(etree.fromstring(HISTORY))
+        qname = '{%s}TradeHistory' % NS_XSD1
+        for _ in range(50):
+            encoder = Encoder(self.encoder.types)
+            start = threading.Event()
+            results = []
+
+            def encode():
+                start.wait()
+                results.append(etree.tostring(encoder.encode(qname, history)))
+
+            threads = [threading.Thread(target=encode) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            start.set()
+            for thread in threads:
+                thread.join()
+            expected = etree.tostring(encoder.encode(qname, history))
+            self.assertEqual(results, [expected] * 8)
+
+    def test_invalid(self):
+        """Test that missing and unknown fields raise ValueError."""
+        qname = '{%s}TradePriceRequest' % NS_XSD1
+        self.assertRaises(ValueError, self.encoder.encode, qname, {})
+        self.assertRaises(
+            ValueError, self.encoder.encode, qname,
+            {'tickerSymbol': 'ACME', 'ticker': 'ACME'},
+        )
+        element = self.encoder.encode(
+            qname,
+            {'tickerSymbol': 'ACME', 'date': datetime.date(2015, 1, 2)},
+        )
+        self.assertEqual(element[1].text, '2015-01-02')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Unit tests for rinse.mtom module."""
+
+import io
+import mmap
+import tempfile
+import unittest
+import zlib
+
+from lxml import etree
+from rinse.client import SoapClient
+from rinse.message import PreparedMessage, SoapMessage
+from rinse.mtom import (
+    XOP_INCLUDE, Attachment, MultipartBody, read_parts, split_parts,
+)
+
+from .utils import stub_server
+
+NS_DOC = 'http://example.com/doc'
+PDF = b'%PDF-1.4\r\n' + bytes(bytearray(range(256))) * 100
+
+
+def mtom_echo_reply(body):
+    """Echo a multipart request body as the (multipart) response."""
+    if not body.startswith(b'--'):
+        body = zlib.decompress(body, 47)
+    boundary = body[2:body.index(b'\r\n')].decode('utf-8')
+    return 200, {
+        'Content-Type': 'multipart/related; type="application/xop+xml"; '
+                        'boundary="{}"'.format(boundary),
+    }, body
+
+
+class TestMultipartBody(unittest.TestCase):
+    def body(self, *attachments):
+        return MultipartBody(b'<root/>', attachments, boundary='xyz')
+
+    def test_round_trip(self):
+        """Test that parts are split as they were joined."""
+        pdf = Attachment(PDF, 'application/pdf', 'pdf@test')
+        body = self.body(pdf, Attachment(io.BytesIO(b'\r\n--xy')))
+        content = b''.join(bytes(chunk) for chunk in body)
+        self.assertEqual(body.len, len(content))
+        parts = split_parts(content, 'xyz')
+        self.assertEqual(len(parts), 3)
+        self.assertEqual(parts[0].data, b'<root/>')
+        self.assertEqual(parts[1].content_id, 'pdf@test')
+        self.assertEqual(parts[1].content_type, 'application/pdf')
+        self.assertIsInstance(parts[1].data, memoryview)
+        self.assertEqual(parts[1].data, PDF)
+        self.assertEqual(parts[2].tobytes(), b'\r\n--xy')
+
+    def test_read_parts(self):
+        """Test that parts read in small chunks are spooled."""
+        body = self.body(Attachment(PDF, content_id='pdf@test'))
+        content = b''.join(bytes(chunk) for chunk in body)
+        for chunk_size in (1, 7, 4096):
+            parts = list(read_parts(
+                io.BytesIO(content), 'xyz', spool_size=1024,
+                chunk_size=chunk_size,
+            ))
+            self.assertEqual(
+                [part.content_id for part in parts],
+                ['root.message@rinse', 'pdf@test'],
+            )
+            self.assertEqual(parts[0].data.read(), b'<root/>')
+            self.assertEqual(parts[1].tobytes(), PDF)
+            for part in parts:
+                part.data.close()
+        parts = []
+        with self.assertRaises(ValueError):
+            parts.extend(read_parts(io.BytesIO(content[:-20]), 'xyz'))
+        for part in parts:
+            part.data.close()
+
+    def test_unknown_length(self):
+        """Test that streamed roots are sent without a length."""
+        body = MultipartBody(iter([b'<root/>']), [])
+        self.assertIsNone(body.len)
+        self.assertIn(b'<root/>', b''.join(body))
+
+    def test_mmap(self):
+        """Test that memory maps are sent as memoryview slices."""
+        with tempfile.TemporaryFile() as temp:
+            temp.write(PDF)
+            temp.flush()
+            region = mmap.mmap(temp.fileno(), 0, access=mmap.ACCESS_READ)
+            attachment = Attachment(region)
+            self.assertEqual(attachment.length(), len(PDF))
+            chunks = list(attachment.iter_chunks(chunk_size=1000))
+            self.assertIsInstance(chunks[0], memoryview)
+            self.assertEqual(b''.join(chunks), PDF)
+            del chunks
+            region.close()
+
+
+class TestMessage(unittest.TestCase):
+    def message(self, data):
+        msg = SoapMessage()
+        doc = msg.elementmaker('d', NS_DOC)
+        msg.body = doc.upload(doc.content(msg.attach(data, 'application/pdf')))
+        return msg
+
+    def test_round_trip(self):
+        """Test that attachments are sent and received without base64."""
+        with tempfile.TemporaryFile() as source:
+            source.write(PDF)
+            source.seek(0)
+            with stub_server(mtom_echo_reply) as server:
+                client = SoapClient(server.url, namespaces={'d': NS_DOC})
+                response = client(self.message(source))
+        headers, body = server.requests[0]
+        self.assertTrue(headers['Content-Type'].startswith(
+            'multipart/related; type="application/xop+xml"',
+        ))
+        self.assertEqual(int(headers['Content-Length']), len(body))
+        self.assertIn(PDF, body)
+        content = response.find('d:upload/d:content')
+        self.assertEqual(content[0].tag, XOP_INCLUDE)
+        attachment = response.attachment(content)
+        self.assertIsInstance(attachment.data, memoryview)
+        self.assertEqual(attachment.data, PDF)
+        self.assertEqual(attachment.content_type, 'application/pdf')
+
+    def test_streamed(self):
+        """Test that attachments of streamed responses are spooled."""
+        with stub_server(mtom_echo_reply) as server:
+            client = SoapClient(server.url, compress='gzip')
+            response = client(self.message(PDF))
+            self.assertEqual(len(response.attachments), 1)
+            attachment = list(response.attachments.values())[0]
+            self.assertEqual(attachment.data.read(), PDF)
+            attachment.data.close()
+        headers, _ = server.requests[0]
+        self.assertEqual(headers['Transfer-Encoding'], 'chunked')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+
+    def test_not_prepared(self):
+        """Test that messages with attachments can't be prepared."""
+        self.assertRaises(ValueError, PreparedMessage, self.message(PDF))
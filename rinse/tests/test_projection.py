@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Unit tests for rinse.projection module."""
+
+import array
+import datetime
+import decimal
+import math
+import unittest
+
+import requests
+from rinse.projection import Projection, numpy
+from rinse.response import Response
+
+from .utils import ECHO_ENVELOPE
+
+COLUMNS = {
+    'id': ('@id', int),
+    'symbol': 'x:tickerSymbol',
+    'time': ('x:time', 'dateTime'),
+    'price': ('x:price', decimal.Decimal),
+    'volume': ('x:volume', float),
+    'final': ('x:final', bool),
+}
+
+
+def make_response(*trades):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = ECHO_ENVELOPE % (
+        b'<history xmlns="urn:x">' + b''.join(
+            b'<trade id="%d"><tickerSymbol>%s</tickerSymbol>'
+            b'<time>2015-01-02T10:30:0%dZ</time><price>1.%d0</price>'
+            b'%s<final>%s</final></trade>' % trade
+            for trade in trades
+        ) + b'</history>'
+    )
+    return Response(resp)
+
+
+RESPONSES = [
+    make_response(
+        (1, b'ACME', 1, 1, b'<volume>100</volume>', b'true'),
+        (2, b'INIT', 2, 2, b'', b'0'),
+    ),
+    make_response((3, b'ACME', 3, 3, b'<volume>5</volume>', b'false')),
+]
+
+
+class TestProjection(unittest.TestCase):
+    def project(self, container='list'):
+        return Projection(
+            COLUMNS, rows='x:history/x:trade', namespaces={'x': 'urn:x'},
+            container=container,
+        )(RESPONSES)
+
+    def test_lists(self):
+        """Test that rows of all responses are projected into lists."""
+        columns = self.project()
+        self.assertEqual(list(columns), list(COLUMNS))
+        self.assertEqual(columns['id'], [1, 2, 3])
+        self.assertEqual(columns['symbol'], ['ACME', 'INIT', 'ACME'])
+        self.assertEqual(columns['time'][2].second, 3)
+        self.assertIsInstance(columns['time'][0], datetime.datetime)
+        self.assertEqual(columns['price'][1], decimal.Decimal('1.20'))
+        self.assertEqual(columns['volume'], [100.0, None, 5.0])
+        self.assertEqual(columns['final'], [True, False, False])
+
+    def test_single(self):
+        """Test that a single response gives one row without a rows path."""
+        columns = Projection(
+            {'count': 'count(x:history/x:trade)'},
+            namespaces={'x': 'urn:x'},
+        )(RESPONSES[0])
+        self.assertEqual(columns['count'], [2.0])
+
+    def test_number_results(self):
+        """Test that number and boolean XPath results fit typed columns."""
+        columns = Projection(
+            {
+                'count': ('count(x:history/x:trade)', int),
+                'mean': ('sum(x:history/x:trade/x:volume) div 4', float),
+                'total': ('sum(x:history/x:trade/x:volume)', 'decimal'),
+                'any': ('boolean(x:history/x:trade)', bool),
+                'none': ('boolean(x:history/x:none)', 'boolean'),
+            },
+            namespaces={'x': 'urn:x'},
+        )(RESPONSES[0])
+        self.assertEqual(columns['count'], [2])
+        self.assertIsInstance(columns['count'][0], int)
+        self.assertEqual(columns['mean'], [25.0])
+        self.assertEqual(columns['total'], [decimal.Decimal(100)])
+        self.assertEqual(columns['any'], [True])
+        self.assertEqual(columns['none'], [False])
+        projection = Projection(
+            {'half': ('count(x:history/x:trade) div 4', int)},
+            namespaces={'x': 'urn:x'},
+        )
+        self.assertRaises(ValueError, projection, RESPONSES[0])
+
+    def test_arrays(self):
+        """Test that numeric columns are packed into arrays."""
+        columns = self.project('array')
+        self.assertEqual(columns['id'], array.array('q', [1, 2, 3]))
+        self.assertEqual(columns['final'].typecode, 'b')
+        self.assertTrue(math.isnan(columns['volume'][1]))
+        self.assertEqual(columns['symbol'], ['ACME', 'INIT', 'ACME'])
+
+    def test_missing_int(self):
+        """Test that int columns can't be packed with missing values."""
+        projection = Projection(
+            {'volume': ('x:volume', int)}, rows='x:history/x:trade',
+            namespaces={'x': 'urn:x'}, container='array',
+        )
+        self.assertRaises(ValueError, projection, RESPONSES)
+
+    @unittest.skipIf(numpy is None, 'numpy not installed.')
+    def test_numpy(self):
+        """Test that columns are packed into numpy arrays."""
+        columns = self.project('numpy')
+        self.assertEqual(columns['id'].dtype, numpy.int64)
+        self.assertEqual(columns['symbol'].dtype, object)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Unit tests for rinse.response module."""
+
+import io
+import unittest
+
+from defusedxml import EntitiesForbidden
+from lxml import etree
+from rinse.client import SoapClient
+from rinse.message import SoapMessage
+from rinse.response import Response, StreamingResponse, compile_xpath
+from rinse.util import safe_iterparse
+
+from .utils import ECHO_ENVELOPE, stub_server
+
+ITEMS = ECHO_ENVELOPE % (
+    b'<results>' + b''.join(
+        b'<item><id>%d</id></item>' % index for index in range(2000)
+    ) + b'</results><trailer/>'
+)
+
+FAULT = ECHO_ENVELOPE.replace(
+    b'<soapenv:Body>',
+    b'<soapenv:Header><token>abc</token></soapenv:Header><soapenv:Body>',
+) % (
+    b'<soapenv:Fault><faultcode>soapenv:Server</faultcode>'
+    b'<faultstring>Boom</faultstring></soapenv:Fault>'
+)
+
+
+class TestResponse(unittest.TestCase):
+    def call(self, reply_body, **kwargs):
+        with stub_server(lambda body: (500, {'X-Test': 'yes'}, reply_body)) \
+                as server:
+            client = SoapClient(server.url, **kwargs)
+            return client(SoapMessage(etree.Element('test')))
+
+    def test_lazy(self):
+        """Test that status and headers are available without parsing."""
+        response = self.call(b'not xml')
+        self.assertIsInstance(response, Response)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.headers['x-test'], 'yes')
+        self.assertNotIn('doc', response.__dict__)
+        with self.assertRaises(etree.XMLSyntaxError):
+            response.body
+
+    def test_accessors(self):
+        """Test header, body and fault accessors."""
+        response = self.call(FAULT)
+        self.assertEqual(response.header[0].text, 'abc')
+        self.assertEqual(etree.QName(response.body).localname, 'Body')
+        self.assertEqual(response.fault.findtext('faultstring'), 'Boom')
+        self.assertIs(response.doc, response.body.getparent())
+
+    def test_query(self):
+        """Test XPath queries using the client namespace map."""
+        response = self.call(
+            ECHO_ENVELOPE % (
+                b'<m:r xmlns:m="urn:m"><m:i>1</m:i><m:i>2</m:i></m:r>'
+            ),
+            namespaces={'x': 'urn:m'},
+        )
+        self.assertEqual(response.find('x:r/x:i').text, '1')
+        self.assertEqual(
+            [i.text for i in response.findall('x:r/x:i')], ['1', '2'],
+        )
+        self.assertIsNone(response.find('x:missing'))
+        self.assertEqual(response.find('string(x:r/x:i[2])'), '2')
+        self.assertEqual(response.find('count(x:r/x:i)'), 2.0)
+        self.assertIs(response.find('boolean(x:missing)'), False)
+        self.assertEqual(
+            response.xpath('count(x:r/x:i[. > $n])', n=1), 1.0,
+        )
+        self.assertIs(
+            compile_xpath('x:r/x:i', response.namespaces),
+            compile_xpath('x:r/x:i', dict(response.namespaces)),
+        )
+
+
+class TestStreamingResponse(unittest.TestCase):
+    def call(self, reply_body=ITEMS):
+        with stub_server(lambda body: (200, {}, reply_body)) as server:
+            client = SoapClient(server.url)
+            return client(
+                SoapMessage(etree.Element('test')),
+                build_response=StreamingResponse,
+            )
+
+    def test_body_children(self):
+        """Test that direct children of soapenv:Body are yielded."""
+        with self.call() as response:
+            tags = [element.tag for element in response]
+        self.assertEqual(tags, ['results', 'trailer'])
+
+    def test_tag(self):
+        """Test that elements matching tag are yielded and freed."""
+        ids = []
+        with self.call() as response:
+            for element in response.iter_body('item'):
+                ids.append(int(element.findtext('id')))
+                # preceding items have been freed
+                self.assertLessEqual(
+                    len(list(element.itersiblings(preceding=True))), 1,
+                )
+        self.assertEqual(ids, list(range(2000)))
+
+    def test_entities_forbidden(self):
+        """Test that documents declaring entities are rejected."""
+        raw = io.BytesIO(
+            b'<!DOCTYPE r [<!ENTITY a "aaaa">]><r><b>&a;</b></r>',
+        )
+        with self.assertRaises(EntitiesForbidden):
+            list(safe_iterparse(raw))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Unit tests for rinse.util module."""
+
+import decimal
+import threading
+import time
+import unittest
+
+import lxml.builder
+from lxml import etree
+from rinse import ENVELOPE_XSD
+from rinse.util import ElementMaker, SchemaCache, element_as_tree
+
+
+class TestSchemaCache(unittest.TestCase):
+    def test_cached(self):
+        """Test that schemas are compiled once and then cached."""
+        cache = SchemaCache()
+        schema = cache[ENVELOPE_XSD]
+        self.assertIs(cache.get(ENVELOPE_XSD), schema)
+        self.assertIn(ENVELOPE_XSD, cache)
+        self.assertEqual(cache.stats['compiles'], 1)
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 1)
+        self.assertGreater(cache.stats['compile_time'], 0)
+
+    def test_single_flight(self):
+        """Test that concurrent misses compile the schema only once."""
+        cache = SchemaCache()
+        compile_schema = cache.compile
+        calls = []
+
+        def slow_compile(*args):
+            calls.append(args)
+            time.sleep(0.1)
+            return compile_schema(*args)
+
+        cache.compile = slow_compile
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(cache[ENVELOPE_XSD]),
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(schema is results[0] for schema in results))
+
+    def test_lru(self):
+        """Test that least recently used schemas are evicted."""
+        cache = SchemaCache(maxsize=2)
+        cache.compile = lambda xsd, xpath, namespaces: object()
+        cache['a']
+        cache['b']
+        cache['a']
+        cache['c']
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertEqual(cache.stats['evictions'], 1)
+
+
+class TestElementAsTree(unittest.TestCase):
+    def test_inherited_namespaces(self):
+        """Test that namespaces declared by ancestors are kept."""
+        doc = etree.fromstring(
+            '<a xmlns:x="urn:x"><b type="x:thing"><c/></b></a>',
+        )
+        tree = element_as_tree(doc[0])
+        self.assertIsNone(tree.getparent())
+        self.assertEqual(tree.nsmap, {'x': 'urn:x'})
+        self.assertEqual(etree.tostring(tree[0]), b'<c xmlns:x="urn:x"/>')
+        # original document is unchanged
+        self.assertEqual(len(doc[0]), 1)
+
+    def test_root(self):
+        """Test that root elements are not copied."""
+        doc = etree.fromstring('<a><b/></a>')
+        self.assertIs(element_as_tree(doc), doc)
+        self.assertIs(element_as_tree(doc.getroottree()), doc)
+
+
+class TestElementMaker(unittest.TestCase):
+    def setUp(self):
+        self.kwargs = {'namespace': 'urn:x', 'nsmap': {'x': 'urn:x'}}
+
+    def test_same_tree(self):
+        """Test that trees match those of lxml.builder.ElementMaker."""
+        trees = [
+            E.a(E.b('1'), 'tail', E.c(), {'k': 'v'}, 'more', id='2')
+            for E in [
+                ElementMaker(**self.kwargs),
+                lxml.builder.ElementMaker(**self.kwargs),
+            ]
+        ]
+        self.assertEqual(*[etree.tostring(tree) for tree in trees])
+
+    def test_conversion(self):
+        """Test that values are converted to text and None to xsi:nil."""
+        E = ElementMaker(**self.kwargs)
+        element = E.a(
+            E.int(42), E.float(0.5), E.decimal(decimal.Decimal('1.50')),
+            E.bool(False), E.bytes(b'abc'), E.nil(None), version=1,
+        )
+        self.assertEqual(
+            [child.text for child in element],
+            ['42', '0.5', '1.50', 'false', 'abc', None],
+        )
+        self.assertEqual(element.get('version'), '1')
+        self.assertEqual(
+            element[-1].get(
+                '{http://www.w3.org/2001/XMLSchema-instance}nil',
+            ),
+            'true',
+        )
+        self.assertRaises(TypeError, E.a, object())
+
+    def test_cached(self):
+        """Test that element factories are cached per tag."""
+        E = ElementMaker(**self.kwargs)
+        self.assertIs(E.a, E.a)
+        self.assertEqual(E('{urn:y}b').tag, '{urn:y}b')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Unit tests for rinse.wsdl module."""
+
+import copy
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+from rinse.cache import DiskCache
+from rinse.client import SoapClient
+from rinse.message import PreparedMessage
+from rinse.wsdl import NS_WSDL, NS_WSDL_SOAP, NS_WSDL_SOAP12, WSDL
+
+from .utils import stub_server
+
+WSDL_PATH = os.path.join(os.path.dirname(__file__), 'res', 'stockquote.wsdl')
+NS_XSD1 = 'http://example.com/stockquote.xsd'
+
+
+class TestOperations(unittest.TestCase):
+    def setUp(self):
+        self.wsdl = WSDL.from_file(WSDL_PATH)
+
+    def test_operations(self):
+        """Test that operations are indexed by name."""
+        operation = self.wsdl.operations['GetLastTradePrice']
+        self.assertEqual(
+            operation.soap_action, 'http://example.com/GetLastTradePrice',
+        )
+        self.assertEqual(operation.input, '{%s}TradePriceRequest' % NS_XSD1)
+        self.assertEqual(operation.output, '{%s}TradePrice' % NS_XSD1)
+        self.assertEqual(operation.endpoint, 'http://example.com/stockquote')
+        self.assertEqual(
+            sorted(self.wsdl.operations),
+            ['GetLastTradePrice', 'GetTradeHistory'],
+        )
+
+    def test_message(self):
+        """Test that operation messages have the input body element."""
+        msg = self.wsdl.operations['GetLastTradePrice'].message()
+        tns = msg.elementmaker('tns', NS_XSD1)
+        msg.body.append(tns.tickerSymbol('ACME'))
+        self.assertEqual(msg.body.tag, '{%s}TradePriceRequest' % NS_XSD1)
+        self.assertTrue(self.wsdl.is_valid(msg))
+
+    def test_validate_bound(self):
+        """Test that bound messages are validated by their Body."""
+        msg = self.wsdl.operations['GetLastTradePrice'].message()
+        tns = msg.elementmaker('tns', NS_XSD1)
+        msg.body.append(tns.tickerSymbol(msg.slot('symbol')))
+        prepared = PreparedMessage(msg)
+        self.wsdl.validate(prepared.bind(symbol='ACME'))
+        msg.body.append(tns.volume(msg.slot('volume', int)))
+        bound = PreparedMessage(msg).bind(symbol='ACME', volume=1)
+        self.assertFalse(self.wsdl.is_valid(bound))
+        self.assertRaises(etree.DocumentInvalid, self.wsdl.validate, bound)
+        msg.body = iter([msg.body])
+        self.assertRaises(ValueError, self.wsdl.validate, msg)
+
+    def test_client(self):
+        """Test that client operations post with the operation SOAPAction."""
+        with stub_server() as server:
+            client = SoapClient(server.url, wsdl=self.wsdl)
+            tag = client.operations['GetLastTradePrice'](
+                etree.Element('{%s}tickerSymbol' % NS_XSD1),
+                build_response=lambda r: etree.fromstring(r.content)[0][0].tag,
+            )
+        self.assertEqual(tag, '{%s}TradePriceRequest' % NS_XSD1)
+        self.assertEqual(
+            server.requests[0][0]['SOAPAction'],
+            'http://example.com/GetLastTradePrice',
+        )
+        self.assertEqual(
+            SoapClient(wsdl=self.wsdl).url, 'http://example.com/stockquote',
+        )
+
+    def services(self, price_url, history_url):
+        """Return WSDL binding each operation to its own service address.
+
+        A SOAP 1.2 port is listed first, and should be skipped.
+        """
+        root = etree.parse(WSDL_PATH).getroot()
+        binding = root.find('{%s}binding' % NS_WSDL)
+        history = copy.deepcopy(binding)
+        history.set('name', 'HistoryBinding')
+        binding.remove(binding[2])
+        history.remove(history[1])
+        binding.addnext(history)
+        service = root.find('{%s}service' % NS_WSDL)
+        service.remove(service[0])
+        for binding_name, address_ns, url in [
+                ('StockQuoteSoapBinding', NS_WSDL_SOAP12, 'http://soap12/'),
+                ('StockQuoteSoapBinding', NS_WSDL_SOAP, price_url),
+                ('HistoryBinding', NS_WSDL_SOAP, history_url),
+        ]:
+            port = etree.SubElement(
+                service, '{%s}port' % NS_WSDL,
+                name=binding_name + 'Port', binding='tns:' + binding_name,
+            )
+            etree.SubElement(port, '{%s}address' % address_ns, location=url)
+        return WSDL(root)
+
+    def test_endpoints(self):
+        """Test that operations are posted to their own endpoints."""
+        with stub_server() as price, stub_server() as history:
+            wsdl = self.services(price.url, history.url)
+            self.assertEqual(
+                wsdl.operations['GetLastTradePrice'].endpoint, price.url,
+            )
+            client = SoapClient(wsdl=wsdl)
+            for name in ['GetLastTradePrice', 'GetTradeHistory']:
+                client.operations[name](
+                    build_response=lambda r: r.status_code,
+                )
+        self.assertEqual(
+            [headers['SOAPAction'] for headers, _ in price.requests],
+            ['http://example.com/GetLastTradePrice'],
+        )
+        self.assertEqual(
+            [headers['SOAPAction'] for headers, _ in history.requests],
+            ['http://example.com/GetTradeHistory'],
+        )
+
+    def test_cached(self):
+        """Test that operations are stored in the disk cache."""
+        directory = tempfile.mkdtemp()
+        try:
+            WSDL.from_file(WSDL_PATH, cache=DiskCache(directory))
+            wsdl = WSDL.from_file(WSDL_PATH, cache=DiskCache(directory))
+            self.assertEqual(wsdl.operations, self.wsdl.operations)
+            self.assertNotIn('root', wsdl.__dict__)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
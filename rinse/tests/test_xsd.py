@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Unit tests for rinse.xsd module."""
+
+import os.path
+import unittest
+
+from lxml import etree
+from rinse.wsdl import WSDL
+from rinse.xsd import prune_schema
+
+WSDL_PATH = os.path.join(os.path.dirname(__file__), 'res', 'stockquote.wsdl')
+NS_XSD1 = 'http://example.com/stockquote.xsd'
+
+
+def xsd1(tag, *children, **attrib):
+    element = etree.Element('{%s}%s' % (NS_XSD1, tag), **attrib)
+    for child in children:
+        if isinstance(child, str):
+            element.text = child
+        else:
+            element.append(child)
+    return element
+
+
+class TestElementValidators(unittest.TestCase):
+    def setUp(self):
+        self.wsdl = WSDL.from_file(WSDL_PATH)
+        self.validator = self.wsdl.xsd_validator
+
+    def names(self, schema):
+        return [child.get('name') for child in schema]
+
+    def test_prune(self):
+        """Test that pruned schemas only include referenced components."""
+        schema = self.wsdl.schemas[0]
+        self.assertEqual(
+            self.names(prune_schema(schema, '{%s}TradePrice' % NS_XSD1)),
+            ['TradePrice'],
+        )
+        self.assertEqual(
+            self.names(prune_schema(schema, '{%s}TradeHistory' % NS_XSD1)),
+            ['TradeHistory', 'History', 'Trade'],
+        )
+        self.assertIsNone(prune_schema(schema, '{%s}Trade' % NS_XSD1))
+        self.assertIsNone(prune_schema(schema, '{urn:other}TradePrice'))
+
+    def test_valid(self):
+        """Test that valid documents only use the element schema."""
+        doc = xsd1('TradePrice', xsd1('price', '1.5'))
+        self.assertTrue(self.validator.is_valid(doc))
+        self.validator.validate(doc)
+        self.assertEqual(
+            list(self.validator._element_schemas),
+            ['{%s}TradePrice' % NS_XSD1],
+        )
+        self.assertNotIn('schema', self.validator.__dict__)
+
+    def test_invalid(self):
+        """Test that invalid documents are checked by the whole schema."""
+        doc = xsd1('TradePrice', xsd1('price', 'free'))
+        self.assertFalse(self.validator.is_valid(doc))
+        with self.assertRaises(etree.DocumentInvalid):
+            self.validator.validate(doc)
+        self.assertFalse(self.validator.is_valid(xsd1('Trade')))
+        self.assertIsNone(
+            self.validator.element_schema('{%s}Trade' % NS_XSD1),
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,12 @@
 import sys
+import threading
+import zlib
 from contextlib import contextmanager
 
 import six
+from lxml import etree
+from rinse.compression import compress
+from six.moves import BaseHTTPServer, socketserver
 
 
 @contextmanager
@@ -30,3 +35,121 @@ def captured_stdout():
        self.assertEqual(stdout.getvalue(), "hello\n")
     """
     return captured_output("stdout")
+
+
+def captured_stderr():
+    """
+    Capture the output of sys.stderr:
+
+       with captured_stderr() as stderr:
+           print("hello", file=sys.stderr)
+       self.assertEqual(stderr.getvalue(), "hello\n")
+    """
+    return captured_output("stderr")
+
+
+class StubSoapHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """Request handler replying to POST with `server.reply(body)`.
+
+    GET requests are answered by `server.get(headers)`.
+    """
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding') != 'chunked':
+            return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b';')[0], 16)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+            if not size:
+                return b''.join(chunks)
+
+    def do_POST(self):
+        body = self.read_body()
+        self.server.requests.append((dict(self.headers.items()), body))
+        self.send_reply(*self.server.reply(body))
+
+    def do_GET(self):
+        headers = dict(self.headers.items())
+        self.server.requests.append((headers, None))
+        self.send_reply(*self.server.get(headers))
+
+    def send_reply(self, status, headers, content):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        if self.close_connection and self.protocol_version >= 'HTTP/1.1':
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+ECHO_ENVELOPE = (
+    b'<soapenv:Envelope'
+    b' xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">'
+    b'<soapenv:Body>%s</soapenv:Body>'
+    b'</soapenv:Envelope>'
+)
+
+
+def echo_reply(body):
+    """Reply with the request body elements wrapped in a new envelope."""
+    request_body = etree.fromstring(body)[1]
+    return 200, {'Content-Type': 'text/xml'}, ECHO_ENVELOPE % b''.join(
+        etree.tostring(element) for element in request_body
+    )
+
+
+def gzip_echo_reply(body):
+    """Echo a (possibly compressed) request with a gzip compressed reply."""
+    if not body.startswith(b'<'):
+        body = zlib.decompress(body, 47)  # gzip or zlib (deflate) header
+    status, headers, content = echo_reply(body)
+    headers['Content-Encoding'] = 'gzip'
+    return status, headers, compress(content)
+
+
+class StubServer(socketserver.ThreadingTCPServer):
+
+    """Threaded server accepting bursts of concurrent connections."""
+
+    request_queue_size = 128
+
+
+@contextmanager
+def stub_server(reply=echo_reply, get=None, keep_alive=False):
+    """
+    Run a threaded HTTP server on localhost for the duration of the context.
+    Each POST is answered by `reply(body)` which returns a (status, headers,
+    content) tuple, and recorded as a (headers, body) tuple in
+    `server.requests`.  GET requests are answered by `get(headers)`.
+    Connections are kept alive (HTTP/1.1) if `keep_alive` is True.
+    """
+    handler = StubSoapHandler
+    if keep_alive:
+        handler = type(
+            'KeepAliveHandler', (StubSoapHandler,),
+            {'protocol_version': 'HTTP/1.1', 'disable_nagle_algorithm': True},
+        )
+    server = StubServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    server.requests = []
+    server.reply = reply
+    server.get = get
+    server.url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={'poll_interval': 0.01},
+    )
+    thread.daemon = True
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
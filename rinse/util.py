@@ -1,12 +1,17 @@
 """rinse SOAP client utility functions."""
 from __future__ import print_function
 import collections
+import concurrent.futures
+import copy
+import datetime
+import decimal
 import os.path
 import pprint
 import textwrap
+import threading
+import time
 
 import defusedxml.lxml
-import lxml.builder
 from lxml import etree
 
 RINSE_DIR = os.path.dirname(__file__)
@@ -18,15 +23,33 @@ NS_MAP = {
     'soapenv': NS_SOAPENV,
 }
 
+# high resolution timer (time.perf_counter is only available on Python 3.3+)
+timer = getattr(time, 'perf_counter', time.time)
 
-def element_as_tree(element):
-    """Convert an element from within an ElementTree to its own tree."""
-    # XXX: this is a crude hack, but it works - got any better ideas?
-    return safe_parse_string(
-        etree.tostring(
-            etree.ElementTree(element),
-        ),
+
+def element_as_tree(element, parser=None):
+    """Copy an element from within an ElementTree to be the root of its own tree.
+
+    Namespace declarations inherited from ancestors are declared on the new
+    root so that QName values in attributes (eg: type="tns:Foo") still
+    resolve.  The element is returned as is if already the root of a tree.
+    The new tree is associated with `parser` (if given) so that its resolvers
+    are used when the tree is compiled (eg: by lxml.etree.XMLSchema).
+    """
+    if isinstance(element, etree._ElementTree):
+        element = element.getroot()
+    if parser is not None:
+        makeelement = parser.makeelement
+    elif element.getparent() is None:
+        return element
+    else:
+        makeelement = etree.Element
+    root = makeelement(
+        element.tag, attrib=dict(element.attrib), nsmap=element.nsmap,
     )
+    root.text = element.text
+    root.extend(copy.deepcopy(child) for child in element)
+    return root
 
 
 def safe_parse_string(raw_xml, **kwargs):
@@ -34,6 +57,66 @@ def safe_parse_string(raw_xml, **kwargs):
     return defusedxml.lxml.fromstring(raw_xml, **kwargs)
 
 
+def resolve_qname(element, value):
+    """Resolve prefixed name `value` using namespaces in scope of element."""
+    prefix, _, localname = value.rpartition(':')
+    return etree.QName(element.nsmap.get(prefix or None), localname)
+
+
+def safe_iterparse(source, events=('end',), tag=None, **kwargs):
+    """Safely parse XML content from a file-like object incrementally.
+
+    Yields (event, element) tuples as lxml.etree.iterparse() does, but never
+    resolves entities or fetches network resources, and raises an exception
+    from defusedxml if the document declares any entities.
+    """
+    kwargs.setdefault('resolve_entities', False)
+    kwargs.setdefault('no_network', True)
+    context = etree.iterparse(source, events=events, tag=tag, **kwargs)
+    for event, element in context:
+        defusedxml.lxml.check_docinfo(element.getroottree())
+        yield event, element
+        break
+    for event, element in context:
+        yield event, element
+
+
+def safe_parse_file(source, **kwargs):
+    """Safely parse XML content read from a file-like object into an element.
+
+    The content is fed to the parser as it is read, so the whole document
+    is never held in memory as bytes.
+    """
+    return defusedxml.lxml.parse(source, **kwargs).getroot()
+
+
+class TeeReader(object):
+
+    """File-like wrapper of a binary stream keeping a copy of all it reads.
+
+    >>> import io
+    >>> from rinse.util import TeeReader, safe_parse_file
+    >>> reader = TeeReader(io.BytesIO(b'<a/>'))
+    >>> safe_parse_file(reader).tag, reader.getvalue()
+    ('a', b'<a/>')
+    """
+
+    def __init__(self, stream):
+        """Wrap stream."""
+        self.stream = stream
+        self.chunks = []
+
+    def read(self, *args):
+        """Read from the stream, keeping a copy of the data."""
+        data = self.stream.read(*args)
+        self.chunks.append(data)
+        return data
+
+    def getvalue(self):
+        """Return everything read so far (bytes)."""
+        return b''.join(self.chunks)
+
+
 def safe_parse_path(xml_path, **kwargs):
     """Safely parse XML content from path into an element tree."""
     return defusedxml.lxml.parse(xml_path, **kwargs)
@@ -44,35 +127,269 @@ def safe_parse_url(xml_url, **kwargs):
     return defusedxml.lxml.parse(xml_url, **kwargs)
 
 
-class ElementMaker(lxml.builder.ElementMaker):
+def format_float(value):
+    """Format a float as xsd:float and xsd:double (INF, -INF and NaN)."""
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return 'INF' if value > 0 else '-INF'
+    return repr(value)
+
+
+LEXICAL_FORMATTERS = {
+    bool: lambda value: 'true' if value else 'false',
+    int: str,
+    float: format_float,
+    decimal.Decimal: '{:f}'.format,
+    datetime.date: datetime.date.isoformat,
+    datetime.datetime: datetime.datetime.isoformat,
+    datetime.time: datetime.time.isoformat,
+}
+
+
+def lexical(value):
+    """Convert a Python value to its XML Schema lexical representation.
+
+    >>> from rinse.util import lexical
+    >>> import decimal
+    >>> lexical(True), lexical(42), lexical(decimal.Decimal('1E+2'))
+    ('true', '42', '100')
+    >>> lexical(float('inf')), lexical(float('nan'))
+    ('INF', 'NaN')
+    """
+    for cls in type(value).__mro__:
+        try:
+            return LEXICAL_FORMATTERS[cls](value)
+        except KeyError:
+            continue
+    return value
+
 
-    """Wrapper around lxml ElementMaker that casts ints as strings."""
+def parse_boolean(text):
+    """Parse xsd:boolean."""
+    text = text.strip()
+    if text in ('true', '1'):
+        return True
+    if text in ('false', '0'):
+        return False
+    raise ValueError('Invalid xsd:boolean {!r}.'.format(text))
 
-    def __getattr__(self, name):
-        """Return a lambda that parses int args as strings."""
-        _cls = super(ElementMaker, self).__getattr__(name)
 
-        def __cls_wraper(*args, **kwargs):
-            """Wrapper around Element class."""
-            return _cls(
-                *[
-                    str(arg) if isinstance(arg, int) else arg
-                    for arg
-                    in args
-                ],
-                **kwargs
-            )
-        return __cls_wraper
+def parse_float(text):
+    """Parse xsd:float and xsd:double."""
+    return float({'INF': 'inf', '-INF': '-inf'}.get(text.strip(), text))
+
+
+# parsers of text in XML Schema lexical representation (see lexical)
+LEXICAL_PARSERS = {
+    bool: parse_boolean,
+    float: parse_float,
+}
+
+
+NS_XSI = 'http://www.w3.org/2001/XMLSchema-instance'
+XSI_NIL = '{%s}nil' % NS_XSI
+
+# conversion of ElementMaker arguments to text (see also LEXICAL_FORMATTERS)
+TEXT_CONVERTERS = dict(LEXICAL_FORMATTERS)
+TEXT_CONVERTERS.update({
+    type(u''): None,  # already text
+    bytes: lambda value: value.decode('utf-8'),
+})
+
+
+class ElementMaker(object):
+
+    """Element factory converting values to their XML Schema lexical form.
+
+    Used like lxml.builder.ElementMaker: attributes are factories for
+    elements in `namespace`, and calling them with children (elements, text
+    or other values), dicts of attributes and keyword attributes returns an
+    element.  Values such as int, float, Decimal, bool, date, datetime and
+    bytes are converted to text (see TEXT_CONVERTERS, extended by `typemap`
+    which maps types to functions returning text) and None makes the element
+    xsi:nil.  The factory for each tag is made once and cached.
+
+    >>> from rinse.util import ElementMaker, printxml
+    >>> import datetime
+    >>> import lxml.usedoctest
+    >>> E = ElementMaker(namespace='urn:x', nsmap={'x': 'urn:x'})
+    >>> printxml(E.order(
+    ...     E.id(42), E.paid(True), E.date(datetime.date(2015, 1, 2)),
+    ...     E.note(None), {'version': 2},
+    ... ))
+    <x:order xmlns:x="urn:x" version="2">
+      <x:id>42</x:id>
+      <x:paid>true</x:paid>
+      <x:date>2015-01-02</x:date>
+      <x:note xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:nil="true"/>
+    </x:order>
+    """
+
+    def __init__(self, typemap=None, namespace=None, nsmap=None,
+                 makeelement=None):
+        """Set base attributes (as lxml.builder.ElementMaker)."""
+        self._namespace = namespace
+        self._nsmap = nsmap
+        self._makeelement = makeelement or etree.Element
+        self._converters = dict(TEXT_CONVERTERS)
+        self._converters.update(typemap or {})
+
+    def __getattr__(self, tag):
+        """Return (and cache) the factory for elements named `tag`."""
+        if tag.startswith('__'):
+            raise AttributeError(tag)
+        factory = self.__dict__[tag] = self.factory(tag)
+        return factory
+
+    def __call__(self, tag, *children, **attrib):
+        """Make element named `tag` (which may be a {namespace}tag)."""
+        return self.factory(tag)(*children, **attrib)
+
+    def converter(self, cls):
+        """Return function converting instances of `cls` to text."""
+        for base in cls.__mro__:
+            if base in self._converters:
+                convert = self._converters[cls] = self._converters[base]
+                return convert
+        raise TypeError('Bad argument type: {!r}'.format(cls))
+
+    def factory(self, tag):
+        """Return function making elements named `tag`."""
+        if self._namespace is not None and tag[:1] != '{':
+            tag = '{%s}%s' % (self._namespace, tag)
+        makeelement = self._makeelement
+        nsmap = self._nsmap
+        converters = self._converters
+        converter = self.converter
+        element_type = etree._Element  # pylint: disable=protected-access
+
+        def text(value):
+            """Convert value to text."""
+            try:
+                convert = converters[type(value)]
+            except KeyError:
+                convert = converter(type(value))
+            return value if convert is None else convert(value)
+
+        def make(*children, **attrib):
+            """Make element with children and attributes."""
+            element = makeelement(tag, nsmap=nsmap)
+            for name, value in attrib.items():
+                element.set(name, text(value))
+            for child in children:
+                try:
+                    convert = converters[type(child)]
+                except KeyError:
+                    if isinstance(child, element_type):
+                        element.append(child)
+                        continue
+                    if child is None:
+                        element.set(XSI_NIL, 'true')
+                        continue
+                    if isinstance(child, dict):
+                        for name, value in child.items():
+                            element.set(name, text(value))
+                        continue
+                    convert = converter(type(child))
+                value = child if convert is None else convert(child)
+                if len(element):
+                    last = element[-1]
+                    last.tail = (last.tail or '') + value
+                else:
+                    element.text = (element.text or '') + value
+            return element
+
+        make.__name__ = str(etree.QName(tag).localname)
+        return make
 
 
 RinseResponse = collections.namedtuple('RinseResponse', ['response', 'doc'])
 
 
-class SchemaCache(collections.defaultdict):
+class SchemaCache(object):
+
+    """Thread-safe LRU cache of lxml.etree.XMLSchema instances.
+
+    Schemas are keyed by XSD (basename, path or URL) along with any xpath and
+    namespaces given to get().  When several threads miss on the same key at
+    once only the first compiles the schema, the others wait for its result.
+
+    At most `maxsize` schemas are kept (unbounded if None), evicting the least
+    recently used.  The `stats` counter records `hits`, `misses`, `compiles`,
+    `evictions` and total `compile_time` (seconds).
+    """
 
-    """Cache of lxml.etree.XMLSchema instances, keyed by XSD basename."""
+    # rinse.cache.DiskCache used to fetch XSD from URLs
+    disk_cache = None
+
+    def __init__(self, maxsize=128):
+        """SchemaCache init."""
+        self.maxsize = maxsize
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._schemas = collections.OrderedDict()
+        self._pending = {}
+
+    def __getitem__(self, xsd):
+        """Dict style access to schemas by XSD."""
+        return self.get(xsd)
+
+    def __contains__(self, xsd):
+        """Return True if schema for XSD is cached."""
+        return (xsd, None, ()) in self._schemas
+
+    def __len__(self):
+        """Return number of cached schemas."""
+        return len(self._schemas)
+
+    def clear(self):
+        """Remove all cached schemas."""
+        with self._lock:
+            self._schemas.clear()
 
     def get(self, xsd, xpath=None, namespaces=None):
+        """Return XMLSchema instance as specified, compiling on demand."""
+        key = (xsd, xpath, tuple(sorted((namespaces or {}).items())))
+        with self._lock:
+            try:
+                schema = self._schemas.pop(key)
+            except KeyError:
+                self.stats['misses'] += 1
+                future = self._pending.get(key)
+                compiling = future is None
+                if compiling:
+                    future = self._pending[key] = concurrent.futures.Future()
+            else:
+                # re-insert as most recently used
+                self._schemas[key] = schema
+                self.stats['hits'] += 1
+                return schema
+        if not compiling:
+            # another thread is compiling the schema
+            return future.result()
+
+        start = timer()
+        try:
+            schema = self.compile(xsd, xpath, namespaces)
+        except Exception as err:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(err)
+            raise
+        with self._lock:
+            self.stats['compiles'] += 1
+            self.stats['compile_time'] += timer() - start
+            self._schemas[key] = schema
+            del self._pending[key]
+            while self.maxsize is not None and \
+                    len(self._schemas) > self.maxsize:
+                self._schemas.popitem(last=False)
+                self.stats['evictions'] += 1
+        future.set_result(schema)
+        return schema
+
+    def compile(self, xsd, xpath=None, namespaces=None):
         """Generate XMLSchema instances as specified."""
         if xsd.startswith('/'):
             pass  # absolute path
@@ -81,15 +398,13 @@ class SchemaCache(collections.defaultdict):
         else:
             # assume XSD is in res/ subdir of rinse project.
             xsd = os.path.join(RINSE_DIR, 'res', xsd)
-        doc = safe_parse_path(xsd)
+        if self.disk_cache is not None and '://' in xsd:
+            doc = safe_parse_string(self.disk_cache.fetch(xsd), base_url=xsd)
+        else:
+            doc = safe_parse_path(xsd)
         if xpath:
             doc = doc.xpath(xpath, namespaces=namespaces)[0]
-        self[xsd] = schema = etree.XMLSchema(doc)
-        return schema
-
-    def __missing__(self, xsd):
-        """Generate XMLSchema instances on demand."""
-        return self.get(xsd)
+        return etree.XMLSchema(doc)
 
 
 SCHEMA = SchemaCache()
@@ -1,4 +1,9 @@
 """WSA (Addressing) support for rinse SOAP client."""
+import copy
+import threading
+import uuid
+
+from rinse.util import ElementMaker
 
 NS_WSA = 'http://www.w3.org/2005/08/addressing'
 URI_ANONYMOUS = \
@@ -93,3 +98,84 @@ def append_wsa_headers(
         ]
         if header is not None
     )
+
+
+class WsaHeaders(object):
+
+    """Header provider adding WSA headers to each message of a SoapClient.
+
+    The headers other than wsa:MessageID are built once for each (To,
+    Action) pair as a template and copied for each message.  The To address
+    defaults to the client URL and the Action to the SOAPAction of the
+    call.  A new wsa:MessageID is added unless `message_id` is False.
+
+    >>> from rinse.wsa import WsaHeaders
+    >>> import lxml.usedoctest
+    >>> from rinse.message import SoapMessage
+    >>> from rinse.util import printxml
+    >>> provider = WsaHeaders(message_id=False)
+    >>> msg = SoapMessage()
+    >>> msg.headers.extend(provider.headers('http://example.com/', 'urn:get'))
+    >>> printxml(msg.etree())
+    <soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+      <soapenv:Header>
+        <wsa:To xmlns:wsa="http://www.w3.org/2005/08/addressing">http://example.com/</wsa:To>
+        <wsa:Action xmlns:wsa="http://www.w3.org/2005/08/addressing">urn:get</wsa:Action>
+      </soapenv:Header>
+      <soapenv:Body/>
+    </soapenv:Envelope>
+    """
+
+    def __init__(self, to=None, action=None, reply_to=None,
+                 from_endpoint=None, fault_to=None, message_id=True):
+        """WsaHeaders init."""
+        if (reply_to or fault_to) and not message_id:
+            raise ValueError(
+                'wsa:ReplyTo or wsa:FaultTo set so wsa:MessageID MUST be '
+                'present.',
+            )
+        self.to = to
+        self.action = action
+        self.reply_to = reply_to
+        self.from_endpoint = from_endpoint
+        self.fault_to = fault_to
+        self.message_id = message_id
+        self._wsa = ElementMaker(namespace=NS_WSA, nsmap={'wsa': NS_WSA})
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def template(self, to, action):
+        """Return (cached) list of headers other than wsa:MessageID."""
+        try:
+            return self._templates[to, action]
+        except KeyError:
+            pass
+        wsa = self._wsa
+        headers = [
+            header
+            for header
+            in [
+                wsa.To(to),
+                wsa.Action(action),
+                wsa.From(self.from_endpoint) if self.from_endpoint else None,
+                wsa.ReplyTo(wsa.Address(self.reply_to))
+                if self.reply_to else None,
+                wsa.FaultTo(wsa.Address(self.fault_to))
+                if self.fault_to else None,
+            ]
+            if header is not None
+        ]
+        with self._lock:
+            return self._templates.setdefault((to, action), headers)
+
+    def headers(self, url, action):
+        """Return list of new header elements for a message."""
+        headers = [
+            copy.deepcopy(header)
+            for header in self.template(self.to or url, self.action or action)
+        ]
+        if self.message_id:
+            headers.insert(0, self._wsa.MessageID(
+                'uuid:{}'.format(uuid.uuid4()),
+            ))
+        return headers
@@ -1,17 +1,70 @@
 """Rinse SOAP library: module providing WSDL functions."""
+import collections
+
 from lxml import etree
+from rinse import NS_SOAPENV
+from rinse.message import SoapMessage
 from rinse.util import (
-    safe_parse_path, safe_parse_url, element_as_tree, cached_property,
+    cached_property, resolve_qname, safe_parse_path, safe_parse_url,
 )
-from rinse.xsd import XSDValidator, NS_XSD
+from rinse.xsd import XSDValidator, NS_XSD, link_schemas
 
 NS_WSDL = 'http://schemas.xmlsoap.org/wsdl/'
+NS_WSDL_SOAP = 'http://schemas.xmlsoap.org/wsdl/soap/'
+NS_WSDL_SOAP12 = 'http://schemas.xmlsoap.org/wsdl/soap12/'
+SOAPENV_BODY = '{%s}Body' % NS_SOAPENV
 NS_MAP = {
     'wsdl': NS_WSDL,
     'xsd': NS_XSD,
+    'soap': NS_WSDL_SOAP,
+    'soap12': NS_WSDL_SOAP12,
 }
 
 
+def body_elements(soapmsg):
+    """Return a sequence of the elements in the SOAP Body of soapmsg.
+
+    Bodies of SoapMessages are used as they are, others (such as
+    BoundMessages) are taken from the Body of the parsed envelope.  Bodies
+    given as iterators can't be validated without consuming them, so they
+    raise ValueError.
+    """
+    try:
+        body = soapmsg.body
+    except AttributeError:
+        return list(soapmsg.etree().find(SOAPENV_BODY))
+    if body is None:
+        return []
+    if etree.iselement(body):
+        return [body]
+    if isinstance(body, (list, tuple)):
+        return body
+    raise ValueError('Message bodies given as iterators can not be validated.')
+
+
+class Operation(collections.namedtuple(
+        'Operation', ['name', 'soap_action', 'input', 'output', 'endpoint'],
+)):
+
+    """WSDL operation.
+
+    The `input` and `output` fields are the QName (as text) of the message
+    body elements, and `endpoint` is the address of the service port.
+    """
+
+    __slots__ = ()
+
+    def message(self, *children, **attrib):
+        """Make a SoapMessage with body element for the operation input."""
+        msg = SoapMessage()
+        input_qname = etree.QName(self.input)
+        elementmaker = msg.elementmaker('tns', input_qname.namespace)
+        msg.body = getattr(elementmaker, input_qname.localname)(
+            *children, **attrib
+        )
+        return msg
+
+
 class WSDL(object):
 
     """WSDL object."""
@@ -20,36 +73,129 @@ class WSDL(object):
     _xsd_validator = None
 
     @classmethod
-    def from_file(cls, wsdl_path):
-        """Make a WSDL instance from a file path."""
+    def from_file(cls, wsdl_path, cache=None):
+        """Make a WSDL instance from a file path.
+
+        If `cache` (a rinse.cache.DiskCache) is given it is used to avoid
+        parsing the WSDL each time.
+        """
+        if cache is not None:
+            return cache.wsdl(wsdl_path)
         return cls(safe_parse_path(wsdl_path))
 
     @classmethod
-    def from_url(cls, wsdl_path):
-        """Make a WSDL instance from a URL."""
+    def from_url(cls, wsdl_path, cache=None):
+        """Make a WSDL instance from a URL.
+
+        If `cache` (a rinse.cache.DiskCache) is given it is used to avoid
+        fetching and parsing the WSDL each time.
+        """
+        if cache is not None:
+            return cache.wsdl(wsdl_path)
         return cls(safe_parse_url(wsdl_path))
 
     def __init__(self, wsdl_root):
         """WSDL init."""
         self.root = wsdl_root
 
+    @cached_property
+    def schemas(self):
+        """Return list of xsd:schema elements from wsdl:types."""
+        return self.root.xpath(
+            '/wsdl:definitions/wsdl:types/xsd:schema', namespaces=NS_MAP,
+        )
+
     @cached_property
     def schema(self):
         """Return schema element (used for XSD validation)."""
-        schema_el = self.root.xpath(
-            '/wsdl:definitions/wsdl:types/xsd:schema', namespaces=NS_MAP,
-        )[0]
-        return element_as_tree(schema_el)
+        return link_schemas(self.schemas)
+
+    @cached_property
+    def operations(self):
+        """Return dict of Operation instances by operation name.
+
+        Operations are taken from the first SOAP port of each service which
+        binds them.  SOAP 1.2 ports are skipped, as messages are SOAP 1.1
+        envelopes.
+        """
+        root = self.root
+        target_ns = root.xpath('/wsdl:definitions/@targetNamespace',
+                               namespaces=NS_MAP)
+        target_ns = target_ns[0] if target_ns else None
+
+        def by_name(path):
+            """Index elements matching path by their QName."""
+            return {
+                etree.QName(target_ns, element.get('name')): element
+                for element in root.xpath(path, namespaces=NS_MAP)
+            }
+
+        messages = by_name('/wsdl:definitions/wsdl:message')
+        port_types = by_name('/wsdl:definitions/wsdl:portType')
+        bindings = by_name('/wsdl:definitions/wsdl:binding')
+
+        def body_qname(port_op, binding_op, direction):
+            """Return QName (text) of input or output body element."""
+            io_el = port_op.find('wsdl:' + direction, NS_MAP)
+            if io_el is None:
+                return None
+            message = messages[resolve_qname(io_el, io_el.get('message'))]
+            part = message.find('wsdl:part', NS_MAP)
+            if part is not None and part.get('element'):
+                return resolve_qname(part, part.get('element')).text
+            # RPC style - body element is named after the operation
+            namespace = binding_op.xpath(
+                'wsdl:{0}/soap:body/@namespace'.format(direction),
+                namespaces=NS_MAP,
+            )
+            return etree.QName(
+                namespace[0] if namespace else target_ns,
+                port_op.get('name') + ('' if direction == 'input' else
+                                       'Response'),
+            ).text
+
+        operations = {}
+        for port in root.xpath(
+                '/wsdl:definitions/wsdl:service/wsdl:port', namespaces=NS_MAP,
+        ):
+            address = port.xpath('soap:address/@location', namespaces=NS_MAP)
+            if not address:
+                continue  # not a SOAP 1.1 port
+            binding = bindings[resolve_qname(port, port.get('binding'))]
+            port_type = port_types[resolve_qname(binding, binding.get('type'))]
+            for binding_op in binding.iterfind('wsdl:operation', NS_MAP):
+                name = binding_op.get('name')
+                if name in operations:
+                    continue
+                port_op = port_type.xpath(
+                    'wsdl:operation[@name=$name]', namespaces=NS_MAP,
+                    name=name,
+                )[0]
+                soap_action = binding_op.xpath(
+                    'soap:operation/@soapAction', namespaces=NS_MAP,
+                )
+                operations[name] = Operation(
+                    name=name,
+                    soap_action=soap_action[0] if soap_action else '',
+                    input=body_qname(port_op, binding_op, 'input'),
+                    output=body_qname(port_op, binding_op, 'output'),
+                    endpoint=address[0],
+                )
+        return operations
 
     @cached_property
     def xsd_validator(self):
         """Extract XML Schema Definition (XSD) element tree."""
-        return XSDValidator(self.schema)
+        return XSDValidator(self.schema, self.schemas)
 
     def is_valid(self, soapmsg):
         """Return True if SOAP message body validates against WSDL schema."""
-        return self.xsd_validator.is_valid(soapmsg.body)
+        return all(
+            self.xsd_validator.is_valid(element)
+            for element in body_elements(soapmsg)
+        )
 
     def validate(self, soapmsg):
         """Raise exception if SOAP message body is invalid."""
-        return self.xsd_validator.validate(soapmsg.body)
+        for element in body_elements(soapmsg):
+            self.xsd_validator.validate(element)
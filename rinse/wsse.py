@@ -1,7 +1,21 @@
 """SOAP client."""
+import base64
+import copy
+import hashlib
+import os
+import threading
+import time
+
+from rinse.util import ElementMaker
 
 NS_WSSE = 'http://docs.oasis-open.org/wss/2004/01/' \
     'oasis-200401-wss-wssecurity-secext-1.0.xsd'
+NS_WSU = 'http://docs.oasis-open.org/wss/2004/01/' \
+    'oasis-200401-wss-wssecurity-utility-1.0.xsd'
+PASSWORD_DIGEST = 'http://docs.oasis-open.org/wss/2004/01/' \
+    'oasis-200401-wss-username-token-profile-1.0#PasswordDigest'
+BASE64_BINARY = 'http://docs.oasis-open.org/wss/2004/01/' \
+    'oasis-200401-wss-soap-message-security-1.0#Base64Binary'
 
 
 def append_wsse_headers(msg, username, password):
@@ -47,3 +61,96 @@ def append_wsse_headers(msg, username, password):
             ),
         ),
     )
+
+
+def timestamp(seconds):
+    """Format seconds since the epoch as a UTC xsd:dateTime."""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+def password_digest(nonce, created, password):
+    """Return PasswordDigest (text) of nonce (bytes), created and password.
+
+    >>> from rinse.wsse import password_digest
+    >>> password_digest(b'nonce', '2015-01-02T10:30:00Z', 'secret')
+    'qBnmHf7cxIeb+tKbiXlOQQy+P/0='
+    """
+    return base64.b64encode(hashlib.sha1(
+        nonce + created.encode('utf-8') + password.encode('utf-8'),
+    ).digest()).decode('ascii')
+
+
+class WsseHeaders(object):
+
+    """Header provider adding WSSE headers to each message of a SoapClient.
+
+    The wsse:Security header is built once and copied for each message.  If
+    `digest` is True the password is sent as a PasswordDigest of a random
+    nonce and the creation time, along with a wsu:Timestamp expiring after
+    `ttl` seconds.  The token is reused until it is about to expire (within
+    `margin` times `ttl` seconds, so it doesn't expire on the way to the
+    server), so set `ttl` to 0 for services that reject reused nonces.
+    """
+
+    def __init__(self, username, password, digest=False, ttl=300,
+                 margin=0.2, clock=time.time):
+        """WsseHeaders init."""
+        self.username = username
+        self.password = password
+        self.digest = digest
+        self.ttl = ttl
+        self.margin = margin
+        self.clock = clock
+        self._wsse = ElementMaker(namespace=NS_WSSE, nsmap={'wsse': NS_WSSE})
+        self._wsu = ElementMaker(
+            namespace=NS_WSU, nsmap={'wsse': NS_WSSE, 'wsu': NS_WSU},
+        )
+        self._token = None
+        self._expires = None
+        self._lock = threading.Lock()
+
+    def token(self):
+        """Return the (cached) wsse:Security element, renewed near expiry."""
+        if not self.digest:
+            if self._token is None:
+                self._token = self._make_token()
+            return self._token
+        with self._lock:
+            now = self.clock()
+            if self._token is None or \
+                    now >= self._expires - self.margin * self.ttl:
+                self._expires = now + self.ttl
+                self._token = self._make_token(now)
+            return self._token
+
+    def _make_token(self, now=None):
+        """Build a wsse:Security element (a digest token if `now` given)."""
+        wsse, wsu = self._wsse, self._wsu
+        if now is None:
+            return wsse.Security(wsse.UsernameToken(
+                wsse.Username(self.username),
+                wsse.Password(self.password),
+            ))
+        nonce = os.urandom(16)
+        created = timestamp(now)
+        return wsse.Security(
+            wsu.Timestamp(
+                wsu.Created(created), wsu.Expires(timestamp(self._expires)),
+            ),
+            wsse.UsernameToken(
+                wsse.Username(self.username),
+                wsse.Password(
+                    password_digest(nonce, created, self.password),
+                    Type=PASSWORD_DIGEST,
+                ),
+                wsse.Nonce(
+                    base64.b64encode(nonce).decode('ascii'),
+                    EncodingType=BASE64_BINARY,
+                ),
+                wsu.Created(created),
+            ),
+        )
+
+    def headers(self, url, action):
+        """Return list of new header elements for a message."""
+        return [copy.deepcopy(self.token())]
@@ -1,28 +1,300 @@
 """Rinse SOAP library: XML Schema Definition (XSD) functions."""
+import copy
+import threading
+
 from lxml import etree
-from rinse.util import element_as_tree
+from rinse.util import cached_property, element_as_tree, resolve_qname
 
 NS_XSD = 'http://www.w3.org/2001/XMLSchema'
 NS = {
     'xsd': NS_XSD,
 }
 
+# location given to schemas imported from the same document (see link_schemas)
+SCHEMA_LOCATION = 'rinse-schema:{}'
+
+# global components by their symbol space, and the attributes that refer to
+# them (by element tag)
+SYMBOL_SPACES = {
+    'element': 'element',
+    'attribute': 'attribute',
+    'complexType': 'type',
+    'simpleType': 'type',
+    'group': 'group',
+    'attributeGroup': 'attributeGroup',
+}
+REFERENCES = [
+    ('type', None, 'type'),
+    ('base', None, 'type'),
+    ('itemType', None, 'type'),
+    ('substitutionGroup', None, 'element'),
+    ('ref', 'element', 'element'),
+    ('ref', 'attribute', 'attribute'),
+    ('ref', 'group', 'group'),
+    ('ref', 'attributeGroup', 'attributeGroup'),
+]
+
+
+class SchemaResolver(etree.Resolver):
+
+    """Resolve imports of schemas extracted from the same document."""
+
+    def __init__(self):
+        """SchemaResolver init."""
+        super(SchemaResolver, self).__init__()
+        self.schemas = {}
+
+    def resolve(self, url, pubid, context):
+        """Return schema for url if it is one of ours."""
+        try:
+            schema = self.schemas[url]
+        except KeyError:
+            return None
+        return self.resolve_string(
+            etree.tostring(schema), context, base_url=url,
+        )
+
+
+def link_schemas(schemas, main=None):
+    """Return a schema root element for xsd:schema elements of one document.
+
+    Each schema is copied (without serializing) to be the root of its own
+    tree.  If there is more than one schema, imports of namespaces defined by
+    sibling schemas are pointed at those siblings and a new schema importing
+    every namespace is returned so that all global declarations are
+    available for validation.  Only the first schema for each namespace is
+    used.  If `main` is given, it is returned in place of the new schema and
+    is used instead of `schemas` for its own namespace.
+
+    >>> from lxml import etree
+    >>> from rinse.xsd import link_schemas, XSDValidator
+    >>> doc = etree.fromstring(
+    ...     '<types xmlns:xsd="http://www.w3.org/2001/XMLSchema"'
+    ...     ' xmlns:a="urn:a" xmlns:b="urn:b">'
+    ...     '<xsd:schema targetNamespace="urn:a">'
+    ...     '<xsd:import namespace="urn:b"/>'
+    ...     '<xsd:element name="a" type="b:number"/>'
+    ...     '</xsd:schema>'
+    ...     '<xsd:schema targetNamespace="urn:b">'
+    ...     '<xsd:simpleType name="number">'
+    ...     '<xsd:restriction base="xsd:int"/>'
+    ...     '</xsd:simpleType>'
+    ...     '</xsd:schema>'
+    ...     '</types>'
+    ... )
+    >>> validator = XSDValidator(link_schemas(doc))
+    >>> validator.is_valid(etree.fromstring('<a xmlns="urn:a">1</a>'))
+    True
+    >>> validator.is_valid(etree.fromstring('<a xmlns="urn:a">x</a>'))
+    False
+    """
+    schemas = list(schemas)
+    if main is None and len(schemas) == 1:
+        return element_as_tree(schemas[0])
+    parser = etree.XMLParser(resolve_entities=False, no_network=True)
+    resolver = SchemaResolver()
+    parser.resolvers.add(resolver)
+    locations = {}
+    if main is not None:
+        main = element_as_tree(main, parser)
+        schemas.insert(0, main)
+    for schema in schemas:
+        namespace = schema.get('targetNamespace', '')
+        if namespace in locations:
+            continue
+        locations[namespace] = location = SCHEMA_LOCATION.format(
+            len(locations),
+        )
+        resolver.schemas[location] = element_as_tree(schema, parser)
+    for schema in resolver.schemas.values():
+        for import_el in schema.iterfind('xsd:import', NS):
+            namespace = import_el.get('namespace', '')
+            if import_el.get('schemaLocation') is None and \
+                    namespace in locations:
+                import_el.set('schemaLocation', locations[namespace])
+
+    if main is not None:
+        return resolver.schemas[SCHEMA_LOCATION.format(0)]
+    root = parser.makeelement(etree.QName(NS_XSD, 'schema'), nsmap=NS)
+    for namespace, location in sorted(locations.items()):
+        if namespace:
+            etree.SubElement(
+                root, etree.QName(NS_XSD, 'import'),
+                namespace=namespace, schemaLocation=location,
+            )
+        else:
+            etree.SubElement(
+                root, etree.QName(NS_XSD, 'include'), schemaLocation=location,
+            )
+    return root
+
+
+class SchemaComponents(object):
+
+    """Index of the global components declared by a schema.
+
+    Used to make copies of the schema with only the components needed for a
+    given global element (see prune).
+    """
+
+    def __init__(self, schema):
+        """Index global components of schema by (symbol space, QName)."""
+        self.schema = schema
+        self.namespace = schema.get('targetNamespace')
+        # validating against a pruned schema could give a different result
+        # than the whole schema with wildcards, includes and redefinitions
+        self.prunable = not schema.xpath(
+            './/xsd:any[not(@processContents="skip")]'
+            '|.//xsd:anyAttribute[not(@processContents="skip")]'
+            '|xsd:include|xsd:redefine|xsd:override',
+            namespaces=NS,
+        )
+        self.components = {}
+        self.imports = []
+        for position, child in enumerate(schema.iterchildren(etree.Element)):
+            localname = etree.QName(child).localname
+            if localname == 'import':
+                self.imports.append(child)
+            elif localname in SYMBOL_SPACES:
+                key = (
+                    SYMBOL_SPACES[localname],
+                    etree.QName(self.namespace, child.get('name')),
+                )
+                self.components[key] = (position, child)
+
+    @staticmethod
+    def references(component):
+        """Yield (symbol space, QName) of components referred to."""
+        for element in component.iter(etree.Element):
+            localname = etree.QName(element).localname
+            for attr, tag, space in REFERENCES:
+                value = element.get(attr)
+                if value is not None and tag in (None, localname):
+                    yield space, resolve_qname(element, value)
+            for value in (element.get('memberTypes') or '').split():
+                yield 'type', resolve_qname(element, value)
+
+    def prune(self, name):
+        """Return copy of schema with only components needed for `name`.
+
+        The copy includes the global element declaration for `name` (a
+        QName) and all components of the schema it refers to, directly or
+        indirectly, along with elements that may substitute for any of those
+        elements.  Imports are kept as they are.
+
+        Returns None if the element isn't declared by the schema, or if the
+        schema can't be pruned.
+        """
+        key = ('element', etree.QName(name))
+        if not self.prunable or key not in self.components:
+            return None
+        needed = set()
+        pending = [key]
+        while pending:
+            while pending:
+                key = pending.pop()
+                if key in needed or key not in self.components:
+                    continue  # already included, or imported or built-in
+                needed.add(key)
+                pending.extend(self.references(self.components[key][1]))
+            # include elements which may substitute for needed elements
+            for key, (_, component) in self.components.items():
+                head = component.get('substitutionGroup')
+                if key not in needed and head is not None and \
+                        ('element', resolve_qname(component, head)) in needed:
+                    pending.append(key)
+
+        pruned = etree.Element(
+            self.schema.tag,
+            attrib=dict(self.schema.attrib),
+            nsmap=self.schema.nsmap,
+        )
+        pruned.extend(copy.deepcopy(child) for child in self.imports)
+        pruned.extend(
+            copy.deepcopy(child)
+            for _, child in sorted(self.components[key] for key in needed)
+        )
+        return pruned
+
+
+def prune_schema(schema, name):
+    """Return copy of schema with only components needed for element `name`.
+
+    See SchemaComponents.prune.
+    """
+    return SchemaComponents(schema).prune(name)
+
 
 class XSDValidator(object):
 
-    """XSD Schema Validation."""
+    """XSD Schema Validation.
+
+    Documents are first validated against a schema compiled for just the
+    declaration of their root element (see prune_schema), which is much
+    cheaper to compile for large schemas.  These are compiled on demand and
+    cached.  The whole schema is only compiled and used where a document is
+    invalid according to the pruned schema (to confirm the result, as types
+    may be substituted) or where the schema can't be pruned.  The `schemas`
+    argument gives the xsd:schema elements that `schema_root` was linked from
+    (see link_schemas), if not just `schema_root`.
+    """
 
     _parser = None
 
-    def __init__(self, schema_root):
+    def __init__(self, schema_root, schemas=None):
         """XSDValidator init."""
         self.root = element_as_tree(schema_root)
-        self.schema = etree.XMLSchema(self.root)
+        self.schemas = schemas or [self.root]
+        self._element_schemas = {}
+        self._lock = threading.Lock()
+
+    @cached_property
+    def schema(self):
+        """Instance of lxml.etree.XMLSchema for the whole schema."""
+        return etree.XMLSchema(self.root)
+
+    def element_schema(self, name):
+        """Return XMLSchema for global element `name`, or None."""
+        name = etree.QName(name).text
+        try:
+            return self._element_schemas[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._element_schemas:
+                self._element_schemas[name] = self._compile_element(name)
+        return self._element_schemas[name]
+
+    @cached_property
+    def components(self):
+        """Return dict of SchemaComponents by target namespace."""
+        components = {}
+        for schema in self.schemas:
+            components.setdefault(
+                schema.get('targetNamespace'), SchemaComponents(schema),
+            )
+        return components
+
+    def _compile_element(self, name):
+        """Compile XMLSchema for global element `name`, or return None."""
+        try:
+            components = self.components[etree.QName(name).namespace]
+        except KeyError:
+            return None
+        pruned = components.prune(name)
+        if pruned is None:
+            return None
+        return etree.XMLSchema(link_schemas(self.schemas, pruned))
 
     def validate(self, doc):
         """Validate doc against schema, raises exception if doc is invalid."""
-        self.schema.assertValid(doc)
+        if not self.is_valid(doc):
+            self.schema.assertValid(doc)
 
     def is_valid(self, doc):
         """Validate doc against schema, return True if doc is valid."""
+        root = doc.getroot() if isinstance(doc, etree._ElementTree) else doc
+        element_schema = self.element_schema(root.tag)
+        if element_schema is not None and element_schema.validate(doc):
+            return True
         return self.schema.validate(doc)
@@ -21,14 +21,14 @@ CLASSIFIERS = [
 
     # Generally, we support the following.
     "Programming Language :: Python",
-    "Programming Language :: Python :: 2",
     "Programming Language :: Python :: 3",
     "Framework :: Django",
 
     # Specifically, we support the following releases.
-    "Programming Language :: Python :: 2.7",
-    "Programming Language :: Python :: 3.3",
-    "Programming Language :: Python :: 3.4",
+    "Programming Language :: Python :: 3.5",
+    "Programming Language :: Python :: 3.6",
+    "Programming Language :: Python :: 3.7",
+    "Programming Language :: Python :: 3.8",
     "Framework :: Django :: 1.7",
     "Framework :: Django :: 1.8",
 ]
@@ -42,15 +42,20 @@ setup(
     author_email='tyson@clugg.net',
     url='https://rinse.readthedocs.org/en/latest/',
     license='MIT',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     include_package_data=True,
     zip_safe=False,
     test_suite='rinse.tests',
+    python_requires='>=3.5',
     install_requires=[
         'defusedxml',
         'lxml',
         'requests',
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'numpy': ['numpy'],
+    },
     tests_require=['mock', 'six'],
     classifiers=CLASSIFIERS,
 )